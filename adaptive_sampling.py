@@ -0,0 +1,208 @@
+# adaptive_sampling.py
+"""
+Adaptive evaluation: estimate a combination's accuracy and ESI from a sample of its dataset instead of
+every item, and a screening pass that ranks many worker models cheaply before the full run.
+
+Items are taken in a seeded stratified order: each scenario_code's items are shuffled, and the strata
+are interleaved so that every prefix of the order holds them in proportion to their sizes (with one
+item of every scenario_code first). Every combination of a dataset uses the same order, so models are
+compared on the same items. Accuracy and ESI are estimated with the stratified mean and its normal
+confidence interval (with the finite-population correction, so a fully evaluated stratum adds no
+uncertainty); a scenario_code with a single scored item borrows the variance of all scored items.
+
+With SAMPLING_MODE "adaptive" a combination stops submitting items once it has ADAPTIVE_MIN_ITEMS
+scored items and both intervals are at most ADAPTIVE_ACCURACY_CI_WIDTH / ADAPTIVE_ESI_CI_WIDTH points
+wide; the items already in flight still finish. Screening evaluates the first SCREENING_ITEMS items of
+the order for every worker model and keeps the SCREENING_FINALISTS models with the highest mean ESI.
+"""
+import json
+import math
+import os
+import random
+import statistics
+from typing import Dict, Any, List, Optional, Tuple
+from config import APP_CONFIG
+from dataset_index import DatasetIndex, compile_dataset_index, dataset_index_path
+
+def stratum_key(scenario_code: Any) -> str:
+    return json.dumps(scenario_code, ensure_ascii=False)
+
+def stratified_order(scenario_item_ids: Dict[str, List[int]], seed: int) -> List[int]:
+    """Item ids in a seeded random order whose every prefix holds the strata in proportion to their sizes."""
+    rng = random.Random(seed)
+    keyed_ids = []
+    for key in sorted(scenario_item_ids):
+        item_ids = list(scenario_item_ids[key])
+        rng.shuffle(item_ids)
+        keyed_ids.extend((position / len(item_ids), rng.random(), item_id) for position, item_id in enumerate(item_ids))
+    keyed_ids.sort()
+    return [item_id for _, _, item_id in keyed_ids]
+
+class StratifiedSample:
+    """One dataset's items in stratified order, read through its compiled index; shared by the dataset's combinations."""
+    def __init__(self, index: DatasetIndex, seed: int):
+        self.index = index
+        scenario_item_ids = {stratum_key(scenario_code): index.ids_for_scenario(scenario_code) for scenario_code in index.scenario_codes}
+        self.stratum_sizes = {key: len(item_ids) for key, item_ids in scenario_item_ids.items()}
+        self.item_ids = stratified_order(scenario_item_ids, seed)
+
+    def open_cursor(self, limit: Optional[int] = None) -> "SampleCursor":
+        return SampleCursor(self.index, self.item_ids[:limit] if limit is not None else self.item_ids)
+
+class SampleCursor:
+    """A combination's pass over a StratifiedSample (or its first `limit` items); iterate with `async for` like a DatasetCursor."""
+    def __init__(self, index: DatasetIndex, item_ids: List[int]):
+        self.index = index
+        self.item_ids = item_ids
+        self._position = 0
+
+    @property
+    def total_items(self) -> int:
+        return len(self.item_ids)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._position >= len(self.item_ids): raise StopAsyncIteration
+        self._position += 1
+        return self.index.get(self.item_ids[self._position - 1])
+
+    async def close(self):
+        self._position = len(self.item_ids)
+
+def load_stratified_sample(dataset_short_name: str, source_path: str, index: Optional[DatasetIndex]) -> StratifiedSample:
+    """The dataset's stratified sample; items are read out of file order, so a missing index is compiled first."""
+    if index is None:
+        index_path = dataset_index_path(dataset_short_name)
+        print(f"INFO: Sampled evaluation reads items out of order; compiling the dataset index for '{dataset_short_name}' to {index_path}")
+        compile_dataset_index(source_path, index_path)
+        index = DatasetIndex(index_path)
+    return StratifiedSample(index, APP_CONFIG.SAMPLING_SEED)
+
+class _RunningStratum:
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self):
+        self.count, self.mean, self.m2 = 0, 0.0, 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def variance(self) -> Optional[float]:
+        return self.m2 / (self.count - 1) if self.count > 1 else None
+
+class StratifiedEstimate:
+    """Running stratified mean of one score and its standard error."""
+    def __init__(self, stratum_sizes: Dict[str, int]):
+        self.stratum_sizes = stratum_sizes
+        self.strata: Dict[str, _RunningStratum] = {}
+        self.pooled = _RunningStratum()
+
+    def add(self, key: str, value: float):
+        self.strata.setdefault(key, _RunningStratum()).add(value)
+        self.pooled.add(value)
+
+    def mean_and_standard_error(self) -> Optional[Tuple[float, float]]:
+        """None until two items are in. Strata without scored items are left out (their weight goes to the others)."""
+        pooled_variance = self.pooled.variance()
+        if pooled_variance is None: return None
+        # A stratum missing from the dataset's sizes (e.g. a journal entry from another dataset version) counts with its sample size.
+        population_sizes = {key: max(self.stratum_sizes.get(key, 0), stratum.count) for key, stratum in self.strata.items()}
+        population = sum(population_sizes.values())
+        mean, variance = 0.0, 0.0
+        for key, stratum in self.strata.items():
+            weight = population_sizes[key] / population
+            stratum_variance = stratum.variance()
+            if stratum_variance is None: stratum_variance = pooled_variance
+            mean += weight * stratum.mean
+            variance += weight ** 2 * stratum_variance / stratum.count * (1.0 - stratum.count / population_sizes[key])
+        return mean, math.sqrt(max(0.0, variance))
+
+def _interval(estimate: StratifiedEstimate, z_value: float) -> Optional[Dict[str, float]]:
+    mean_and_error = estimate.mean_and_standard_error()
+    if mean_and_error is None: return None
+    mean, standard_error = mean_and_error
+    return {"mean": round(mean, 3), "ci": [round(mean - z_value * standard_error, 3), round(mean + z_value * standard_error, 3)],
+            "ci_width": round(2 * z_value * standard_error, 3), "standard_error": round(standard_error, 4)}
+
+class SampleEstimates:
+    """
+    Accuracy and ESI estimates of one combination over the sampled items scored so far. With
+    `early_stop`, `stop_reason` is set once the stopping rule in the module docstring is met.
+    """
+    def __init__(self, stratum_sizes: Dict[str, int], sample_size: int, early_stop: bool):
+        self.sample_size = sample_size
+        self.early_stop = early_stop
+        self.accuracy = StratifiedEstimate(stratum_sizes)
+        self.esi = StratifiedEstimate(stratum_sizes)
+        self.z_value = statistics.NormalDist().inv_cdf((1.0 + APP_CONFIG.ADAPTIVE_CONFIDENCE) / 2.0)
+        self.items_scored = 0
+        self.stop_reason: Optional[str] = None
+
+    def add(self, item_result: Dict[str, Any]):
+        if item_result.get("status") != "COMPLETED": return
+        key = stratum_key(item_result.get("scenario_code", "N/A"))
+        self.accuracy.add(key, float(item_result.get("s_accuracy", 0.0)))
+        self.esi.add(key, float(item_result.get("esi_score", 0.0)))
+        self.items_scored += 1
+        if self.early_stop and self.stop_reason is None and self.items_scored >= APP_CONFIG.ADAPTIVE_MIN_ITEMS:
+            accuracy_interval, esi_interval = _interval(self.accuracy, self.z_value), _interval(self.esi, self.z_value)
+            if (accuracy_interval and esi_interval and accuracy_interval["ci_width"] <= APP_CONFIG.ADAPTIVE_ACCURACY_CI_WIDTH
+                    and esi_interval["ci_width"] <= APP_CONFIG.ADAPTIVE_ESI_CI_WIDTH):
+                self.stop_reason = (f"accuracy CI width {accuracy_interval['ci_width']:.2f} <= {APP_CONFIG.ADAPTIVE_ACCURACY_CI_WIDTH} and "
+                                    f"ESI CI width {esi_interval['ci_width']:.2f} <= {APP_CONFIG.ADAPTIVE_ESI_CI_WIDTH} after {self.items_scored} scored items")
+
+    def summary(self) -> Dict[str, Any]:
+        return {"mode": "adaptive" if self.early_stop else "sample", "sample_size": self.sample_size, "items_scored": self.items_scored,
+                "confidence": APP_CONFIG.ADAPTIVE_CONFIDENCE, "stopped_early": self.stop_reason is not None, "stop_reason": self.stop_reason,
+                "accuracy": _interval(self.accuracy, self.z_value), "esi": _interval(self.esi, self.z_value)}
+
+def rank_screening_results(screened: List[Tuple[str, SampleEstimates]]) -> Dict[str, Any]:
+    """
+    Ranks worker models by their mean screening ESI over their (dataset, prompt) combinations, given as
+    (worker_model_id, estimates) pairs, and picks the SCREENING_FINALISTS best.
+    """
+    z_value = statistics.NormalDist().inv_cdf((1.0 + APP_CONFIG.ADAPTIVE_CONFIDENCE) / 2.0)
+    estimates_by_model: Dict[str, List[SampleEstimates]] = {}
+    for worker_model_id, estimates in screened: estimates_by_model.setdefault(worker_model_id, []).append(estimates)
+    ranking = []
+    for worker_model_id, model_estimates in estimates_by_model.items():
+        esi_values = [estimates.esi.mean_and_standard_error() for estimates in model_estimates]
+        esi_values = [value for value in esi_values if value is not None]
+        accuracy_values = [estimates.accuracy.mean_and_standard_error() for estimates in model_estimates]
+        accuracy_values = [value for value in accuracy_values if value is not None]
+        row = {"worker_model_id": worker_model_id, "combinations": len(model_estimates),
+               "items_scored": sum(estimates.items_scored for estimates in model_estimates), "mean_esi": None, "esi_ci": None, "mean_accuracy": None}
+        if esi_values:
+            mean_esi = statistics.fmean(mean for mean, _ in esi_values)
+            standard_error = math.sqrt(sum(error ** 2 for _, error in esi_values)) / len(esi_values)
+            row.update(mean_esi=round(mean_esi, 3), esi_ci=[round(mean_esi - z_value * standard_error, 3), round(mean_esi + z_value * standard_error, 3)])
+        if accuracy_values: row["mean_accuracy"] = round(statistics.fmean(mean for mean, _ in accuracy_values), 3)
+        ranking.append(row)
+    # Models without a single scored combination rank last.
+    ranking.sort(key=lambda row: (row["mean_esi"] is None, -(row["mean_esi"] or 0.0)))
+    for rank, row in enumerate(ranking, start=1): row["rank"] = rank
+    finalists = [row["worker_model_id"] for row in ranking if row["mean_esi"] is not None][:max(1, APP_CONFIG.SCREENING_FINALISTS)]
+    return {"items_per_dataset": APP_CONFIG.SCREENING_ITEMS, "confidence": APP_CONFIG.ADAPTIVE_CONFIDENCE,
+            "sampling_seed": APP_CONFIG.SAMPLING_SEED, "ranking": ranking, "finalists": finalists}
+
+def save_screening_report(report: Dict[str, Any], report_path: str):
+    if os.path.dirname(report_path): os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    with open(report_path + ".tmp", "w", encoding="utf-8") as f_report:
+        json.dump(report, f_report, indent=4, ensure_ascii=False)
+    os.replace(report_path + ".tmp", report_path)
+
+def print_screening_ranking(report: Dict[str, Any]):
+    print(f"\nScreening ranking (mean ESI, {report['confidence']:.0%} CI, first {report['items_per_dataset']} stratified items per dataset):")
+    for row in report["ranking"]:
+        finalist_mark = " *" if row["worker_model_id"] in report["finalists"] else ""
+        if row["mean_esi"] is None:
+            print(f"  {row['rank']:>2}. {row['worker_model_id']}: no scored items{finalist_mark}")
+        else:
+            print(f"  {row['rank']:>2}. {row['worker_model_id']}: {row['mean_esi']:.2f} [{row['esi_ci'][0]:.2f}, {row['esi_ci'][1]:.2f}], "
+                  f"ACC {row['mean_accuracy']:.1f} ({row['items_scored']} items){finalist_mark}")
+    print(f"Finalists for the full run: {report['finalists']}")
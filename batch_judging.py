@@ -0,0 +1,192 @@
+# batch_judging.py
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Any, List, Optional, Tuple
+import httpx
+from config import APP_CONFIG
+
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+def batch_api_base_url() -> str:
+    """BATCH_API_BASE_URL, or the accuracy judge URL without a trailing /chat/completions."""
+    base_url = APP_CONFIG.BATCH_API_BASE_URL or APP_CONFIG.ACCURACY_JUDGE_API_URL
+    base_url = base_url.rstrip("/")
+    if base_url.endswith("/chat/completions"): base_url = base_url[:-len("/chat/completions")]
+    return base_url
+
+def make_batch_request_line(custom_id: str, judge_request: Dict[str, Any]) -> Dict[str, Any]:
+    """One line of an OpenAI-style batch input file. `judge_request` is the body built by llm_calls.build_*_judge_request."""
+    return {"custom_id": custom_id, "method": "POST", "url": APP_CONFIG.BATCH_ENDPOINT, "body": dict(judge_request, stream=False)}
+
+def parse_batch_output_line(output_line: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """Returns (content, error) for one line of a batch output or error file."""
+    if output_line.get("error"):
+        return None, f"Batch request error: {output_line['error']}"
+    response = output_line.get("response") or {}
+    status_code = response.get("status_code")
+    body = response.get("body") or {}
+    if status_code is not None and status_code >= 400:
+        return None, f"Batch request HTTP {status_code}: {str(body)[:200]}"
+    choices = body.get("choices") or []
+    if choices and choices[0].get("message", {}).get("content") is not None:
+        return choices[0]["message"]["content"], None
+    return None, f"Batch response has no choices/content: {str(body)[:200]}"
+
+class BatchJudgeClient:
+    """
+    Minimal client for an OpenAI-compatible batch API: upload a JSONL input file, create a batch,
+    poll it until it reaches a terminal status and download its output/error files.
+    """
+    def __init__(self, base_url: str, api_token: str):
+        self.base_url = base_url.rstrip("/")
+        self.client = httpx.AsyncClient(headers={"Authorization": f"Bearer {api_token}"},
+                                        timeout=httpx.Timeout(APP_CONFIG.REQUEST_TIMEOUT_SECONDS))
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        for attempt in range(APP_CONFIG.MAX_RETRIES + 1):
+            try:
+                response = await self.client.request(method, f"{self.base_url}{path}", **kwargs)
+                if response.status_code == 429 or response.status_code >= 500:
+                    response.raise_for_status()
+                return response
+            except httpx.HTTPError as e:
+                if attempt >= APP_CONFIG.MAX_RETRIES: raise
+                print(f"Batch API {method} {path} failed ({type(e).__name__}: {e}). Retrying in {APP_CONFIG.RETRY_DELAY_SECONDS}s...")
+                await asyncio.sleep(APP_CONFIG.RETRY_DELAY_SECONDS)
+
+    async def upload_input_file(self, requests_file_path: str) -> str:
+        with open(requests_file_path, "rb") as f:
+            response = await self._request("POST", "/files", data={"purpose": "batch"},
+                                           files={"file": (os.path.basename(requests_file_path), f.read(), "application/jsonl")})
+        response.raise_for_status()
+        return response.json()["id"]
+
+    async def create_batch(self, input_file_id: str) -> Dict[str, Any]:
+        response = await self._request("POST", "/batches", json={
+            "input_file_id": input_file_id, "endpoint": APP_CONFIG.BATCH_ENDPOINT,
+            "completion_window": APP_CONFIG.BATCH_COMPLETION_WINDOW
+        })
+        response.raise_for_status()
+        return response.json()
+
+    async def get_batch(self, batch_id: str) -> Dict[str, Any]:
+        response = await self._request("GET", f"/batches/{batch_id}")
+        response.raise_for_status()
+        return response.json()
+
+    async def wait_for_batch(self, batch_id: str) -> Dict[str, Any]:
+        started_at = time.time()
+        while True:
+            batch = await self.get_batch(batch_id)
+            status = batch.get("status")
+            if status in BATCH_TERMINAL_STATUSES: return batch
+            counts = batch.get("request_counts") or {}
+            print(f"Batch {batch_id}: {status} ({counts.get('completed', 0)}/{counts.get('total', '?')} done, {time.time() - started_at:.0f}s elapsed)")
+            await asyncio.sleep(APP_CONFIG.BATCH_POLL_INTERVAL_SECONDS)
+
+    async def download_output_lines(self, file_id: str) -> List[Dict[str, Any]]:
+        response = await self._request("GET", f"/files/{file_id}/content")
+        response.raise_for_status()
+        output_lines = []
+        for raw_line in response.text.splitlines():
+            if not raw_line.strip(): continue
+            try:
+                output_lines.append(json.loads(raw_line))
+            except json.JSONDecodeError:
+                print(f"WARNING: Skipping unparsable line in batch file {file_id}: {raw_line[:200]}")
+        return output_lines
+
+    async def aclose(self):
+        await self.client.aclose()
+
+class BatchStateFile:
+    """Records submitted batch ids so that a --resume run polls them again instead of paying for a resubmission."""
+    def __init__(self, state_path: str):
+        self.state_path = state_path
+        base_dir = os.path.dirname(state_path)
+        if base_dir: os.makedirs(base_dir, exist_ok=True)
+
+    def load(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.state_path): return []
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("batches", [])
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"WARNING: Could not read batch state file '{self.state_path}': {e}. Starting with no submitted batches.")
+            return []
+
+    def save(self, batches: List[Dict[str, Any]]):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"batches": batches}, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def reset(self):
+        if os.path.exists(self.state_path): os.remove(self.state_path)
+
+def write_batch_request_files(request_lines: List[Dict[str, Any]], requests_file_template: str, max_requests_per_file: int) -> List[str]:
+    """Writes the batch input JSONL, split into files of at most `max_requests_per_file` requests."""
+    chunk_size = max(1, max_requests_per_file)
+    paths = []
+    for chunk_idx, chunk_start in enumerate(range(0, len(request_lines), chunk_size)):
+        requests_file_path = requests_file_template.format(part=chunk_idx + 1)
+        base_dir = os.path.dirname(requests_file_path)
+        if base_dir: os.makedirs(base_dir, exist_ok=True)
+        with open(requests_file_path, "w", encoding="utf-8") as f:
+            for request_line in request_lines[chunk_start:chunk_start + chunk_size]:
+                f.write(json.dumps(request_line, ensure_ascii=False) + "\n")
+        paths.append(requests_file_path)
+    return paths
+
+async def collect_batch_results(client: BatchJudgeClient, batch_id: str) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """Waits for one batch and returns {custom_id: (content, error)} for every request it reported on."""
+    batch = await client.wait_for_batch(batch_id)
+    results = {}
+    for file_key in ("output_file_id", "error_file_id"):
+        if batch.get(file_key):
+            for output_line in await client.download_output_lines(batch[file_key]):
+                if output_line.get("custom_id") is not None:
+                    results[output_line["custom_id"]] = parse_batch_output_line(output_line)
+    print(f"Batch {batch_id} finished with status '{batch.get('status')}': {len(results)} result(s).")
+    return results
+
+async def run_judge_batches(request_lines: List[Dict[str, Any]], resume: bool = False) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """
+    Submits every judge request as OpenAI-style batch jobs and waits for them.
+    Returns {custom_id: (content, error)}; a request missing from the batch output maps to an error.
+    With `resume`, batches recorded in the state file by an interrupted run are collected first and only
+    requests they do not cover are submitted again.
+    """
+    state_file = BatchStateFile(APP_CONFIG.BATCH_STATE_FILE)
+    if not resume: state_file.reset()
+    client = BatchJudgeClient(batch_api_base_url(), APP_CONFIG.BATCH_API_TOKEN or APP_CONFIG.ACCURACY_JUDGE_API_TOKEN)
+    results: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+    wanted_ids = {request_line["custom_id"] for request_line in request_lines}
+    try:
+        submitted_batches = state_file.load()
+        for batch_info in submitted_batches:
+            print(f"Collecting batch {batch_info['batch_id']} submitted by an earlier run...")
+            try:
+                results.update(await collect_batch_results(client, batch_info["batch_id"]))
+            except httpx.HTTPError as e:
+                print(f"WARNING: Could not collect earlier batch {batch_info['batch_id']}: {e}. Its requests will be resubmitted.")
+        remaining_lines = [request_line for request_line in request_lines
+                           if request_line["custom_id"] not in results or results[request_line["custom_id"]][1] is not None]
+
+        new_batch_ids = []
+        for requests_file_path in write_batch_request_files(remaining_lines, APP_CONFIG.BATCH_REQUESTS_FILE_TEMPLATE, APP_CONFIG.BATCH_MAX_REQUESTS):
+            input_file_id = await client.upload_input_file(requests_file_path)
+            batch = await client.create_batch(input_file_id)
+            print(f"Submitted batch {batch['id']} ({requests_file_path}).")
+            submitted_batches.append({"batch_id": batch["id"], "input_file_id": input_file_id, "requests_file": requests_file_path})
+            state_file.save(submitted_batches)
+            new_batch_ids.append(batch["id"])
+        for batch_results in await asyncio.gather(*(collect_batch_results(client, batch_id) for batch_id in new_batch_ids)):
+            results.update(batch_results)
+    finally:
+        await client.aclose()
+    for custom_id in wanted_ids - results.keys():
+        results[custom_id] = (None, "No result for this request in the batch output.")
+    return results
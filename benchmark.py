@@ -0,0 +1,374 @@
+# benchmark.py
+"""
+Offline throughput benchmark of the evaluation pipeline. For each --concurrency level it starts
+mock_openai_server.py on a free local port, writes a settings.json that points the worker and both
+judges at it (response cache and metrics endpoint off, everything else from the repo's settings.json
+and --set), runs the full `main.py` pipeline in a scratch directory on the first --items items of each
+dataset, and records wall time, items/sec, the main.py process's CPU time and peak RSS, and the mock's
+request counters. The report is printed and written as JSON; with --baseline (an earlier report) the
+run fails with exit code 1 when items/sec or CPU seconds per item regress by more than --max-regression
+at any concurrency level both reports cover.
+
+--scenario batch-resume instead tests batch judge mode against the mock's Files and Batches API, at
+the first --concurrency level: `main.py --judge-mode batch` is stopped as soon as it has recorded its
+submitted batches in BATCH_STATE_FILE, then run again with --resume, which must collect those batches
+rather than upload and submit the judge requests again. It fails with exit code 1 when the resumed run
+fails or, without --batch-error-rate, leaves items unjudged or submits any new batch.
+
+    python benchmark.py --concurrency 8 32 128 --items 200 --latency lognormal:0.8:0.5 --rate-limit-rate 0.02
+    python benchmark.py --baseline ./Result/Benchmark_baseline.json --max-regression 0.15
+    python benchmark.py --scenario batch-resume --concurrency 32 --items 50 --batch-seconds 5
+
+CPU time and peak RSS come from os.wait4 and are only reported on platforms that have it (Linux, macOS).
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Dict, Any, List, Optional
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+def _wait_for_port(port: int, process: subprocess.Popen, timeout_seconds: float = 15.0):
+    deadline = time.time() + timeout_seconds
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The mock server exited with code {process.returncode} before it was ready.")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5): return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"The mock server did not start listening on port {port} within {timeout_seconds:.0f}s.")
+
+def _resolve_dataset_path(configured_path: str) -> Optional[str]:
+    """The dataset file for a DATASET_CONFIGS path, relative to the repo; falls back to the file name in the repo root."""
+    for candidate in (configured_path, os.path.join(REPO_DIR, configured_path), os.path.join(REPO_DIR, os.path.basename(configured_path))):
+        if os.path.isfile(candidate): return os.path.abspath(candidate)
+    return None
+
+def _copy_head(source_path: str, target_path: str, max_items: int) -> int:
+    """Copies the first `max_items` lines (all of them for 0) and returns how many were copied."""
+    copied = 0
+    with open(source_path, "r", encoding="utf-8") as f_in, open(target_path, "w", encoding="utf-8") as f_out:
+        for line in f_in:
+            if max_items and copied >= max_items: break
+            f_out.write(line); copied += 1
+    return copied
+
+def _parse_overrides(assignments: List[str]) -> Dict[str, Any]:
+    overrides = {}
+    for assignment in assignments:
+        key, separator, value_text = assignment.partition("=")
+        if not separator: raise ValueError(f"--set expects KEY=VALUE, got '{assignment}'.")
+        try:
+            overrides[key] = json.loads(value_text)
+        except json.JSONDecodeError:
+            overrides[key] = value_text # Plain strings need no JSON quotes
+    return overrides
+
+def build_settings(base_settings: Dict[str, Any], args: argparse.Namespace, mock_url: str, dataset_paths: Dict[str, str],
+                   concurrency: int) -> Dict[str, Any]:
+    settings = dict(base_settings)
+    for url_key in ("WORKER_API_URL", "ACCURACY_JUDGE_API_URL", "INTEGRITY_JUDGE_API_URL"): settings[url_key] = mock_url
+    for token_key in ("WORKER_API_TOKEN", "ACCURACY_JUDGE_API_TOKEN", "INTEGRITY_JUDGE_API_TOKEN"): settings[token_key] = "mock-token"
+    settings["WORKER_MODEL_IDS"] = args.models
+    settings["PROMPT_VERSIONS_TO_TEST"] = args.prompt_versions
+    settings["DATASETS_TO_RUN"] = list(dataset_paths)
+    settings["DATASET_CONFIGS"] = {name: dict(base_settings["DATASET_CONFIGS"][name], path=path) for name, path in dataset_paths.items()}
+    settings["MAX_IN_FLIGHT_ITEMS"] = concurrency
+    # Let the adaptive limiter start at the level under test instead of ramping up to it.
+    settings["ADAPTIVE_INITIAL_CONCURRENCY"] = concurrency
+    settings["RESPONSE_CACHE_ENABLED"] = False # Every run must make its calls
+    settings["METRICS_PORT"] = 0
+    settings.update(args.overrides)
+    return settings
+
+def _read_results(result_dir: str) -> Dict[str, int]:
+    counts = {"items": 0, "items_completed": 0}
+    if not os.path.isdir(result_dir): return counts
+    for file_name in os.listdir(result_dir):
+        if not (file_name.startswith("ESI_Result_") and file_name.endswith(".jsonl")): continue
+        with open(os.path.join(result_dir, file_name), "r", encoding="utf-8") as f_in:
+            for line in f_in:
+                if not line.strip(): continue
+                counts["items"] += 1
+                if json.loads(line).get("status") == "COMPLETED": counts["items_completed"] += 1
+    return counts
+
+def _mock_stats(port: int) -> Dict[str, int]:
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats", timeout=5) as response:
+            return json.loads(response.read())
+    except (OSError, ValueError) as e:
+        print(f"WARNING: Could not read the mock server's counters: {e}")
+        return {}
+
+def _run_and_measure(command: List[str], cwd: str, log_path: str) -> Dict[str, Any]:
+    """Runs `command` to completion and measures its wall time and (where os.wait4 exists) CPU time and peak RSS."""
+    with open(log_path, "w", encoding="utf-8") as log_file:
+        started_at = time.perf_counter()
+        process = subprocess.Popen(command, cwd=cwd, stdout=log_file, stderr=subprocess.STDOUT)
+        if hasattr(os, "wait4"):
+            _, wait_status, usage = os.wait4(process.pid, 0)
+            wall_seconds = time.perf_counter() - started_at
+            process.returncode = os.waitstatus_to_exitcode(wait_status) if hasattr(os, "waitstatus_to_exitcode") else wait_status >> 8
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+            peak_rss_bytes = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+            return {"exit_code": process.returncode, "wall_seconds": wall_seconds, "cpu_user_seconds": usage.ru_utime,
+                    "cpu_system_seconds": usage.ru_stime, "peak_rss_mb": peak_rss_bytes / (1024 * 1024)}
+        process.wait()
+        return {"exit_code": process.returncode, "wall_seconds": time.perf_counter() - started_at,
+                "cpu_user_seconds": None, "cpu_system_seconds": None, "peak_rss_mb": None}
+
+def _start_mock_server(args: argparse.Namespace, port: int) -> subprocess.Popen:
+    mock_command = [sys.executable, os.path.join(REPO_DIR, "mock_openai_server.py"), "--port", str(port),
+                    "--latency", args.latency, "--rate-limit-rate", str(args.rate_limit_rate), "--error-rate", str(args.error_rate),
+                    "--retry-after", str(args.retry_after), "--batch-seconds", str(args.batch_seconds), "--batch-error-rate", str(args.batch_error_rate)]
+    if args.judge_latency: mock_command += ["--judge-latency", args.judge_latency]
+    if args.seed is not None: mock_command += ["--seed", str(args.seed)]
+    mock_process = subprocess.Popen(mock_command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _wait_for_port(port, mock_process)
+    return mock_process
+
+def _stop_process(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def _prepare_work_dir(args: argparse.Namespace, work_dir: str, base_settings: Dict[str, Any], source_datasets: Dict[str, str],
+                      port: int, concurrency: int, extra_settings: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    """Copies the datasets' first --items items and writes settings.json into `work_dir`; returns the items copied per dataset."""
+    os.makedirs(os.path.join(work_dir, "data"))
+    dataset_paths, items_per_dataset = {}, {}
+    for name, source_path in source_datasets.items():
+        dataset_paths[name] = os.path.join(work_dir, "data", f"{name}.jsonl")
+        items_per_dataset[name] = _copy_head(source_path, dataset_paths[name], args.items)
+    settings = build_settings(base_settings, args, f"http://127.0.0.1:{port}/v1/chat/completions", dataset_paths, concurrency)
+    settings.update(extra_settings or {})
+    with open(os.path.join(work_dir, "settings.json"), "w", encoding="utf-8") as f_settings:
+        json.dump(settings, f_settings, indent=4, ensure_ascii=False)
+    return items_per_dataset
+
+def run_benchmark_level(args: argparse.Namespace, base_settings: Dict[str, Any], source_datasets: Dict[str, str], concurrency: int) -> Dict[str, Any]:
+    """One full pipeline run against a fresh mock server at one concurrency level."""
+    work_dir = tempfile.mkdtemp(prefix=f"lunarbench_benchmark_c{concurrency}_")
+    port = _free_port()
+    mock_process = _start_mock_server(args, port)
+    try:
+        items_per_dataset = _prepare_work_dir(args, work_dir, base_settings, source_datasets, port, concurrency)
+        log_path = os.path.join(work_dir, "main.log")
+        print(f"Concurrency {concurrency}: running {sum(items_per_dataset.values())} item(s) x {len(args.models) * len(args.prompt_versions)} "
+              f"combination(s) per dataset (log: {log_path})...", flush=True)
+        measurement = _run_and_measure([sys.executable, os.path.join(REPO_DIR, "main.py")], work_dir, log_path)
+        results = _read_results(os.path.join(work_dir, "Result"))
+        wall_seconds = measurement["wall_seconds"]
+        cpu_seconds = None if measurement["cpu_user_seconds"] is None else measurement["cpu_user_seconds"] + measurement["cpu_system_seconds"]
+        level_report = {
+            "concurrency": concurrency, "exit_code": measurement["exit_code"], **results,
+            "wall_seconds": round(wall_seconds, 3),
+            "items_per_second": round(results["items"] / wall_seconds, 3) if wall_seconds > 0 else None,
+            "cpu_user_seconds": measurement["cpu_user_seconds"], "cpu_system_seconds": measurement["cpu_system_seconds"],
+            "cpu_seconds_per_item": round(cpu_seconds / results["items"], 5) if cpu_seconds is not None and results["items"] else None,
+            "peak_rss_mb": None if measurement["peak_rss_mb"] is None else round(measurement["peak_rss_mb"], 1),
+            "mock_server": _mock_stats(port),
+        }
+        if measurement["exit_code"] != 0:
+            print(f"WARNING: main.py exited with code {measurement['exit_code']} at concurrency {concurrency}. See {log_path}.")
+            args.keep_work_dirs = True
+        if args.keep_work_dirs: level_report["work_dir"] = work_dir
+        return level_report
+    finally:
+        _stop_process(mock_process)
+        if not args.keep_work_dirs: shutil.rmtree(work_dir, ignore_errors=True)
+
+def _submitted_batch_count(state_path: str) -> int:
+    try:
+        with open(state_path, "r", encoding="utf-8") as f_state:
+            return len(json.load(f_state).get("batches", []))
+    except (OSError, ValueError):
+        return 0 # Not written yet, or caught halfway through os.replace on some platforms
+
+def run_batch_resume_scenario(args: argparse.Namespace, base_settings: Dict[str, Any], source_datasets: Dict[str, str]) -> Dict[str, Any]:
+    """The batch-resume scenario described in the module docstring, against a fresh mock server."""
+    concurrency = args.concurrency[0]
+    work_dir = tempfile.mkdtemp(prefix=f"lunarbench_benchmark_batch_c{concurrency}_")
+    state_path = os.path.join(work_dir, "Intermediate", "batch_judge_state.json")
+    port = _free_port()
+    mock_process = _start_mock_server(args, port)
+    try:
+        items_per_dataset = _prepare_work_dir(args, work_dir, base_settings, source_datasets, port, concurrency, {
+            "BATCH_API_BASE_URL": "", "BATCH_POLL_INTERVAL_SECONDS": args.batch_poll_seconds, "BATCH_STATE_FILE": state_path,
+            "BATCH_REQUESTS_FILE_TEMPLATE": os.path.join(work_dir, "Intermediate", "BatchJudgeRequests_part{part}.jsonl")})
+        main_command = [sys.executable, os.path.join(REPO_DIR, "main.py"), "--judge-mode", "batch"]
+        print(f"Batch resume: running {sum(items_per_dataset.values())} item(s) x {len(args.models) * len(args.prompt_versions)} "
+              f"combination(s) per dataset until the first batches are submitted (work dir: {work_dir})...", flush=True)
+        interrupted_log_path = os.path.join(work_dir, "main_interrupted.log")
+        started_at = time.perf_counter()
+        with open(interrupted_log_path, "w", encoding="utf-8") as log_file:
+            interrupted_process = subprocess.Popen(main_command, cwd=work_dir, stdout=log_file, stderr=subprocess.STDOUT)
+            while interrupted_process.poll() is None and _submitted_batch_count(state_path) == 0: time.sleep(0.1)
+            interrupted_exit_code = interrupted_process.poll()
+            _stop_process(interrupted_process)
+        interrupted_seconds = time.perf_counter() - started_at
+        batches_before_resume = _submitted_batch_count(state_path)
+        mock_stats_before_resume = _mock_stats(port)
+        scenario_report = {"concurrency": concurrency, "batch_seconds": args.batch_seconds, "batch_error_rate": args.batch_error_rate,
+                           "interrupted_run": {"seconds_until_interrupted": round(interrupted_seconds, 3), "batches_submitted": batches_before_resume}}
+        if interrupted_exit_code is not None or batches_before_resume == 0:
+            print(f"WARNING: main.py ended (exit code {interrupted_exit_code}) before it submitted a batch; nothing to resume. See {interrupted_log_path}.")
+            args.keep_work_dirs = True
+            scenario_report.update(exit_code=1, work_dir=work_dir)
+            return scenario_report
+
+        print(f"Batch resume: interrupted after {batches_before_resume} batch(es) were submitted; resuming...", flush=True)
+        log_path = os.path.join(work_dir, "main_resumed.log")
+        measurement = _run_and_measure(main_command + ["--resume"], work_dir, log_path)
+        results = _read_results(os.path.join(work_dir, "Result"))
+        mock_stats = _mock_stats(port)
+        new_batches = mock_stats.get("batches_created", 0) - mock_stats_before_resume.get("batches_created", 0)
+        scenario_report["resumed_run"] = {"exit_code": measurement["exit_code"], **results, "wall_seconds": round(measurement["wall_seconds"], 3),
+                                          "batches_collected": batches_before_resume, "batches_submitted": new_batches}
+        scenario_report["mock_server"] = mock_stats
+        problems = []
+        if measurement["exit_code"] != 0: problems.append(f"main.py --resume exited with code {measurement['exit_code']}")
+        # With injected batch errors, failed requests are submitted again by design (and may fail again), so only check the rest without them.
+        if not args.batch_error_rate:
+            if results["items_completed"] < results["items"]: problems.append(f"only {results['items_completed']} of {results['items']} item(s) completed")
+            if new_batches: problems.append(f"the resumed run submitted {new_batches} new batch(es) instead of collecting the recorded ones")
+        for problem in problems: print(f"WARNING: Batch resume: {problem}. See {log_path}.")
+        if problems: args.keep_work_dirs = True
+        scenario_report["exit_code"] = 1 if problems else 0
+        if args.keep_work_dirs: scenario_report["work_dir"] = work_dir
+        return scenario_report
+    finally:
+        _stop_process(mock_process)
+        if not args.keep_work_dirs: shutil.rmtree(work_dir, ignore_errors=True)
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Regressions of items/sec and CPU seconds per item against `baseline`, per concurrency level both reports have."""
+    baseline_levels = {level["concurrency"]: level for level in baseline.get("runs", [])}
+    regressions = []
+    for level in report["runs"]:
+        baseline_level = baseline_levels.get(level["concurrency"])
+        if baseline_level is None: continue
+        if level["items_per_second"] and baseline_level.get("items_per_second"):
+            if level["items_per_second"] < baseline_level["items_per_second"] * (1 - max_regression):
+                regressions.append(f"concurrency {level['concurrency']}: {level['items_per_second']} items/s vs. baseline {baseline_level['items_per_second']}")
+        if level["cpu_seconds_per_item"] and baseline_level.get("cpu_seconds_per_item"):
+            if level["cpu_seconds_per_item"] > baseline_level["cpu_seconds_per_item"] * (1 + max_regression):
+                regressions.append(f"concurrency {level['concurrency']}: {level['cpu_seconds_per_item']} CPU s/item vs. baseline {baseline_level['cpu_seconds_per_item']}")
+    return regressions
+
+def _format_optional(value: Optional[float], scale: float = 1.0) -> str:
+    return "n/a" if value is None else f"{value * scale:.2f}"
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n{'concurrency':>11} {'items':>7} {'completed':>9} {'wall s':>8} {'items/s':>8} {'CPU s':>8} {'CPU ms/item':>11} {'peak RSS MB':>11} {'429s':>5} {'500s':>5}")
+    for level in report["runs"]:
+        cpu_seconds = None if level["cpu_user_seconds"] is None else level["cpu_user_seconds"] + level["cpu_system_seconds"]
+        mock_stats = level["mock_server"]
+        print(f"{level['concurrency']:>11} {level['items']:>7} {level['items_completed']:>9} {level['wall_seconds']:>8.2f} "
+              f"{_format_optional(level['items_per_second']):>8} {_format_optional(cpu_seconds):>8} "
+              f"{_format_optional(level['cpu_seconds_per_item'], 1000):>11} {_format_optional(level['peak_rss_mb']):>11} "
+              f"{mock_stats.get('rate_limited', 0):>5} {mock_stats.get('server_errors', 0):>5}")
+
+def print_batch_resume_report(scenario_report: Dict[str, Any]):
+    interrupted_run, resumed_run = scenario_report["interrupted_run"], scenario_report.get("resumed_run")
+    print(f"\nBatch resume (concurrency {scenario_report['concurrency']}): interrupted after {interrupted_run['seconds_until_interrupted']:.2f}s "
+          f"with {interrupted_run['batches_submitted']} batch(es) submitted.")
+    if resumed_run is None: return
+    print(f"Resumed run: {resumed_run['batches_collected']} batch(es) collected, {resumed_run['batches_submitted']} new batch(es) submitted, "
+          f"{resumed_run['items_completed']}/{resumed_run['items']} item(s) completed in {resumed_run['wall_seconds']:.2f}s.")
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark of the Lunar-Bench pipeline against a local mock server.")
+    parser.add_argument("--scenario", choices=["throughput", "batch-resume"], default="throughput",
+                        help="'throughput' runs every --concurrency level; 'batch-resume' tests an interrupted and resumed batch judge run.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 128], help="MAX_IN_FLIGHT_ITEMS levels to run.")
+    parser.add_argument("--items", type=int, default=200, help="Items per dataset (0 = the whole file).")
+    parser.add_argument("--datasets", nargs="+", default=None, help="Dataset short names from DATASET_CONFIGS; defaults to DATASETS_TO_RUN.")
+    parser.add_argument("--models", nargs="+", default=["mock/worker"], help="Worker model ids (the mock answers for any id).")
+    parser.add_argument("--prompt-versions", nargs="+", default=["DIRECT"])
+    parser.add_argument("--latency", default="lognormal:0.8:0.5", help="Worker latency spec, e.g. fixed:0.5, uniform:0.2:1.5, lognormal:MEDIAN:SIGMA, exponential:MEAN.")
+    parser.add_argument("--judge-latency", default="lognormal:0.4:0.3", help="Judge latency spec.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of calls the mock answers with 429.")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on injected 429s.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls the mock answers with 500.")
+    parser.add_argument("--batch-seconds", type=float, default=5.0, help="Seconds the mock takes to complete a batch.")
+    parser.add_argument("--batch-error-rate", type=float, default=0.0, help="Fraction of batch requests the mock puts in the error file.")
+    parser.add_argument("--batch-poll-seconds", type=float, default=0.5, help="BATCH_POLL_INTERVAL_SECONDS for the batch-resume scenario.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the mock's latency and error draws.")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra settings.json override for main.py (VALUE is parsed as JSON when possible); repeatable.")
+    parser.add_argument("--settings", default=os.path.join(REPO_DIR, "settings.json"), help="Base settings file.")
+    parser.add_argument("--output", default=None, help="Report path; defaults to ./Result/Benchmark_<timestamp>.json.")
+    parser.add_argument("--baseline", default=None, help="Earlier benchmark report to compare against.")
+    parser.add_argument("--max-regression", type=float, default=0.15, help="Allowed relative regression against --baseline.")
+    parser.add_argument("--keep-work-dirs", action="store_true", help="Keep each run's scratch directory (results, logs, settings).")
+    args = parser.parse_args(argv)
+    try:
+        args.overrides = _parse_overrides(args.overrides)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    with open(args.settings, "r", encoding="utf-8") as f_settings:
+        base_settings = json.load(f_settings)
+    dataset_names = args.datasets or base_settings.get("DATASETS_TO_RUN", [])
+    source_datasets = {}
+    for name in dataset_names:
+        dataset_config = base_settings.get("DATASET_CONFIGS", {}).get(name)
+        dataset_path = _resolve_dataset_path(dataset_config["path"]) if dataset_config else None
+        if dataset_path is None:
+            print(f"ERROR: Dataset '{name}' is not in DATASET_CONFIGS or its file was not found.")
+            return 2
+        source_datasets[name] = dataset_path
+
+    report = {"benchmark": {"started_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+                            "datasets": source_datasets, "items_per_dataset": args.items, "models": args.models,
+                            "prompt_versions": args.prompt_versions, "latency": args.latency, "judge_latency": args.judge_latency,
+                            "rate_limit_rate": args.rate_limit_rate, "error_rate": args.error_rate, "settings_overrides": args.overrides},
+              "runs": []}
+    if args.scenario == "batch-resume":
+        report["batch_resume"] = run_batch_resume_scenario(args, base_settings, source_datasets)
+        print_batch_resume_report(report["batch_resume"])
+    else:
+        for concurrency in args.concurrency:
+            report["runs"].append(run_benchmark_level(args, base_settings, source_datasets, concurrency))
+        print_report(report)
+
+    output_path = args.output or os.path.join(".", "Result", f"Benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    if os.path.dirname(output_path): os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f_out:
+        json.dump(report, f_out, indent=4, ensure_ascii=False)
+    print(f"\nBenchmark report saved to: {output_path}")
+
+    exit_code = 0 if all(level["exit_code"] == 0 for level in report["runs"] + [report.get("batch_resume", {"exit_code": 0})]) else 1
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f_baseline:
+            regressions = compare_to_baseline(report, json.load(f_baseline), args.max_regression)
+        if regressions:
+            print(f"REGRESSION against {args.baseline} (more than {args.max_regression:.0%}):")
+            for regression in regressions: print(f"  {regression}")
+            exit_code = 1
+        else:
+            print(f"No regression against {args.baseline} (tolerance {args.max_regression:.0%}).")
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+# checkpoint_journal.py
+import json
+import os
+from typing import Dict, Any, Iterator, Set
+
+# Statuses that a --resume run tries again instead of treating the item as done.
+RESUME_RETRY_STATUSES = {
+    "ERROR_WORKER_API", "ERROR_ACCURACY_JUDGE", "ERROR_INTEGRITY_JUDGE",
+    "ERROR_UNEXPECTED_PIPELINE", "ERROR_FUTURE_EXCEPTION", "ERROR_THREAD_RETURNED_NONE"
+}
+
+class CheckpointJournal:
+    """
+    Append-only JSONL journal of finished item results for one combination.
+    Every result is flushed to disk as soon as its item finishes, so a crash loses at most the items
+    still in flight. An item may appear more than once (e.g. retried on --resume); the last entry wins.
+    """
+    def __init__(self, journal_path: str):
+        self.journal_path = journal_path
+        self._file = None
+        base_dir = os.path.dirname(journal_path)
+        if base_dir: os.makedirs(base_dir, exist_ok=True)
+
+    def reset(self):
+        if os.path.exists(self.journal_path): os.remove(self.journal_path)
+
+    def _repair_tail(self):
+        """Truncates a partially written last line left behind by a crash."""
+        if not os.path.exists(self.journal_path): return
+        with open(self.journal_path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0: return
+            f.seek(size - 1)
+            if f.read(1) == b"\n": return
+            chunk_start = size
+            while chunk_start > 0:
+                chunk_start = max(0, chunk_start - 65536)
+                f.seek(chunk_start)
+                last_newline = f.read(size - chunk_start).rfind(b"\n")
+                if last_newline != -1:
+                    f.truncate(chunk_start + last_newline + 1)
+                    return
+            f.truncate(0)
+
+    def _iter_entries_with_offsets(self) -> Iterator[tuple]:
+        if not os.path.exists(self.journal_path): return
+        with open(self.journal_path, "rb") as f:
+            offset = 0
+            for raw_line in f:
+                line_offset = offset; offset += len(raw_line)
+                try:
+                    entry = json.loads(raw_line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(entry, dict) and isinstance(entry.get("id"), int):
+                    yield line_offset, entry
+
+    def load_completed_ids(self, retry_statuses: Set[str] = RESUME_RETRY_STATUSES) -> Set[int]:
+        """Ids whose latest journal entry does not need to be run again."""
+        self._repair_tail()
+        latest_status_by_id: Dict[int, str] = {}
+        for _, entry in self._iter_entries_with_offsets():
+            latest_status_by_id[entry["id"]] = entry.get("status", "")
+        return {item_id for item_id, status in latest_status_by_id.items() if status not in retry_statuses}
+
+    def append(self, item_result: Dict[str, Any]):
+        if self._file is None:
+            self._repair_tail()
+            self._file = open(self.journal_path, "a", encoding="utf-8")
+        self._file.write(json.dumps(item_result, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def iter_latest_results_in_id_order(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the latest entry for every item id, ordered by id. Only an id -> byte offset table is
+        held in memory; each entry is re-read from disk when it is yielded.
+        """
+        latest_offset_by_id: Dict[int, int] = {}
+        for line_offset, entry in self._iter_entries_with_offsets():
+            latest_offset_by_id[entry["id"]] = line_offset
+        if not latest_offset_by_id: return
+        with open(self.journal_path, "rb") as f:
+            for item_id in sorted(latest_offset_by_id):
+                f.seek(latest_offset_by_id[item_id])
+                yield json.loads(f.readline())
@@ -0,0 +1,117 @@
+# circuit_breaker.py
+import asyncio
+import time
+from collections import Counter, deque
+from typing import Dict, Optional, Any
+from config import APP_CONFIG
+from run_stats import record_stat
+from run_metrics import observe
+
+class CircuitOpenError(Exception):
+    """Raised by EndpointCircuitBreaker.before_request when an endpoint stayed unavailable for CIRCUIT_BREAKER_MAX_WAIT_SECONDS."""
+
+class EndpointCircuitBreaker:
+    """
+    Per-endpoint circuit breaker, checked before every API attempt:
+      - closed: requests flow; the outcomes of the last CIRCUIT_BREAKER_WINDOW requests are kept, and once
+        at least CIRCUIT_BREAKER_MIN_REQUESTS of them are in and their failure rate (transport errors and
+        timeouts, 5xx) reaches CIRCUIT_BREAKER_ERROR_RATE the breaker opens,
+      - open: no request is sent; callers wait without using up their retry attempts, so items stay in
+        their combination instead of landing as API errors, and no new items get further than their first call,
+      - half-open: after the open period, CIRCUIT_BREAKER_HALF_OPEN_PROBES callers go ahead as probes. If
+        they all succeed the breaker closes and every waiting caller resumes; a failed probe reopens it
+        for twice as long (capped at CIRCUIT_BREAKER_MAX_OPEN_SECONDS).
+    Rate limiting (429) counts as success here; the adaptive limiter handles it.
+    """
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.enabled = APP_CONFIG.CIRCUIT_BREAKER_ENABLED
+        self.state = "closed"
+        self.outcomes: deque = deque(maxlen=max(1, APP_CONFIG.CIRCUIT_BREAKER_WINDOW))
+        self.open_seconds = APP_CONFIG.CIRCUIT_BREAKER_OPEN_SECONDS
+        self.retry_at = 0.0
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.stats: Counter = Counter()
+        self._condition = asyncio.Condition()
+
+    async def before_request(self) -> bool:
+        """Waits until a request may be sent; returns True if it is a half-open probe (pass that to record_result)."""
+        if not self.enabled: return False
+        wait_started = None
+        while True:
+            now = time.monotonic()
+            if self.state == "open" and now >= self.retry_at:
+                self.state, self.probe_successes = "half_open", 0
+            if self.state == "closed" or (self.state == "half_open" and self.probes_in_flight < APP_CONFIG.CIRCUIT_BREAKER_HALF_OPEN_PROBES):
+                is_probe = self.state == "half_open"
+                if is_probe: self.probes_in_flight += 1
+                if wait_started is not None:
+                    self._record("circuit_breaker_wait_seconds", now - wait_started)
+                    observe("circuit_breaker_wait_seconds", now - wait_started)
+                return is_probe
+            if wait_started is None:
+                wait_started = now
+                self._record("circuit_breaker_waits")
+            if now - wait_started > APP_CONFIG.CIRCUIT_BREAKER_MAX_WAIT_SECONDS:
+                self._record("circuit_breaker_wait_seconds", now - wait_started)
+                raise CircuitOpenError(f"Circuit breaker for {self.endpoint} stayed open for {now - wait_started:.0f}s (CIRCUIT_BREAKER_MAX_WAIT_SECONDS).")
+            timeout = max(0.05, self.retry_at - now) if self.state == "open" else 1.0
+            async with self._condition:
+                try:
+                    await asyncio.wait_for(self._condition.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def record_result(self, is_probe: bool, failed: Optional[bool]):
+        """Outcome of a request let through by before_request: failed True/False, or None when it has no verdict (e.g. cancelled)."""
+        if not self.enabled: return
+        if is_probe: self.probes_in_flight -= 1
+        now = time.monotonic()
+        if is_probe and self.state == "half_open" and failed is not None:
+            if failed:
+                self.open_seconds = min(APP_CONFIG.CIRCUIT_BREAKER_MAX_OPEN_SECONDS, self.open_seconds * 2)
+                self._open(now, "a half-open probe failed")
+            else:
+                self.probe_successes += 1
+                if self.probe_successes >= APP_CONFIG.CIRCUIT_BREAKER_HALF_OPEN_PROBES:
+                    self.state, self.open_seconds = "closed", APP_CONFIG.CIRCUIT_BREAKER_OPEN_SECONDS
+                    self.outcomes.clear()
+                    self._record("circuit_breaker_recoveries")
+                    print(f"\nCIRCUIT_BREAKER: {self.endpoint} is healthy again; resuming requests.")
+        elif self.state == "closed" and failed is not None:
+            # Results of requests sent before the breaker opened are ignored while it is open or half-open.
+            self.outcomes.append(failed)
+            failures = sum(self.outcomes)
+            if len(self.outcomes) >= APP_CONFIG.CIRCUIT_BREAKER_MIN_REQUESTS and failures / len(self.outcomes) >= APP_CONFIG.CIRCUIT_BREAKER_ERROR_RATE:
+                self._open(now, f"{failures} of the last {len(self.outcomes)} requests failed")
+        async with self._condition:
+            self._condition.notify_all()
+
+    def _open(self, now: float, reason: str):
+        self.state, self.retry_at = "open", now + self.open_seconds
+        self._record("circuit_breaker_trips")
+        print(f"\nCIRCUIT_BREAKER: {self.endpoint} opened ({reason}); pausing its requests for {self.open_seconds:.0f}s before a probe.")
+
+    def _record(self, stat_name: str, amount=1):
+        self.stats[stat_name] += amount
+        record_stat(stat_name, amount)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"state": self.state, **{stat_name: round(value, 2) for stat_name, value in self.stats.items()}}
+
+_BREAKERS: Dict[str, EndpointCircuitBreaker] = {}
+
+def get_endpoint_circuit_breaker(target_api_url: str) -> EndpointCircuitBreaker:
+    breaker = _BREAKERS.get(target_api_url)
+    if breaker is None:
+        breaker = EndpointCircuitBreaker(target_api_url)
+        _BREAKERS[target_api_url] = breaker
+    return breaker
+
+def summarize_circuit_breaker_stats(stats: Counter) -> Dict[str, Any]:
+    return {stat_name: round(stats.get(stat_name, 0), 2) for stat_name in
+            ("circuit_breaker_trips", "circuit_breaker_recoveries", "circuit_breaker_waits", "circuit_breaker_wait_seconds")}
+
+def summarize_all_endpoint_circuit_breakers() -> Dict[str, Dict[str, Any]]:
+    return {endpoint: breaker.snapshot() for endpoint, breaker in _BREAKERS.items() if breaker.stats}
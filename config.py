@@ -9,6 +9,7 @@ class Config:
         self.filepath_for_error_reporting = filepath
         self._load_config(filepath)
         self._validate_and_initialize()
+        self._initialize_optional_settings()
 
     def _load_config(self, filepath):
         """Loads configuration from a JSON file."""
@@ -114,6 +115,129 @@ class Config:
             print(f"FATAL ERROR: ESI weights must sum to a positive value. Sum: {total_weight:.4f}. Check '{self.filepath_for_error_reporting}'.")
             sys.exit(1)
 
+    def _initialize_optional_settings(self):
+        """Sets optional keys as attributes, falling back to defaults when absent from the settings file."""
+        optional_keys_with_defaults = {
+            "MAX_IN_FLIGHT_ITEMS": (int, 0), # 0 = MAX_CONCURRENT_ITEMS_PER_COMBO * number of combinations
+            "WORKER_STAGE_CONCURRENCY": (int, 0), # 0 = MAX_IN_FLIGHT_ITEMS
+            "JUDGE_STAGE_CONCURRENCY": (int, 0), # 0 = MAX_IN_FLIGHT_ITEMS
+            "RETRY_MAX_DELAY_SECONDS": (float, 120.0),
+            "ADAPTIVE_CONCURRENCY_ENABLED": (bool, True),
+            "ADAPTIVE_INITIAL_CONCURRENCY": (int, 8),
+            "ADAPTIVE_DECREASE_FACTOR": (float, 0.5),
+            "ADAPTIVE_LATENCY_INFLATION": (float, 3.0),
+            "RATE_LIMIT_REQUESTS_PER_SECOND": (float, 0.0), # Per endpoint URL; 0 = no rate cap
+            "HEDGE_ENABLED": (bool, False), # Send a duplicate of calls that are slower than HEDGE_PERCENTILE of their endpoint's latency
+            "HEDGE_PERCENTILE": (float, 0.95),
+            "HEDGE_MIN_SAMPLES": (int, 20), # Timed calls per endpoint + model before hedging starts
+            "HEDGE_MIN_DELAY_SECONDS": (float, 1.0),
+            "HEDGE_MAX_EXTRA_FRACTION": (float, 0.05), # Duplicates allowed per call to the endpoint + model
+            "CIRCUIT_BREAKER_ENABLED": (bool, True), # Pause an endpoint's requests during an outage instead of failing every item
+            "CIRCUIT_BREAKER_WINDOW": (int, 20), # Recent requests whose outcomes are considered
+            "CIRCUIT_BREAKER_MIN_REQUESTS": (int, 10),
+            "CIRCUIT_BREAKER_ERROR_RATE": (float, 0.5), # Failure rate (timeouts, connection errors, 5xx) that opens the breaker
+            "CIRCUIT_BREAKER_OPEN_SECONDS": (float, 30.0), # First pause before a probe; doubles after a failed probe
+            "CIRCUIT_BREAKER_MAX_OPEN_SECONDS": (float, 300.0),
+            "CIRCUIT_BREAKER_HALF_OPEN_PROBES": (int, 1), # Probe requests that must succeed to close the breaker again
+            "CIRCUIT_BREAKER_MAX_WAIT_SECONDS": (float, 3600.0), # A call waiting longer than this fails with LLM_CIRCUIT_OPEN_ERROR
+            "HTTP2_ENABLED": (bool, False), # Requires the optional 'h2' package
+            "HTTP_KEEPALIVE_EXPIRY_SECONDS": (float, 60.0),
+            "WORK_ORDERING": (str, "longest_first"), # "longest_first" = submit items by predicted worker latency, slowest first; "file" = file order
+            "WORK_ORDER_WINDOW": (int, 1000), # Records read and sorted at a time per combination (capped at DATASET_STREAM_WINDOW)
+            "WORK_ORDER_HISTORY_PATH": (str, "./Intermediate/latency_history.json"), # Worker latency per model/prompt/dataset/scenario_code, kept across runs
+            "WORK_ORDER_MIN_SAMPLES": (int, 3), # Items a scenario needs in the history before its own average is used
+            "SAMPLING_MODE": (str, "full"), # "full" = every item; "adaptive" = stratified sample by scenario_code, stopping a combination once its CIs are narrow enough
+            "SAMPLING_SEED": (int, 0), # Seed of the stratified item order; all combinations of a dataset share it
+            "ADAPTIVE_ACCURACY_CI_WIDTH": (float, 10.0), # Target width (high - low, in points) of the accuracy CI
+            "ADAPTIVE_ESI_CI_WIDTH": (float, 5.0), # Target width of the ESI CI
+            "ADAPTIVE_CONFIDENCE": (float, 0.95),
+            "ADAPTIVE_MIN_ITEMS": (int, 100), # Scored items a combination needs before it may stop
+            "SCREENING_ENABLED": (bool, False), # Rank every worker model on a small stratified sample first, then run only the finalists; --screen overrides
+            "SCREENING_ITEMS": (int, 100), # Items per dataset in the screening pass
+            "SCREENING_FINALISTS": (int, 3), # Worker models kept for the full run
+            "SCREENING_JOURNAL_FILE_TEMPLATE": (str, "./Intermediate/Screening/Journal_{dataset_short_name}_{model_id}_{prompt_version}.jsonl"),
+            "SCREENING_REPORT_FILE": (str, "./Result/Screening.json"),
+            "DATASET_STREAM_WINDOW": (int, 2000), # Max records a combination may read ahead of the slowest one on the same dataset
+            "DATASET_INDEX_FILE_TEMPLATE": (str, "./Intermediate/DatasetIndex_{dataset_short_name}.lbidx"),
+            "JOURNAL_FILE_TEMPLATE": (str, "./Intermediate/Journal_{dataset_short_name}_{model_id}_{prompt_version}.jsonl"),
+            "RESPONSE_CACHE_ENABLED": (bool, True),
+            "RESPONSE_CACHE_PATH": (str, "./Intermediate/response_cache.sqlite3"),
+            "RESPONSE_CACHE_MAX_MB": (int, 2048), # 0 = no size cap
+            "RESPONSE_CACHE_MAX_AGE_DAYS": (float, 30.0), # 0 = entries never expire
+            "PRE_JUDGE_ENABLED": (bool, True),
+            "PRE_JUDGE_RELATIVE_TOLERANCE": (float, 0.005), # Decimal answers within this relative difference are a match; integers must be exact
+            "PRE_JUDGE_MISMATCH_TOLERANCE": (float, 0.1), # ...and beyond this one (same unit dimension) a mismatch; in between goes to the LLM judge
+            "SHARD_QUEUE_PATH": (str, "./Intermediate/shard_queue.sqlite3"),
+            "SHARD_SIZE": (int, 100), # Items per shard
+            "SHARD_LEASE_SECONDS": (float, 600.0), # A claimed shard is handed to another worker if not renewed within this time
+            "SHARDS_PER_WORKER": (int, 4), # Shards one worker process runs at the same time
+            "SHARD_RESULT_FILE_TEMPLATE": (str, "./Intermediate/Shards/Shard_{dataset_short_name}_{model_id}_{prompt_version}_{start_id}-{stop_id}.jsonl"),
+            "PROMPT_LAYOUT": (str, "prefix"), # "prefix" = fixed prompt text first (cacheable), item data last; "inline" = templates as written
+            "PROMPT_CACHE_HINTS": (str, "none"), # "cache_control" = mark the fixed prefix with an Anthropic-style cache breakpoint
+            "WORKER_STREAMING": (bool, False), # Stream worker responses (SSE) to record TTFT and tokens/sec
+            "WORKER_STREAM_EARLY_STOP": (bool, True), # With streaming, stop COT generation once the "Final Answer:" line is complete
+            "COLUMNAR_RESULTS_ENABLED": (bool, False), # Also write Parquet scores + text files per combination; requires the optional 'pyarrow' package
+            "COLUMNAR_SCORES_FILE_TEMPLATE": (str, "./Result/Columnar/ESI_Scores_{dataset_short_name}_{model_id}_{prompt_version}.parquet"),
+            "COLUMNAR_TEXT_FILE_TEMPLATE": (str, "./Result/Columnar/ESI_Text_{dataset_short_name}_{model_id}_{prompt_version}.parquet"),
+            "COLUMNAR_ROW_GROUP_SIZE": (int, 50000),
+            "LEADERBOARD_ENABLED": (bool, True), # Update the cross-combination leaderboard as each combination's report is written
+            "LEADERBOARD_FILE": (str, "./Result/Leaderboard.json"), # A Markdown table is written next to it
+            "LEADERBOARD_STATE_PATH": (str, "./Result/Leaderboard_state.json"), # Per-cell statistics kept across runs
+            "LEADERBOARD_BOOTSTRAP_SAMPLES": (int, 1000),
+            "LEADERBOARD_CONFIDENCE": (float, 0.95),
+            "METRICS_PORT": (int, 0), # Serve live metrics in Prometheus text format on this port; 0 = off
+            "METRICS_HOST": (str, "127.0.0.1"),
+            "JUDGE_DEDUP_ENABLED": (bool, True), # Send byte-identical judge requests once per run and share the verdict
+            "JUDGE_DEDUP_MAX_ENTRIES": (int, 200000), # Judge responses kept in memory for dedup (least recently used dropped first)
+            "JUDGE_PACKING_ENABLED": (bool, False), # Judge several items per call (one rubric, a JSON array of verdicts back)
+            "JUDGE_PACK_MAX_ITEMS": (int, 8),
+            "JUDGE_PACK_MAX_PROMPT_TOKENS": (int, 6000), # Estimated prompt size (chars / 4) a pack may grow to
+            "JUDGE_PACK_MAX_WAIT_SECONDS": (float, 0.2), # How long the first item of a pack waits for others
+            "JUDGE_PACK_OUTPUT_TOKENS_PER_ITEM": (int, 400), # max_tokens of a packed call = this x items
+            "COMBINED_JUDGE_MODE": (str, "auto"), # "auto" = one combined judge call when both judges are the same URL + model; "always" / "never"
+            "JUDGE_MODE": (str, "interactive"), # "interactive" or "batch"; --judge-mode overrides
+            "BATCH_API_BASE_URL": (str, ""), # "" = ACCURACY_JUDGE_API_URL without /chat/completions
+            "BATCH_API_TOKEN": (str, ""), # "" = ACCURACY_JUDGE_API_TOKEN
+            "BATCH_ENDPOINT": (str, "/v1/chat/completions"),
+            "BATCH_COMPLETION_WINDOW": (str, "24h"),
+            "BATCH_POLL_INTERVAL_SECONDS": (float, 30.0),
+            "BATCH_MAX_REQUESTS": (int, 50000), # Requests per batch input file
+            "BATCH_REQUESTS_FILE_TEMPLATE": (str, "./Intermediate/BatchJudgeRequests_part{part}.jsonl"),
+            "BATCH_STATE_FILE": (str, "./Intermediate/batch_judge_state.json"),
+        }
+        for key, (expected_type, default_value) in optional_keys_with_defaults.items():
+            value = self.settings.get(key, default_value)
+            if expected_type == float and isinstance(value, int) and not isinstance(value, bool): value = float(value)
+            valid_type = isinstance(value, expected_type) and not (isinstance(value, bool) and expected_type in (int, float))
+            if not valid_type:
+                print(f"FATAL ERROR: For optional key '{key}', expected type '{expected_type.__name__}', got {type(value)} (value: '{value}'). Check '{self.filepath_for_error_reporting}'.")
+                sys.exit(1)
+            setattr(self, key, value)
+        if self.JUDGE_MODE not in ("interactive", "batch"):
+            print(f"FATAL ERROR: JUDGE_MODE must be 'interactive' or 'batch', got '{self.JUDGE_MODE}'. Check '{self.filepath_for_error_reporting}'.")
+            sys.exit(1)
+        if self.PROMPT_LAYOUT not in ("prefix", "inline") or self.PROMPT_CACHE_HINTS not in ("none", "cache_control"):
+            print(f"FATAL ERROR: PROMPT_LAYOUT must be 'prefix' or 'inline' and PROMPT_CACHE_HINTS 'none' or 'cache_control' (got '{self.PROMPT_LAYOUT}', '{self.PROMPT_CACHE_HINTS}'). Check '{self.filepath_for_error_reporting}'.")
+            sys.exit(1)
+        if self.WORK_ORDERING not in ("longest_first", "file"):
+            print(f"FATAL ERROR: WORK_ORDERING must be 'longest_first' or 'file', got '{self.WORK_ORDERING}'. Check '{self.filepath_for_error_reporting}'.")
+            sys.exit(1)
+        if not 0.0 < self.HEDGE_PERCENTILE < 1.0:
+            print(f"FATAL ERROR: HEDGE_PERCENTILE must be between 0 and 1 (exclusive), got {self.HEDGE_PERCENTILE}. Check '{self.filepath_for_error_reporting}'.")
+            sys.exit(1)
+        if not 0.0 < self.LEADERBOARD_CONFIDENCE < 1.0:
+            print(f"FATAL ERROR: LEADERBOARD_CONFIDENCE must be between 0 and 1 (exclusive), got {self.LEADERBOARD_CONFIDENCE}. Check '{self.filepath_for_error_reporting}'.")
+            sys.exit(1)
+        if self.SAMPLING_MODE not in ("full", "adaptive"):
+            print(f"FATAL ERROR: SAMPLING_MODE must be 'full' or 'adaptive', got '{self.SAMPLING_MODE}'. Check '{self.filepath_for_error_reporting}'.")
+            sys.exit(1)
+        if not 0.0 < self.ADAPTIVE_CONFIDENCE < 1.0:
+            print(f"FATAL ERROR: ADAPTIVE_CONFIDENCE must be between 0 and 1 (exclusive), got {self.ADAPTIVE_CONFIDENCE}. Check '{self.filepath_for_error_reporting}'.")
+            sys.exit(1)
+        if self.COMBINED_JUDGE_MODE not in ("auto", "always", "never"):
+            print(f"FATAL ERROR: COMBINED_JUDGE_MODE must be 'auto', 'always' or 'never', got '{self.COMBINED_JUDGE_MODE}'. Check '{self.filepath_for_error_reporting}'.")
+            sys.exit(1)
+
 APP_CONFIG = Config()
 
 def _ensure_base_dir_from_template(template_str_attr_name_on_config: str):
@@ -136,6 +260,8 @@ _ensure_base_dir_from_template('WORKER_OUTPUT_FILE_TEMPLATE')
 _ensure_base_dir_from_template('FINAL_OUTPUT_FILE_TEMPLATE')
 _ensure_base_dir_from_template('SKIPPED_FILE_LOG_TEMPLATE')
 _ensure_base_dir_from_template('SUMMARY_FILE_TEMPLATE')
+_ensure_base_dir_from_template('JOURNAL_FILE_TEMPLATE')
+_ensure_base_dir_from_template('DATASET_INDEX_FILE_TEMPLATE')
 
 if hasattr(APP_CONFIG, 'DATASET_CONFIGS') and isinstance(APP_CONFIG.DATASET_CONFIGS, dict):
     for ds_config_val in APP_CONFIG.DATASET_CONFIGS.values(): # Iterate through values of the dict
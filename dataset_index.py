@@ -0,0 +1,179 @@
+# dataset_index.py
+"""
+Compiles a .jsonl dataset into a preparsed binary index and reads it back with O(1) random access.
+
+File layout (little-endian):
+  header        magic, version, item/scenario counts, source file size + mtime (staleness check) and
+                the positions of the sections below
+  record data   per item: instruction, question, answer, raw_line, parse_error, each as an int32
+                byte length (-1 = None) followed by UTF-8 bytes; raw_line is only stored for items
+                that cannot run, as in dataset_loader.DatasetRecord
+  offset table  one fixed-size entry per item id: data offset, data length, scenario index, flags
+  scenarios     interned scenario_code values (JSON-encoded, so non-string codes keep their type),
+                each followed by the ids of its items
+
+Compile once with `python dataset_index.py L1 L2 ...` (default: DATASETS_TO_RUN); main.py uses an
+index automatically when it is newer than its source file.
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+from typing import Dict, Iterator, List, Optional, Any
+from config import APP_CONFIG
+from dataset_loader import DatasetRecord, iter_dataset_records
+
+INDEX_MAGIC = b"LBIDX\x00\x00\x01"
+INDEX_VERSION = 1
+HEADER_STRUCT = struct.Struct("<8sIIIQqQQQ") # magic, version, item_count, scenario_count, source_size, source_mtime_ns, data_pos, offsets_pos, scenarios_pos
+OFFSET_ENTRY_STRUCT = struct.Struct("<QIIB3x") # data offset, data length, scenario index, flags
+FIELD_LENGTH_STRUCT = struct.Struct("<i")
+COUNT_STRUCT = struct.Struct("<I")
+FLAG_PARSE_ERROR = 1
+
+def dataset_index_path(dataset_short_name: str) -> str:
+    return APP_CONFIG.DATASET_INDEX_FILE_TEMPLATE.format(dataset_short_name=dataset_short_name)
+
+def _encode_field(value: Optional[str]) -> bytes:
+    if value is None: return FIELD_LENGTH_STRUCT.pack(-1)
+    encoded = value.encode("utf-8")
+    return FIELD_LENGTH_STRUCT.pack(len(encoded)) + encoded
+
+def compile_dataset_index(source_path: str, index_path: str) -> int:
+    """Parses every line of `source_path` once and writes the binary index. Returns the number of items."""
+    source_stat = os.stat(source_path)
+    base_dir = os.path.dirname(index_path)
+    if base_dir: os.makedirs(base_dir, exist_ok=True)
+    offset_entries: List[bytes] = []
+    scenario_index_by_key: Dict[str, int] = {}
+    scenario_item_ids: List[List[int]] = []
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as out_f:
+        out_f.write(b"\0" * HEADER_STRUCT.size)
+        data_pos = out_f.tell()
+        for record in iter_dataset_records(source_path):
+            # Non-string fields are stringified the same way the worker prompt would format them.
+            instruction = record.instruction if record.instruction is None or isinstance(record.instruction, str) else str(record.instruction)
+            question = record.question if record.question is None or isinstance(record.question, str) else str(record.question)
+            blob = b"".join(_encode_field(field) for field in (instruction, question, record.answer, record.raw_line, record.parse_error))
+            scenario_key = json.dumps(record.scenario_code, ensure_ascii=False)
+            if scenario_key not in scenario_index_by_key:
+                scenario_index_by_key[scenario_key] = len(scenario_item_ids)
+                scenario_item_ids.append([])
+            scenario_index = scenario_index_by_key[scenario_key]
+            scenario_item_ids[scenario_index].append(record.item_id)
+            offset_entries.append(OFFSET_ENTRY_STRUCT.pack(out_f.tell() - data_pos, len(blob), scenario_index,
+                                                           FLAG_PARSE_ERROR if record.parse_error is not None else 0))
+            out_f.write(blob)
+        offsets_pos = out_f.tell()
+        out_f.write(b"".join(offset_entries))
+        scenarios_pos = out_f.tell()
+        for scenario_key, scenario_index in scenario_index_by_key.items():
+            item_ids = scenario_item_ids[scenario_index]
+            out_f.write(_encode_field(scenario_key))
+            out_f.write(COUNT_STRUCT.pack(len(item_ids)))
+            out_f.write(struct.pack(f"<{len(item_ids)}I", *item_ids))
+        out_f.seek(0)
+        out_f.write(HEADER_STRUCT.pack(INDEX_MAGIC, INDEX_VERSION, len(offset_entries), len(scenario_item_ids),
+                                       source_stat.st_size, source_stat.st_mtime_ns, data_pos, offsets_pos, scenarios_pos))
+    os.replace(tmp_path, index_path)
+    return len(offset_entries)
+
+class DatasetIndex:
+    """Memory-mapped reader for a compiled dataset index. Item ids are the 1-based source line numbers."""
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self._file = open(index_path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.item_count, scenario_count, self.source_size, self.source_mtime_ns,
+         self._data_pos, self._offsets_pos, scenarios_pos) = HEADER_STRUCT.unpack_from(self._mmap, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self.close()
+            raise ValueError(f"'{index_path}' is not a dataset index of version {INDEX_VERSION}.")
+        # Interned scenario codes and their item ids; small enough to hold in memory.
+        self.scenario_codes: List[Any] = []
+        self._scenario_item_ids: Dict[str, List[int]] = {}
+        pos = scenarios_pos
+        for _ in range(scenario_count):
+            scenario_key, pos = self._read_field(pos)
+            (count,) = COUNT_STRUCT.unpack_from(self._mmap, pos); pos += COUNT_STRUCT.size
+            self.scenario_codes.append(json.loads(scenario_key))
+            self._scenario_item_ids[scenario_key] = list(struct.unpack_from(f"<{count}I", self._mmap, pos))
+            pos += 4 * count
+
+    def _read_field(self, pos: int):
+        (length,) = FIELD_LENGTH_STRUCT.unpack_from(self._mmap, pos); pos += FIELD_LENGTH_STRUCT.size
+        if length < 0: return None, pos
+        return self._mmap[pos:pos + length].decode("utf-8"), pos + length
+
+    def is_fresh_for(self, source_path: str) -> bool:
+        try:
+            source_stat = os.stat(source_path)
+        except OSError:
+            return False
+        return source_stat.st_size == self.source_size and source_stat.st_mtime_ns == self.source_mtime_ns
+
+    def get(self, item_id: int) -> DatasetRecord:
+        if not 1 <= item_id <= self.item_count: raise IndexError(f"Item id {item_id} out of range 1..{self.item_count}")
+        data_offset, _, scenario_index, _ = OFFSET_ENTRY_STRUCT.unpack_from(self._mmap, self._offsets_pos + (item_id - 1) * OFFSET_ENTRY_STRUCT.size)
+        pos = self._data_pos + data_offset
+        fields = []
+        for _ in range(5):
+            value, pos = self._read_field(pos)
+            fields.append(value)
+        instruction, question, answer, raw_line, parse_error = fields
+        return DatasetRecord(item_id, instruction, question, answer, self.scenario_codes[scenario_index],
+                             parse_error=parse_error, raw_line=raw_line)
+
+    def iter_range(self, start_id: int = 1, stop_id: Optional[int] = None) -> Iterator[DatasetRecord]:
+        """Records with start_id <= id < stop_id (default: to the end)."""
+        stop_id = self.item_count + 1 if stop_id is None else min(stop_id, self.item_count + 1)
+        for item_id in range(max(1, start_id), stop_id):
+            yield self.get(item_id)
+
+    def ids_for_scenario(self, scenario_code) -> List[int]:
+        return self._scenario_item_ids.get(json.dumps(scenario_code, ensure_ascii=False), [])
+
+    def iter_scenario(self, scenario_code) -> Iterator[DatasetRecord]:
+        for item_id in self.ids_for_scenario(scenario_code):
+            yield self.get(item_id)
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+def open_fresh_dataset_index(dataset_short_name: str, source_path: str) -> Optional[DatasetIndex]:
+    """The compiled index for a dataset, or None when there is none or it is older than the source file."""
+    index_path = dataset_index_path(dataset_short_name)
+    if not os.path.exists(index_path): return None
+    try:
+        index = DatasetIndex(index_path)
+    except (OSError, ValueError, struct.error) as e:
+        print(f"WARNING: Ignoring unreadable dataset index '{index_path}': {e}")
+        return None
+    if not index.is_fresh_for(source_path):
+        print(f"WARNING: Dataset index '{index_path}' is stale (source '{source_path}' changed). Recompile it with: python dataset_index.py {dataset_short_name}")
+        index.close()
+        return None
+    return index
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile DATASET_CONFIGS .jsonl files into binary dataset indexes.")
+    parser.add_argument("datasets", nargs="*", help="Dataset short names to compile (default: DATASETS_TO_RUN).")
+    args = parser.parse_args()
+    for ds_short_name in args.datasets or APP_CONFIG.DATASETS_TO_RUN:
+        dataset_config = APP_CONFIG.DATASET_CONFIGS.get(ds_short_name)
+        if not dataset_config or "path" not in dataset_config:
+            print(f"ERROR: Dataset '{ds_short_name}' is not defined in DATASET_CONFIGS. Skipping.")
+            continue
+        index_path = dataset_index_path(ds_short_name)
+        try:
+            item_count = compile_dataset_index(dataset_config["path"], index_path)
+        except OSError as e:
+            print(f"ERROR: Could not compile dataset '{ds_short_name}' from '{dataset_config['path']}': {e}")
+            continue
+        print(f"Compiled dataset '{ds_short_name}' ({item_count} items) to {index_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# dataset_loader.py
+import asyncio
+import json
+from collections import deque
+from typing import Iterator, List, Optional, Deque
+
+class DatasetRecord:
+    """
+    One dataset item, decoded once and shared by every combination that evaluates it.
+    `parse_error` is set when the line is not a JSON object; `raw_line` is only kept for records that
+    cannot be run (decode error or missing instruction/question) so they can be logged verbatim.
+    """
+    __slots__ = ("item_id", "instruction", "question", "answer", "scenario_code", "parse_error", "raw_line")
+
+    def __init__(self, item_id: int, instruction: Optional[str], question: Optional[str], answer: str,
+                 scenario_code, parse_error: Optional[str] = None, raw_line: Optional[str] = None):
+        self.item_id = item_id
+        self.instruction = instruction
+        self.question = question
+        self.answer = answer
+        self.scenario_code = scenario_code
+        self.parse_error = parse_error
+        self.raw_line = raw_line
+
+    @property
+    def is_complete(self) -> bool:
+        return self.parse_error is None and self.instruction is not None and self.question is not None
+
+def parse_dataset_line(item_id: int, line: str) -> DatasetRecord:
+    """Decodes one .jsonl line. `item_id` is the 1-based line number used as the result id."""
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError as e_json_decode:
+        return DatasetRecord(item_id, None, None, "", "N/A", parse_error=str(e_json_decode), raw_line=line)
+    if not isinstance(data, dict):
+        return DatasetRecord(item_id, None, None, "", "N/A", parse_error=f"expected a JSON object, got {type(data).__name__}", raw_line=line)
+    record = DatasetRecord(item_id, data.get("instruction"), data.get("question"),
+                           str(data.get("answer", "")).strip(), data.get("scenario_code", "N/A"))
+    if not record.is_complete: record.raw_line = line
+    return record
+
+def iter_dataset_records(dataset_path: str, start_id: int = 1, stop_id: Optional[int] = None) -> Iterator[DatasetRecord]:
+    """Streams a .jsonl dataset from disk one line at a time; lines outside [start_id, stop_id) are not decoded."""
+    with open(dataset_path, "r", encoding="utf-8") as f_in:
+        for line_idx, line in enumerate(f_in):
+            if line_idx + 1 < start_id: continue
+            if stop_id is not None and line_idx + 1 >= stop_id: break
+            yield parse_dataset_line(line_idx + 1, line)
+
+def count_dataset_items(dataset_path: str) -> int:
+    """Number of lines (items) in a dataset file, counted in binary chunks without decoding it."""
+    line_count, last_byte = 0, b"\n"
+    with open(dataset_path, "rb") as f_in:
+        for chunk in iter(lambda: f_in.read(1 << 20), b""):
+            line_count += chunk.count(b"\n")
+            last_byte = chunk[-1:]
+    return line_count + (0 if last_byte == b"\n" else 1)
+
+class SharedDatasetReader:
+    """
+    A single streaming pass over one dataset file, shared by every combination that evaluates it.
+    Each record is decoded once and kept only until the slowest cursor has passed it; a cursor that
+    gets more than `window` records ahead of the slowest one waits, so memory stays bounded by the
+    window rather than the dataset size. With a compiled `index` (see dataset_index.py) records are read
+    preparsed from it instead of decoding the .jsonl. `start_id`/`stop_id` restrict the reader to the
+    item ids start_id <= id < stop_id (used for shards).
+    """
+    def __init__(self, dataset_path: str, window: int, index=None, start_id: int = 1, stop_id: Optional[int] = None):
+        self.dataset_path = dataset_path
+        self.window = max(1, window)
+        self.index = index
+        dataset_items = index.item_count if index is not None else count_dataset_items(dataset_path)
+        self.start_id = max(1, start_id)
+        self.stop_id = dataset_items + 1 if stop_id is None else min(stop_id, dataset_items + 1)
+        self.total_items = max(0, self.stop_id - self.start_id)
+        self._records_iter: Optional[Iterator[DatasetRecord]] = None
+        self._exhausted = False
+        self._buffer: Deque[DatasetRecord] = deque()
+        self._buffer_start = 0 # Position (0-based) of self._buffer[0]
+        self._cursor_positions: List[float] = []
+        self._condition: Optional[asyncio.Condition] = None # Created on first use, inside the running event loop
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._condition is None: self._condition = asyncio.Condition()
+        return self._condition
+
+    def open_cursor(self) -> "DatasetCursor":
+        """Registers a consumer. Every cursor must be read to the end or closed, or the others will stall."""
+        self._cursor_positions.append(0)
+        return DatasetCursor(self, len(self._cursor_positions) - 1)
+
+    def _open_records_iter(self) -> Iterator[DatasetRecord]:
+        if self.index is not None: return self.index.iter_range(self.start_id, self.stop_id)
+        return iter_dataset_records(self.dataset_path, self.start_id, self.stop_id)
+
+    def _trim_buffer(self):
+        slowest_position = min(self._cursor_positions)
+        while self._buffer and self._buffer_start < slowest_position:
+            self._buffer.popleft()
+            self._buffer_start += 1
+
+    async def _next_record(self, cursor_index: int) -> Optional[DatasetRecord]:
+        condition = self._get_condition()
+        async with condition:
+            position = self._cursor_positions[cursor_index]
+            while position >= self._buffer_start + len(self._buffer):
+                if self._exhausted: return None
+                if position - min(self._cursor_positions) >= self.window:
+                    await condition.wait()
+                    continue
+                if self._records_iter is None: self._records_iter = self._open_records_iter()
+                record = next(self._records_iter, None)
+                if record is None:
+                    self._exhausted = True
+                    self._records_iter = None
+                else:
+                    self._buffer.append(record)
+            record = self._buffer[position - self._buffer_start]
+            self._cursor_positions[cursor_index] = position + 1
+            self._trim_buffer()
+            condition.notify_all()
+            return record
+
+    async def _close_cursor(self, cursor_index: int):
+        condition = self._get_condition()
+        async with condition:
+            self._cursor_positions[cursor_index] = float("inf")
+            self._trim_buffer()
+            condition.notify_all()
+
+class DatasetCursor:
+    """One combination's view of a SharedDatasetReader; iterate with `async for`."""
+    def __init__(self, reader: SharedDatasetReader, cursor_index: int):
+        self.reader = reader
+        self.cursor_index = cursor_index
+
+    @property
+    def total_items(self) -> int:
+        return self.reader.total_items
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> DatasetRecord:
+        record = await self.reader._next_record(self.cursor_index)
+        if record is None:
+            await self.close()
+            raise StopAsyncIteration
+        return record
+
+    async def close(self):
+        await self.reader._close_cursor(self.cursor_index)
@@ -0,0 +1,95 @@
+# http_pool.py
+import time
+from collections import Counter
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+import httpx
+from config import APP_CONFIG
+from run_stats import record_stat, ratio_or_none
+
+class EndpointPool:
+    """
+    One keep-alive connection pool (httpx.AsyncClient) per API origin, shared by every coroutine on
+    the event loop. New TCP/TLS connections are counted through httpcore's trace hook, so the number of
+    requests that reused a warm connection (and the handshake time they avoided) can be reported.
+    """
+    def __init__(self, origin: str, max_connections: int, http2: bool):
+        self.origin = origin
+        self.stats: Counter = Counter()
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                              keepalive_expiry=APP_CONFIG.HTTP_KEEPALIVE_EXPIRY_SECONDS)
+        self.client = httpx.AsyncClient(limits=limits, http2=http2, timeout=httpx.Timeout(APP_CONFIG.REQUEST_TIMEOUT_SECONDS))
+
+    def _record(self, stat_name: str, amount=1):
+        self.stats[stat_name] += amount
+        record_stat(stat_name, amount)
+
+    def make_trace_hook(self):
+        """Returns a per-request httpcore trace callback that records connection setups and their duration."""
+        handshake_started_at = {}
+        async def _trace(event_name: str, info: Dict[str, Any]):
+            if event_name == "connection.connect_tcp.started":
+                handshake_started_at["t"] = time.perf_counter()
+            elif event_name == "connection.connect_tcp.complete":
+                self._record("http_new_connections")
+                if self.origin.startswith("http://"):
+                    self._record("http_handshake_seconds", time.perf_counter() - handshake_started_at.get("t", time.perf_counter()))
+            elif event_name == "connection.start_tls.complete":
+                self._record("http_handshake_seconds", time.perf_counter() - handshake_started_at.get("t", time.perf_counter()))
+        return _trace
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        self._record("http_requests")
+        return await self.client.post(url, extensions={"trace": self.make_trace_hook()}, **kwargs)
+
+    def stream(self, url: str, **kwargs):
+        """Streaming POST; use as `async with pool.stream(...) as response`. Counted like post()."""
+        self._record("http_requests")
+        return self.client.stream("POST", url, extensions={"trace": self.make_trace_hook()}, **kwargs)
+
+_POOLS: Dict[str, EndpointPool] = {}
+_MAX_CONNECTIONS_PER_ENDPOINT: int = 0
+
+def _http2_available() -> bool:
+    try:
+        import h2 # noqa: F401 (httpx needs the optional 'h2' package for HTTP/2)
+        return True
+    except ImportError:
+        return False
+
+def configure_http_pools(max_connections_per_endpoint: int):
+    """Sets the pool size used for endpoints opened from now on; normally the run's max in-flight items."""
+    global _MAX_CONNECTIONS_PER_ENDPOINT
+    _MAX_CONNECTIONS_PER_ENDPOINT = max_connections_per_endpoint
+
+def get_endpoint_pool(target_api_url: str) -> EndpointPool:
+    parts = urlsplit(target_api_url)
+    origin = f"{parts.scheme}://{parts.netloc}"
+    pool = _POOLS.get(origin)
+    if pool is None:
+        use_http2 = APP_CONFIG.HTTP2_ENABLED
+        if use_http2 and not _http2_available():
+            print(f"WARNING: HTTP2_ENABLED is true but the 'h2' package is not installed (pip install httpx[http2]). Using HTTP/1.1 for {origin}.")
+            use_http2 = False
+        pool = EndpointPool(origin, _MAX_CONNECTIONS_PER_ENDPOINT or APP_CONFIG.MAX_CONCURRENT_ITEMS_PER_COMBO, use_http2)
+        _POOLS[origin] = pool
+    return pool
+
+async def close_http_pools():
+    for pool in _POOLS.values():
+        await pool.client.aclose()
+    _POOLS.clear()
+
+def summarize_connection_stats(stats: Counter) -> Dict[str, Optional[float]]:
+    requests_sent, new_connections = stats.get("http_requests", 0), stats.get("http_new_connections", 0)
+    reused = max(0, requests_sent - new_connections)
+    avg_handshake = stats.get("http_handshake_seconds", 0.0) / new_connections if new_connections else None
+    return {
+        "http_requests": requests_sent, "new_connections": new_connections, "reused_connections": reused,
+        "reuse_rate": ratio_or_none(reused, requests_sent),
+        "average_handshake_seconds": round(avg_handshake, 4) if avg_handshake is not None else None,
+        "estimated_handshake_seconds_saved": round(reused * avg_handshake, 2) if avg_handshake is not None else None
+    }
+
+def summarize_all_endpoint_pools() -> Dict[str, Dict[str, Optional[float]]]:
+    return {origin: summarize_connection_stats(pool.stats) for origin, pool in _POOLS.items()}
@@ -0,0 +1,99 @@
+# judge_dedup.py
+import asyncio
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable
+from config import APP_CONFIG
+from run_stats import record_stat, ratio_or_none
+from response_cache import ResponseCache
+
+JudgeCallResult = Tuple[Optional[str], Optional[Dict[str, int]], Optional[str], Optional[float]]
+
+class JudgeDedup:
+    """
+    Run-wide single-flight map from a judge request (endpoint URL + full request body) to its response.
+    Byte-identical judge inputs - e.g. the same cleaned answer to the same item from two prompt versions,
+    or two items with the same instruction, question and answer - are sent once; later and concurrent
+    callers share the first call's result. Failed calls are not kept, so a later duplicate retries.
+    Unlike the response cache this also covers calls that are in flight at the same time, and it is
+    on even when the persistent cache is off.
+    """
+    def __init__(self, max_entries: int):
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+
+    async def call(self, target_api_url: str, judge_request: Dict[str, Any],
+                   make_call: Callable[[], Awaitable[JudgeCallResult]]) -> JudgeCallResult:
+        key = ResponseCache.make_key(target_api_url, judge_request)
+        record_stat("judge_dedup_requests")
+        future = self._entries.get(key)
+        if future is not None:
+            self._entries.move_to_end(key)
+            record_stat("judge_dedup_hits")
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = future
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        try:
+            result = await make_call()
+        except asyncio.CancelledError:
+            self._entries.pop(key, None)
+            future.cancel()
+            raise
+        except Exception as exc:
+            self._entries.pop(key, None)
+            future.set_exception(exc)
+            future.exception() # Mark as retrieved; waiting duplicates still get it
+            raise
+        if result[2] is not None or result[0] is None: self._entries.pop(key, None)
+        future.set_result(result)
+        return result
+
+    def contains(self, target_api_url: str, judge_request: Dict[str, Any]) -> bool:
+        """Whether a call for this request is in flight or its successful response is kept."""
+        return ResponseCache.make_key(target_api_url, judge_request) in self._entries
+
+    def seed(self, target_api_url: str, judge_request: Dict[str, Any], result: JudgeCallResult):
+        """Keeps a response obtained some other way (e.g. from a packed judge call) for later duplicates of the request."""
+        key = ResponseCache.make_key(target_api_url, judge_request)
+        if key in self._entries: return
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(result)
+        self._entries[key] = future
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+_JUDGE_DEDUP: Optional[JudgeDedup] = None
+
+def get_judge_dedup() -> Optional[JudgeDedup]:
+    """The run-wide dedup map, created on first use. None when JUDGE_DEDUP_ENABLED is false."""
+    global _JUDGE_DEDUP
+    if not APP_CONFIG.JUDGE_DEDUP_ENABLED: return None
+    if _JUDGE_DEDUP is None: _JUDGE_DEDUP = JudgeDedup(APP_CONFIG.JUDGE_DEDUP_MAX_ENTRIES)
+    return _JUDGE_DEDUP
+
+# Normalized instruction + question hash -> (dataset, item id) of the first item seen with it.
+_ITEM_CONTEXT_FIRST_SEEN: Dict[str, Tuple[str, int]] = {}
+
+def item_context_key(instruction: Any, question: Any) -> str:
+    """Hash of the instruction and question with case and whitespace differences removed (near-identical texts collide)."""
+    normalized = "\x00".join(re.sub(r"\s+", " ", str(text)).strip().lower() for text in (instruction, question))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+def record_item_context(dataset_short_name: str, item_id: int, instruction: Any, question: Any) -> bool:
+    """Counts items whose instruction and question repeat an earlier, different item's. Returns True for such a duplicate."""
+    first_seen = _ITEM_CONTEXT_FIRST_SEEN.setdefault(item_context_key(instruction, question), (dataset_short_name, item_id))
+    record_stat("item_contexts")
+    if first_seen == (dataset_short_name, item_id): return False
+    record_stat("duplicate_item_contexts")
+    return True
+
+def summarize_dedup_stats(stats) -> Dict[str, Any]:
+    requests, hits = stats.get("judge_dedup_requests", 0), stats.get("judge_dedup_hits", 0)
+    contexts, duplicate_contexts = stats.get("item_contexts", 0), stats.get("duplicate_item_contexts", 0)
+    return {"enabled": APP_CONFIG.JUDGE_DEDUP_ENABLED, "judge_requests": requests, "judge_requests_deduplicated": hits,
+            "judge_dedup_ratio": ratio_or_none(hits, requests),
+            "items_checked": contexts, "items_with_duplicate_context": duplicate_contexts,
+            "duplicate_context_ratio": ratio_or_none(duplicate_contexts, contexts)}
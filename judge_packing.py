@@ -0,0 +1,169 @@
+# judge_packing.py
+"""
+Packs the judge requests of several items into one call. The judge templates are mostly fixed rubric
+with only a short per-item data section (see prompt_layout.split_template), so a packed request sends
+the system prompt and rubric once, followed by up to JUDGE_PACK_MAX_ITEMS items' data, and asks for a
+JSON array of verdicts keyed by the items' ids within the pack. Requests for the same judge URL, model,
+system prompt and template that arrive within JUDGE_PACK_MAX_WAIT_SECONDS of the first one share a
+pack; a pack is sent early once it is full or the next item would take its estimated prompt past
+JUDGE_PACK_MAX_PROMPT_TOKENS.
+
+An item gets None back - and its caller falls back to the usual single-item call - when its pack
+failed, its entry is missing or malformed, its data alone exceeds the token budget, or it ended up
+alone in its pack. Identical single-item requests that are queued or in flight at the same time share
+one slot and its verdict, like judge dedup does for single-item calls, and count as judge dedup hits
+rather than as packed items.
+
+Packs mix items of different combinations and are sent from their own task, so each packed call is
+counted against the combinations of its items: every item adds 1/len(pack) to packed_judge_calls in
+its own combination's stats (the run total still adds up to the number of calls).
+"""
+import asyncio
+import contextvars
+import json
+import re
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable
+from config import APP_CONFIG
+from prompts import PACKED_JUDGE_INSTRUCTIONS, PACKED_JUDGE_CUE
+from prompt_layout import split_template, fixed_system_message
+from run_stats import record_stat, ratio_or_none
+from response_cache import ResponseCache
+
+JudgeSender = Callable[[str, Dict[str, Any]], Awaitable[Tuple[Optional[str], Optional[Dict[str, int]], Optional[str], Optional[float]]]]
+# Builds one item's verdict from its entry of the packed response (and the pack's response time); None if the entry is unusable.
+EntryParser = Callable[[Dict[str, Any], Optional[float]], Optional[Any]]
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def find_packed_verdicts(response_text: str) -> Dict[str, Dict[str, Any]]:
+    """Entries of a packed judge response by item id: the first JSON array of objects, else every JSON object with an item_id."""
+    decoder = json.JSONDecoder()
+    entries: List[Any] = []
+    for match in re.finditer(r"\[", response_text):
+        try:
+            candidate, _ = decoder.raw_decode(response_text, match.start())
+        except json.JSONDecodeError:
+            continue
+        if isinstance(candidate, list) and any(isinstance(entry, dict) for entry in candidate):
+            entries = candidate
+            break
+    if not entries: # e.g. a truncated array: take the complete objects it does contain
+        for match in re.finditer(r"\{", response_text):
+            try:
+                candidate, _ = decoder.raw_decode(response_text, match.start())
+            except json.JSONDecodeError:
+                continue
+            if isinstance(candidate, dict) and "item_id" in candidate: entries.append(candidate)
+    return {str(entry["item_id"]).strip(): entry for entry in entries if isinstance(entry, dict) and "item_id" in entry}
+
+class _OpenPack:
+    __slots__ = ("context", "items", "prompt_tokens", "timer")
+
+    def __init__(self, context: Tuple):
+        self.context = context # (template parts, entry parser, sender)
+        self.items: List[Tuple[str, asyncio.Future, contextvars.Context]] = [] # (item data text, future for its verdict, caller's context)
+        self.prompt_tokens = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+class JudgePacker:
+    def __init__(self, max_items: int, max_prompt_tokens: int, max_wait_seconds: float, output_tokens_per_item: int):
+        self.max_items, self.max_prompt_tokens = max(2, max_items), max_prompt_tokens
+        self.max_wait_seconds, self.output_tokens_per_item = max_wait_seconds, output_tokens_per_item
+        self._open_packs: Dict[Tuple, _OpenPack] = {}
+        self._send_tasks = set()
+        self._item_futures: Dict[str, asyncio.Future] = {} # Single-item request key -> verdict of its queued or in-flight slot
+
+    async def judge(self, target_api_url: str, judge_request: Dict[str, Any], system_prompt: str, template: str,
+                    template_variables: Dict[str, Any], parse_entry: EntryParser, send: JudgeSender) -> Optional[Any]:
+        """
+        The item's verdict from a packed call, or None if it must be judged on its own. `judge_request`
+        is the single-item request body; its model, temperature and top_p are used for the pack.
+        """
+        item_key = ResponseCache.make_key(target_api_url, judge_request)
+        if item_key in self._item_futures:
+            # Shares the verdict of an identical item's slot: a judge dedup hit, not another item of that pack (which
+            # would push items per packed call past JUDGE_PACK_MAX_ITEMS).
+            verdict = await asyncio.shield(self._item_futures[item_key])
+            if verdict is None:
+                record_stat("packed_judge_fallbacks")
+            else:
+                record_stat("judge_dedup_requests"); record_stat("judge_dedup_hits")
+            return verdict
+        verdict = await self._judge_in_pack(target_api_url, judge_request, item_key, system_prompt, template, template_variables, parse_entry, send)
+        record_stat("packed_judge_items" if verdict is not None else "packed_judge_fallbacks")
+        return verdict
+
+    async def _judge_in_pack(self, target_api_url: str, judge_request: Dict[str, Any], item_key: str, system_prompt: str, template: str,
+                             template_variables: Dict[str, Any], parse_entry: EntryParser, send: JudgeSender) -> Optional[Any]:
+        parts = split_template(template)
+        if parts is None: return None
+        item_text = parts.data_template.format(**template_variables)
+        item_tokens = estimate_tokens(item_text)
+        if item_tokens > self.max_prompt_tokens: return None
+        pack_key = (target_api_url, judge_request["model"], judge_request["temperature"], judge_request["top_p"], system_prompt, template)
+        pack = self._open_packs.get(pack_key)
+        if pack is not None and pack.prompt_tokens + item_tokens > self.max_prompt_tokens:
+            self._flush(pack_key)
+            pack = None
+        if pack is None:
+            pack = self._open_packs[pack_key] = _OpenPack((parts, parse_entry, send))
+            pack.prompt_tokens = estimate_tokens(system_prompt) + estimate_tokens(parts.static_prefix)
+            pack.timer = asyncio.get_running_loop().call_later(self.max_wait_seconds, self._flush, pack_key)
+        future = self._item_futures[item_key] = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda _: self._item_futures.pop(item_key, None))
+        pack.items.append((item_text, future, contextvars.copy_context()))
+        pack.prompt_tokens += item_tokens
+        if len(pack.items) >= self.max_items: self._flush(pack_key)
+        return await future
+
+    def _flush(self, pack_key: Tuple):
+        pack = self._open_packs.pop(pack_key, None)
+        if pack is None: return
+        if pack.timer is not None: pack.timer.cancel()
+        task = asyncio.get_running_loop().create_task(self._send_pack(pack_key, pack))
+        self._send_tasks.add(task)
+        task.add_done_callback(self._send_tasks.discard)
+
+    async def _send_pack(self, pack_key: Tuple, pack: _OpenPack):
+        parts, parse_entry, send = pack.context
+        target_api_url, model, temperature, top_p, system_prompt, _ = pack_key
+        verdicts: List[Optional[Any]] = [None] * len(pack.items)
+        try:
+            if len(pack.items) > 1:
+                user_text = "\n\n".join(f"=== Item {index} ===\n{item_text}" for index, (item_text, _, _) in enumerate(pack.items, start=1))
+                messages = [fixed_system_message(f"{system_prompt}\n\n{parts.static_prefix}\n\n{PACKED_JUDGE_INSTRUCTIONS}"),
+                            {"role": "user", "content": f"{user_text}\n\n{PACKED_JUDGE_CUE.format(item_count=len(pack.items))}"}]
+                packed_request = {"model": model, "messages": messages, "max_tokens": self.output_tokens_per_item * len(pack.items),
+                                  "temperature": temperature, "top_p": top_p}
+                for _, _, item_context in pack.items: item_context.run(record_stat, "packed_judge_calls", 1 / len(pack.items))
+                response_text, _, api_error, response_time = await send(target_api_url, packed_request)
+                if api_error or not response_text or response_text.startswith("LLM_"):
+                    print(f"\nJUDGE_WARNING (PACKED): Packed judge call for {len(pack.items)} items failed ({api_error or response_text}); judging them one by one.")
+                else:
+                    entries = find_packed_verdicts(response_text)
+                    for index in range(len(pack.items)):
+                        entry = entries.get(str(index + 1))
+                        if entry is not None: verdicts[index] = parse_entry(entry, response_time)
+        except Exception as e_pack:
+            print(f"\nJUDGE_WARNING (PACKED): Unexpected error in a packed judge call for {len(pack.items)} items ({e_pack}); judging them one by one.")
+        finally:
+            for (_, future, _), verdict in zip(pack.items, verdicts):
+                if not future.done(): future.set_result(verdict)
+
+_JUDGE_PACKER: Optional[JudgePacker] = None
+
+def get_judge_packer() -> Optional[JudgePacker]:
+    """The run-wide packer, created on first use. None when JUDGE_PACKING_ENABLED is false."""
+    global _JUDGE_PACKER
+    if not APP_CONFIG.JUDGE_PACKING_ENABLED: return None
+    if _JUDGE_PACKER is None:
+        _JUDGE_PACKER = JudgePacker(APP_CONFIG.JUDGE_PACK_MAX_ITEMS, APP_CONFIG.JUDGE_PACK_MAX_PROMPT_TOKENS,
+                                    APP_CONFIG.JUDGE_PACK_MAX_WAIT_SECONDS, APP_CONFIG.JUDGE_PACK_OUTPUT_TOKENS_PER_ITEM)
+    return _JUDGE_PACKER
+
+def summarize_packing_stats(stats) -> Dict[str, Any]:
+    calls, packed_items, fallbacks = stats.get("packed_judge_calls", 0), stats.get("packed_judge_items", 0), stats.get("packed_judge_fallbacks", 0)
+    return {"enabled": APP_CONFIG.JUDGE_PACKING_ENABLED, "packed_calls": round(calls, 2), "items_judged_in_packs": packed_items,
+            "items_per_packed_call": round(packed_items / calls, 2) if calls else None,
+            "single_item_fallbacks": fallbacks, "fallback_rate": ratio_or_none(fallbacks, packed_items + fallbacks)}
@@ -0,0 +1,191 @@
+# leaderboard.py
+"""
+Cross-combination leaderboard: model x prompt x dataset x scenario_code cells with the mean ESI and
+accuracy of their COMPLETED items and bootstrap confidence intervals, plus an overall model x prompt
+ranking. It is updated incrementally: when a combination's report is written, only that combination's
+cells are recomputed from its items, and every other cell's statistics come from the state file
+(LEADERBOARD_STATE_PATH), so the report (LEADERBOARD_FILE + a Markdown table next to it) is rewritten
+without re-reading any result file. The state survives across runs, so combinations evaluated in
+different runs end up on the same leaderboard; a rerun of a combination replaces its cells.
+
+The overall row of a model x prompt combines its per-dataset cells: the mean is item-weighted and the
+interval uses the combined bootstrap standard errors (normal approximation).
+
+    python leaderboard.py show
+    python leaderboard.py rebuild ./Result        # full rescan of ESI_Result files, e.g. after deleting some
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+import zlib
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+from config import APP_CONFIG
+
+ALL_SCENARIOS = "ALL"
+
+def bootstrap_interval(values: List[float], samples: int, confidence: float, rng: random.Random) -> Tuple[float, float, float]:
+    """(low, high, standard error) of the mean of `values` from `samples` percentile-bootstrap resamples."""
+    if len(values) < 2: return (values[0], values[0], 0.0) if values else (math.nan, math.nan, math.nan)
+    item_count = len(values)
+    resampled_means = sorted(sum(rng.choices(values, k=item_count)) / item_count for _ in range(max(1, samples)))
+    tail = (1.0 - confidence) / 2.0
+    low_index = min(len(resampled_means) - 1, max(0, int(math.floor(tail * len(resampled_means)))))
+    high_index = min(len(resampled_means) - 1, max(0, int(math.ceil((1.0 - tail) * len(resampled_means))) - 1))
+    return resampled_means[low_index], resampled_means[high_index], statistics.pstdev(resampled_means)
+
+def cell_statistics(esi_values: List[float], accuracy_values: List[float], samples: int, confidence: float, seed_text: str) -> Dict[str, Any]:
+    # Seeded from the cell's key, so an unchanged cell gets the same interval when it is recomputed.
+    rng = random.Random(zlib.crc32(seed_text.encode("utf-8")))
+    esi_low, esi_high, esi_standard_error = bootstrap_interval(esi_values, samples, confidence, rng)
+    accuracy_low, accuracy_high, _ = bootstrap_interval(accuracy_values, samples, confidence, rng)
+    return {"items": len(esi_values), "mean_esi": round(statistics.fmean(esi_values), 3),
+            "esi_ci": [round(esi_low, 3), round(esi_high, 3)], "esi_standard_error": round(esi_standard_error, 4),
+            "mean_accuracy": round(statistics.fmean(accuracy_values), 3), "accuracy_ci": [round(accuracy_low, 3), round(accuracy_high, 3)]}
+
+class Leaderboard:
+    def __init__(self, state_path: str, report_path: str, samples: int, confidence: float):
+        self.state_path, self.report_path = state_path, report_path
+        self.samples, self.confidence = samples, confidence
+        self.combos: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(state_path):
+            try:
+                with open(state_path, "r", encoding="utf-8") as f_state:
+                    self.combos = json.load(f_state).get("combos", {})
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"WARNING: Could not read the leaderboard state '{state_path}' ({e}); starting a new leaderboard.")
+
+    def update_combination(self, dataset_short_name: str, worker_model_id: str, prompt_version: str,
+                           scored_items: Iterable[Tuple[Any, float, float]]):
+        """Replaces one combination's cells from its COMPLETED items, given as (scenario_code, esi_score, s_accuracy)."""
+        values_by_scenario: Dict[str, Tuple[List[float], List[float]]] = {}
+        for scenario_code, esi_score, accuracy_score in scored_items:
+            for scenario_key in (str(scenario_code), ALL_SCENARIOS):
+                esi_values, accuracy_values = values_by_scenario.setdefault(scenario_key, ([], []))
+                esi_values.append(float(esi_score)); accuracy_values.append(float(accuracy_score))
+        combo_key = f"{dataset_short_name}|{worker_model_id}|{prompt_version}"
+        cells = {scenario_key: cell_statistics(esi_values, accuracy_values, self.samples, self.confidence, f"{combo_key}|{scenario_key}")
+                 for scenario_key, (esi_values, accuracy_values) in values_by_scenario.items()}
+        self.combos[combo_key] = {"dataset_short_name": dataset_short_name, "worker_model_id": worker_model_id, "prompt_version": prompt_version,
+                                  "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "cells": cells}
+
+    def overall_ranking(self) -> List[Dict[str, Any]]:
+        z_value = statistics.NormalDist().inv_cdf((1.0 + self.confidence) / 2.0)
+        totals: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for combo in self.combos.values():
+            all_cell = combo["cells"].get(ALL_SCENARIOS)
+            if all_cell: totals.setdefault((combo["worker_model_id"], combo["prompt_version"]), []).append(dict(all_cell, dataset=combo["dataset_short_name"]))
+        ranking = []
+        for (worker_model_id, prompt_version), dataset_cells in totals.items():
+            item_count = sum(cell["items"] for cell in dataset_cells)
+            mean_esi = sum(cell["items"] * cell["mean_esi"] for cell in dataset_cells) / item_count
+            standard_error = math.sqrt(sum((cell["items"] / item_count) ** 2 * cell["esi_standard_error"] ** 2 for cell in dataset_cells))
+            ranking.append({"worker_model_id": worker_model_id, "prompt_version": prompt_version, "items": item_count,
+                            "datasets": sorted(cell["dataset"] for cell in dataset_cells), "mean_esi": round(mean_esi, 3),
+                            "esi_ci": [round(mean_esi - z_value * standard_error, 3), round(mean_esi + z_value * standard_error, 3)],
+                            "mean_accuracy": round(sum(cell["items"] * cell["mean_accuracy"] for cell in dataset_cells) / item_count, 3)})
+        ranking.sort(key=lambda row: row["mean_esi"], reverse=True)
+        for rank, row in enumerate(ranking, start=1): row["rank"] = rank
+        return ranking
+
+    def report(self) -> Dict[str, Any]:
+        cells = [{"worker_model_id": combo["worker_model_id"], "prompt_version": combo["prompt_version"],
+                  "dataset_short_name": combo["dataset_short_name"], "scenario_code": scenario_key, **cell}
+                 for combo in self.combos.values() for scenario_key, cell in combo["cells"].items()]
+        cells.sort(key=lambda cell: (cell["dataset_short_name"], cell["scenario_code"] != ALL_SCENARIOS, cell["scenario_code"], -cell["mean_esi"]))
+        return {"updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "confidence": self.confidence, "bootstrap_samples": self.samples,
+                "overall": self.overall_ranking(), "cells": cells}
+
+    def _markdown(self, report: Dict[str, Any]) -> str:
+        confidence_label = f"{self.confidence:.0%} CI"
+        lines = [f"# Lunar-Bench Leaderboard", "", f"Updated {report['updated_at']}. ESI means of COMPLETED items with {confidence_label}.", "",
+                 f"| Rank | Model | Prompt | Items | ESI | {confidence_label} | ACC |", "|---|---|---|---|---|---|---|"]
+        lines += [f"| {row['rank']} | {row['worker_model_id']} | {row['prompt_version']} | {row['items']} | {row['mean_esi']:.2f} | "
+                  f"{row['esi_ci'][0]:.2f} - {row['esi_ci'][1]:.2f} | {row['mean_accuracy']:.1f} |" for row in report["overall"]]
+        for dataset_short_name in sorted({cell["dataset_short_name"] for cell in report["cells"]}):
+            lines += ["", f"## {dataset_short_name}", "", f"| Model | Prompt | Scenario | Items | ESI | {confidence_label} | ACC |", "|---|---|---|---|---|---|---|"]
+            lines += [f"| {cell['worker_model_id']} | {cell['prompt_version']} | {cell['scenario_code']} | {cell['items']} | {cell['mean_esi']:.2f} | "
+                      f"{cell['esi_ci'][0]:.2f} - {cell['esi_ci'][1]:.2f} | {cell['mean_accuracy']:.1f} |"
+                      for cell in report["cells"] if cell["dataset_short_name"] == dataset_short_name]
+        return "\n".join(lines) + "\n"
+
+    def save(self) -> Dict[str, Any]:
+        """Writes the state and the JSON + Markdown report; returns the report."""
+        report = self.report()
+        for path, content in ((self.state_path, json.dumps({"combos": self.combos}, ensure_ascii=False)),
+                              (self.report_path, json.dumps(report, indent=4, ensure_ascii=False)),
+                              (os.path.splitext(self.report_path)[0] + ".md", self._markdown(report))):
+            if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as f_out: f_out.write(content)
+            os.replace(path + ".tmp", path)
+        return report
+
+_LEADERBOARD: Optional[Leaderboard] = None
+
+def get_leaderboard() -> Optional[Leaderboard]:
+    """The run's leaderboard, loaded from its state file on first use. None when LEADERBOARD_ENABLED is false."""
+    global _LEADERBOARD
+    if not APP_CONFIG.LEADERBOARD_ENABLED: return None
+    if _LEADERBOARD is None:
+        _LEADERBOARD = Leaderboard(APP_CONFIG.LEADERBOARD_STATE_PATH, APP_CONFIG.LEADERBOARD_FILE,
+                                   APP_CONFIG.LEADERBOARD_BOOTSTRAP_SAMPLES, APP_CONFIG.LEADERBOARD_CONFIDENCE)
+    return _LEADERBOARD
+
+def print_overall_ranking(report: Dict[str, Any], limit: int = 10):
+    print(f"Leaderboard (mean ESI, {report['confidence']:.0%} CI) over {len(report['cells'])} cell(s):")
+    for row in report["overall"][:limit]:
+        print(f"  {row['rank']:>2}. {row['worker_model_id']} / {row['prompt_version']}: {row['mean_esi']:.2f} "
+              f"[{row['esi_ci'][0]:.2f}, {row['esi_ci'][1]:.2f}], ACC {row['mean_accuracy']:.1f} ({row['items']} items, {', '.join(row['datasets'])})")
+
+def scored_items_of_result_file(path: str) -> Tuple[Optional[Tuple[str, str, str]], List[Tuple[Any, float, float]]]:
+    """((dataset, model, prompt), [(scenario_code, esi_score, s_accuracy), ...] of COMPLETED rows) of one ESI_Result file."""
+    combo_values, scored_items = None, []
+    with open(path, "r", encoding="utf-8") as f_in:
+        for line in f_in:
+            if not line.strip(): continue
+            item_result = json.loads(line)
+            if item_result.get("status") != "COMPLETED": continue
+            if combo_values is None:
+                combo_values = (item_result["dataset_short_name"], item_result["worker_model_id"], item_result["worker_prompt_version"])
+            scored_items.append((item_result.get("scenario_code", "N/A"), item_result.get("esi_score", 0.0), item_result.get("s_accuracy", 0.0)))
+    return combo_values, scored_items
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Cross-combination ESI leaderboard.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("show", help="Print the current leaderboard.")
+    rebuild_parser = subparsers.add_parser("rebuild", help="Rebuild the leaderboard from ESI_Result files (replaces the state).")
+    rebuild_parser.add_argument("inputs", nargs="*", help="ESI_Result .jsonl files or directories; defaults to every file matching FINAL_OUTPUT_FILE_TEMPLATE.")
+    args = parser.parse_args(argv)
+    leaderboard = Leaderboard(APP_CONFIG.LEADERBOARD_STATE_PATH, APP_CONFIG.LEADERBOARD_FILE,
+                              APP_CONFIG.LEADERBOARD_BOOTSTRAP_SAMPLES, APP_CONFIG.LEADERBOARD_CONFIDENCE)
+    if args.command == "rebuild":
+        if args.inputs:
+            paths = [path for input_path in args.inputs
+                     for path in (sorted(glob.glob(os.path.join(input_path, "ESI_Result_*.jsonl"))) if os.path.isdir(input_path) else [input_path])]
+        else:
+            paths = sorted(glob.glob(APP_CONFIG.FINAL_OUTPUT_FILE_TEMPLATE.format(dataset_short_name="*", model_id="*", prompt_version="*")))
+        leaderboard.combos = {}
+        for path in paths:
+            combo_values, scored_items = scored_items_of_result_file(path)
+            if combo_values is None:
+                print(f"Skipped {path}: no COMPLETED items.")
+                continue
+            leaderboard.update_combination(*combo_values, scored_items)
+        report = leaderboard.save()
+        print(f"Rebuilt the leaderboard from {len(paths)} file(s): {leaderboard.report_path}")
+    else:
+        if not leaderboard.combos:
+            print(f"The leaderboard is empty ({leaderboard.state_path} has no combinations yet).")
+            return 0
+        report = leaderboard.report()
+    print_overall_ranking(report, limit=len(report["overall"]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
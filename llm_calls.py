@@ -1,37 +1,96 @@
 # llm_calls.py
-import requests
+import httpx
 import time
 import json
 import re
-from typing import Tuple, Optional, Dict, Any
+from typing import Tuple, Optional, Dict, Any, Callable
 from config import APP_CONFIG 
 from prompts import PROMPT_FOR_JUDGE_LLM_TRUE_INTEGRITY_TEMPLATE # Only Integrity prompt needed here directly
+from response_cache import ResponseCache, get_response_cache
+from run_stats import record_stat
+from run_metrics import observe, timed, in_flight
+from prompt_layout import build_prompt_messages, cached_prompt_tokens
+from judge_dedup import get_judge_dedup
+from judge_packing import get_judge_packer
+from http_pool import get_endpoint_pool
+from rate_limiter import get_endpoint_limiter, parse_retry_after, backoff_before_retry
+from circuit_breaker import get_endpoint_circuit_breaker, CircuitOpenError
+from request_hedging import hedged_call, record_request_latency
 
-def call_llm_api(target_api_url: str, 
+def _request_headers(target_api_url: str, target_api_token: str) -> Dict[str, str]:
+    headers = {"Authorization": f"Bearer {target_api_token}", "Content-Type": "application/json"}
+    
+    if "openrouter.ai" in target_api_url: # Add OpenRouter specific headers
+        if hasattr(APP_CONFIG, 'OPENROUTER_HTTP_REFERER') and APP_CONFIG.OPENROUTER_HTTP_REFERER:
+            headers["HTTP-Referer"] = APP_CONFIG.OPENROUTER_HTTP_REFERER
+        if hasattr(APP_CONFIG, 'OPENROUTER_X_TITLE') and APP_CONFIG.OPENROUTER_X_TITLE:
+            headers["X-Title"] = APP_CONFIG.OPENROUTER_X_TITLE
+    return headers
+
+async def call_llm_api(target_api_url: str, 
                  target_api_token: str, 
                  model_id: str,
                  messages: list,
                  max_tokens: int,
                  temperature: float,
                  top_p: float) -> Tuple[Optional[str], Optional[Dict[str, int]], Optional[str], Optional[float]]:
-    payload = {
+    """Chat-completion call with caching, rate limiting and retries; with HEDGE_ENABLED slow calls get a duplicate (see request_hedging.py)."""
+    return await hedged_call(target_api_url, model_id, lambda: _call_llm_api_with_retries(
+        target_api_url, target_api_token, model_id, messages, max_tokens, temperature, top_p))
+
+def _completion_payload(model_id: str, messages: list, max_tokens: int, temperature: float, top_p: float) -> Dict[str, Any]:
+    """Request body of a non-streaming call; also what its response cache key is made from."""
+    return {
         "model": model_id, "messages": messages, "max_tokens": max_tokens,
         "temperature": temperature, "top_p": top_p, "stream": False 
     }
-    headers = {"Authorization": f"Bearer {target_api_token}", "Content-Type": "application/json"}
-    
-    if "openrouter.ai" in target_api_url: # Add OpenRouter specific headers
-        if hasattr(APP_CONFIG, 'OPENROUTER_HTTP_REFERER') and APP_CONFIG.OPENROUTER_HTTP_REFERER:
-            headers["HTTP-Referer"] = APP_CONFIG.OPENROUTER_HTTP_REFERER
-        if hasattr(APP_CONFIG, 'OPENROUTER_X_TITLE') and APP_CONFIG.OPENROUTER_X_TITLE:
-            headers["X-Title"] = APP_CONFIG.OPENROUTER_X_TITLE
+
+async def _call_llm_api_with_retries(target_api_url: str, target_api_token: str, model_id: str, messages: list,
+                                     max_tokens: int, temperature: float, top_p: float
+                                     ) -> Tuple[Optional[str], Optional[Dict[str, int]], Optional[str], Optional[float]]:
+    payload = _completion_payload(model_id, messages, max_tokens, temperature, top_p)
+    headers = _request_headers(target_api_url, target_api_token)
+
+    response_cache = get_response_cache()
+    cache_key = ResponseCache.make_key(target_api_url, payload) if response_cache else None
+    if response_cache:
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            record_stat("cache_hits")
+            cached_content, cached_usage_data, cached_response_time = cached_response
+            return cached_content, cached_usage_data, None, cached_response_time
+        record_stat("cache_misses")
 
     raw_response_content_for_error = ""
     start_time = time.time(); response_time_seconds = None 
+    endpoint_pool = get_endpoint_pool(target_api_url)
+    endpoint_limiter = get_endpoint_limiter(target_api_url)
+    circuit_breaker = get_endpoint_circuit_breaker(target_api_url)
     for attempt in range(APP_CONFIG.MAX_RETRIES): 
         response_obj = None 
         try:
-            response_obj = requests.post(target_api_url, headers=headers, json=payload, timeout=APP_CONFIG.REQUEST_TIMEOUT_SECONDS) 
+            is_probe = await circuit_breaker.before_request(); request_failed = None
+            try:
+                with timed("rate_limit_wait_seconds", model=model_id):
+                    await endpoint_limiter.acquire()
+                request_start_time = time.time()
+                try:
+                    with in_flight("llm_requests_in_flight", model=model_id):
+                        response_obj = await endpoint_pool.post(target_api_url, headers=headers, json=payload) 
+                    request_failed = response_obj.status_code >= 500
+                except httpx.TransportError:
+                    request_failed = True
+                    raise
+                finally:
+                    request_seconds = time.time() - request_start_time
+                    observe("llm_request_seconds", request_seconds, model=model_id)
+                    await endpoint_limiter.release(
+                        response_obj.status_code if response_obj is not None else None, request_seconds,
+                        parse_retry_after(response_obj.headers.get("Retry-After")) if response_obj is not None else None
+                    )
+            finally:
+                # Also on cancellation (e.g. the losing call of a hedge) while waiting for the limiter, so a probe grant is never kept.
+                await circuit_breaker.record_result(is_probe, request_failed)
             response_time_seconds = time.time() - start_time
             response_obj.raise_for_status()
             response_data = response_obj.json()
@@ -42,18 +101,25 @@ def call_llm_api(target_api_url: str,
                 if message_obj:
                     content = message_obj.get("content", "")
                     usage_data = response_data.get("usage")
+                    if usage_data:
+                        record_stat("api_prompt_tokens", usage_data.get("prompt_tokens") or 0)
+                        record_stat("api_cached_prompt_tokens", cached_prompt_tokens(usage_data) or 0)
+                        if usage_data.get("completion_tokens") and request_seconds > 0:
+                            observe("completion_tokens_per_second", usage_data["completion_tokens"] / request_seconds, model=model_id)
+                    record_request_latency(target_api_url, model_id, request_seconds)
+                    if response_cache: response_cache.put(cache_key, content, usage_data, response_time_seconds)
                     return content, usage_data, None, response_time_seconds
             error_msg = f"API response from {model_id} at {target_api_url} lacked expected content."
             print(f"\nAPI_CALL_ERROR: {error_msg} (Attempt {attempt+1}/{APP_CONFIG.MAX_RETRIES}) Response: {response_data}")
             raw_response_content_for_error = f"LLM_RESPONSE_STRUCTURE_ERROR: {response_data}"
-            if attempt < APP_CONFIG.MAX_RETRIES - 1: time.sleep(APP_CONFIG.RETRY_DELAY_SECONDS * (attempt + 1))
+            if attempt < APP_CONFIG.MAX_RETRIES - 1: await backoff_before_retry(attempt, endpoint_limiter)
             else: return None, None, raw_response_content_for_error, response_time_seconds
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             if response_time_seconds is None: response_time_seconds = time.time() - start_time
             error_msg = f"API Request to {model_id} at {target_api_url} Failed (Attempt {attempt+1}/{APP_CONFIG.MAX_RETRIES}): {type(e).__name__} - {e}"
             print(f"\nAPI_CALL_ERROR: {error_msg}")
             raw_response_content_for_error = f"LLM_API_REQUEST_ERROR: {e}"
-            if attempt < APP_CONFIG.MAX_RETRIES - 1: time.sleep(APP_CONFIG.RETRY_DELAY_SECONDS * (attempt + 1))
+            if attempt < APP_CONFIG.MAX_RETRIES - 1: await backoff_before_retry(attempt, endpoint_limiter)
             else: return None, None, raw_response_content_for_error, response_time_seconds
         except json.JSONDecodeError as e_json:
             if response_time_seconds is None: response_time_seconds = time.time() - start_time
@@ -61,37 +127,248 @@ def call_llm_api(target_api_url: str,
             error_msg = f"Error decoding API JSON from {model_id} at {target_api_url} (Attempt {attempt+1}/{APP_CONFIG.MAX_RETRIES}): {e_json}. Text: {resp_text[:500]}"
             print(f"\nAPI_CALL_ERROR: {error_msg}")
             raw_response_content_for_error = f"LLM_JSON_DECODE_ERROR: {e_json}. Raw: {resp_text[:500]}"
-            if attempt < APP_CONFIG.MAX_RETRIES - 1: time.sleep(APP_CONFIG.RETRY_DELAY_SECONDS * (attempt + 1))
+            if attempt < APP_CONFIG.MAX_RETRIES - 1: await backoff_before_retry(attempt, endpoint_limiter)
             else: return None, None, raw_response_content_for_error, response_time_seconds
+        except CircuitOpenError as e_circuit:
+            print(f"\nAPI_CALL_ERROR: {e_circuit}")
+            return None, None, f"LLM_CIRCUIT_OPEN_ERROR: {e_circuit}", response_time_seconds
         except Exception as e_inner:
             if response_time_seconds is None: response_time_seconds = time.time() - start_time
             resp_text = response_obj.text if response_obj and hasattr(response_obj, 'text') else "N/A"
             error_msg = f"Unexpected error processing API response from {model_id} at {target_api_url} (Attempt {attempt+1}/{APP_CONFIG.MAX_RETRIES}): {type(e_inner).__name__} - {e_inner}. Text: {resp_text[:200]}"
             print(f"\nAPI_CALL_ERROR: {error_msg}")
             raw_response_content_for_error = f"LLM_UNEXPECTED_PROCESSING_ERROR: {e_inner}. Raw: {resp_text[:200]}"
-            if attempt < APP_CONFIG.MAX_RETRIES - 1: time.sleep(APP_CONFIG.RETRY_DELAY_SECONDS * (attempt + 1))
+            if attempt < APP_CONFIG.MAX_RETRIES - 1: await backoff_before_retry(attempt, endpoint_limiter)
             else: return None, None, raw_response_content_for_error, response_time_seconds
     return None, None, f"Max retries reached for {model_id} at {target_api_url}.", response_time_seconds
 
-def get_accuracy_verdict(instruction: str, question: str, 
-                         reference_answer: str, candidate_answer: str,
-                         accuracy_judge_prompt_template_string: str) -> Tuple[bool, str, str, Optional[float]]:
-    judge_prompt_filled = accuracy_judge_prompt_template_string.format(
-        instruction=instruction, question=question,
+_COT_FINAL_ANSWER_LINE_RE = re.compile(r"Final Answer:[ \t]*\S[^\n]*\n", re.IGNORECASE)
+
+def cot_final_answer_end(text_so_far: str) -> Optional[int]:
+    """Early-stop condition for COT workers: the end of the 'Final Answer: ...' line once a newline completes it, else None."""
+    match = _COT_FINAL_ANSWER_LINE_RE.search(text_so_far)
+    return match.end() if match else None
+
+async def stream_llm_api(target_api_url: str,
+                         target_api_token: str,
+                         model_id: str,
+                         messages: list,
+                         max_tokens: int,
+                         temperature: float,
+                         top_p: float,
+                         stop_when: Optional[Callable[[str], Optional[int]]] = None
+                        ) -> Tuple[Optional[str], Optional[Dict[str, int]], Optional[str], Optional[float], Dict[str, Any]]:
+    """
+    Streaming (SSE) variant of call_llm_api. Returns the same four values plus stream metrics:
+    ttft_seconds (time to the first content chunk), tokens_per_second (completion tokens over the time
+    after the first chunk), stopped_early and completion_tokens_estimated. `stop_when(text_so_far)` is
+    checked whenever a chunk contains a newline; once it returns a position the text is cut there and
+    the stream is closed, which makes the server stop generating. The server then never sends its usage, so completion tokens are estimated
+    from the number of content chunks (about one token each).
+    """
+    payload = {
+        "model": model_id, "messages": messages, "max_tokens": max_tokens,
+        "temperature": temperature, "top_p": top_p, "stream": True, "stream_options": {"include_usage": True}
+    }
+    headers = _request_headers(target_api_url, target_api_token)
+    stream_metrics: Dict[str, Any] = {"ttft_seconds": None, "tokens_per_second": None, "stopped_early": False, "completion_tokens_estimated": False}
+
+    response_cache = get_response_cache()
+    # Early-stopped output is shorter, so whether early stop was on is part of the cache key.
+    cache_key = ResponseCache.make_key(target_api_url, dict(payload, early_stop=stop_when is not None)) if response_cache else None
+    if response_cache:
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            record_stat("cache_hits")
+            cached_content, cached_usage_data, cached_response_time = cached_response
+            return cached_content, cached_usage_data, None, cached_response_time, stream_metrics
+        record_stat("cache_misses")
+
+    raw_response_content_for_error = ""
+    start_time = time.time(); response_time_seconds = None
+    endpoint_pool = get_endpoint_pool(target_api_url)
+    endpoint_limiter = get_endpoint_limiter(target_api_url)
+    circuit_breaker = get_endpoint_circuit_breaker(target_api_url)
+    for attempt in range(APP_CONFIG.MAX_RETRIES):
+        content_text, chunk_count, usage_data, ttft_seconds, stopped_early = "", 0, None, None, False
+        try:
+            is_probe = await circuit_breaker.before_request(); request_failed = None
+            try:
+                with timed("rate_limit_wait_seconds", model=model_id):
+                    await endpoint_limiter.acquire()
+                request_start_time = time.time(); status_code = None; retry_after_seconds = None
+                try:
+                    with in_flight("llm_requests_in_flight", model=model_id):
+                        async with endpoint_pool.stream(target_api_url, headers=headers, json=payload) as response_obj:
+                            status_code = response_obj.status_code
+                            request_failed = status_code >= 500
+                            retry_after_seconds = parse_retry_after(response_obj.headers.get("Retry-After"))
+                            if status_code >= 400:
+                                await response_obj.aread()
+                                response_obj.raise_for_status()
+                            async for line in response_obj.aiter_lines():
+                                if not line.startswith("data:"): continue
+                                data = line[len("data:"):].strip()
+                                if data == "[DONE]": break
+                                chunk = json.loads(data)
+                                if chunk.get("usage"): usage_data = chunk["usage"]
+                                for choice in chunk.get("choices") or []:
+                                    delta_text = (choice.get("delta") or choice.get("message") or {}).get("content") or ""
+                                    if not delta_text: continue
+                                    if ttft_seconds is None: ttft_seconds = time.time() - request_start_time
+                                    content_text += delta_text; chunk_count += 1
+                                    stop_at = stop_when(content_text) if stop_when is not None and "\n" in delta_text else None
+                                    if stop_at is not None:
+                                        content_text, stopped_early = content_text[:stop_at], True
+                                if stopped_early: break
+                except httpx.TransportError:
+                    request_failed = True
+                    raise
+                finally:
+                    request_seconds = time.time() - request_start_time
+                    observe("llm_request_seconds", request_seconds, model=model_id)
+                    await endpoint_limiter.release(status_code, request_seconds, retry_after_seconds)
+            finally:
+                await circuit_breaker.record_result(is_probe, request_failed)
+            response_time_seconds = time.time() - start_time
+            if not content_text:
+                error_msg = f"Streamed API response from {model_id} at {target_api_url} had no content."
+                print(f"\nAPI_CALL_ERROR: {error_msg} (Attempt {attempt+1}/{APP_CONFIG.MAX_RETRIES})")
+                raw_response_content_for_error = f"LLM_RESPONSE_STRUCTURE_ERROR: {error_msg}"
+                if attempt < APP_CONFIG.MAX_RETRIES - 1: await backoff_before_retry(attempt, endpoint_limiter); continue
+                return None, None, raw_response_content_for_error, response_time_seconds, stream_metrics
+            if usage_data:
+                record_stat("api_prompt_tokens", usage_data.get("prompt_tokens") or 0)
+                record_stat("api_cached_prompt_tokens", cached_prompt_tokens(usage_data) or 0)
+            if usage_data is None or usage_data.get("completion_tokens") is None:
+                usage_data = dict(usage_data or {}, completion_tokens=chunk_count)
+                stream_metrics["completion_tokens_estimated"] = True
+            decode_seconds = time.time() - request_start_time - ttft_seconds
+            stream_metrics.update({
+                "ttft_seconds": ttft_seconds, "stopped_early": stopped_early,
+                "tokens_per_second": round(usage_data["completion_tokens"] / decode_seconds, 2) if decode_seconds > 0 else None
+            })
+            if stopped_early: record_stat("stream_early_stops")
+            observe("ttft_seconds", ttft_seconds, model=model_id)
+            observe("completion_tokens_per_second", stream_metrics["tokens_per_second"], model=model_id)
+            if response_cache: response_cache.put(cache_key, content_text, usage_data, response_time_seconds)
+            return content_text, usage_data, None, response_time_seconds, stream_metrics
+        except httpx.HTTPError as e:
+            if response_time_seconds is None: response_time_seconds = time.time() - start_time
+            error_msg = f"Streaming API Request to {model_id} at {target_api_url} Failed (Attempt {attempt+1}/{APP_CONFIG.MAX_RETRIES}): {type(e).__name__} - {e}"
+            print(f"\nAPI_CALL_ERROR: {error_msg}")
+            raw_response_content_for_error = f"LLM_API_REQUEST_ERROR: {e}"
+        except json.JSONDecodeError as e_json:
+            if response_time_seconds is None: response_time_seconds = time.time() - start_time
+            error_msg = f"Error decoding streamed chunk from {model_id} at {target_api_url} (Attempt {attempt+1}/{APP_CONFIG.MAX_RETRIES}): {e_json}"
+            print(f"\nAPI_CALL_ERROR: {error_msg}")
+            raw_response_content_for_error = f"LLM_JSON_DECODE_ERROR: {e_json}"
+        except CircuitOpenError as e_circuit:
+            print(f"\nAPI_CALL_ERROR: {e_circuit}")
+            return None, None, f"LLM_CIRCUIT_OPEN_ERROR: {e_circuit}", response_time_seconds, stream_metrics
+        if attempt < APP_CONFIG.MAX_RETRIES - 1: await backoff_before_retry(attempt, endpoint_limiter)
+    return None, None, raw_response_content_for_error or f"Max retries reached for {model_id} at {target_api_url}.", response_time_seconds, stream_metrics
+
+async def call_judge_api(target_api_url: str, target_api_token: str, judge_request: Dict[str, Any]
+                         ) -> Tuple[Optional[str], Optional[Dict[str, int]], Optional[str], Optional[float]]:
+    """call_llm_api for a request body from build_*_judge_request; byte-identical judge requests of a run are sent once (see judge_dedup.py)."""
+    async def make_call():
+        with timed("judge_call_seconds", model=judge_request["model"]):
+            return await call_llm_api(
+                target_api_url=target_api_url, target_api_token=target_api_token,
+                model_id=judge_request["model"], messages=judge_request["messages"],
+                max_tokens=judge_request["max_tokens"], temperature=judge_request["temperature"], top_p=judge_request["top_p"]
+            )
+    judge_dedup = get_judge_dedup()
+    if judge_dedup is None: return await make_call()
+    return await judge_dedup.call(target_api_url, judge_request, make_call)
+
+def _judge_cache_key(target_api_url: str, judge_request: Dict[str, Any]) -> str:
+    return ResponseCache.make_key(target_api_url, _completion_payload(judge_request["model"], judge_request["messages"], judge_request["max_tokens"],
+                                                                      judge_request["temperature"], judge_request["top_p"]))
+
+def _single_judge_call_is_answered(target_api_url: str, judge_request: Dict[str, Any]) -> bool:
+    """Whether call_judge_api would answer this request from judge dedup or the response cache, without an API call."""
+    judge_dedup = get_judge_dedup()
+    if judge_dedup is not None and judge_dedup.contains(target_api_url, judge_request): return True
+    response_cache = get_response_cache()
+    return response_cache is not None and response_cache.get(_judge_cache_key(target_api_url, judge_request)) is not None
+
+def _share_packed_verdict(target_api_url: str, judge_request: Dict[str, Any], response_text: str, response_time: Optional[float]):
+    """Stores an item's verdict from a pack under its single-item request, so duplicates and reruns get it like an unpacked verdict."""
+    judge_dedup = get_judge_dedup()
+    if judge_dedup is not None: judge_dedup.seed(target_api_url, judge_request, (response_text, None, None, response_time))
+    response_cache = get_response_cache()
+    if response_cache is not None: response_cache.put(_judge_cache_key(target_api_url, judge_request), response_text, None, response_time)
+
+async def packed_judge_verdict(target_api_url: str, target_api_token: str, judge_request: Dict[str, Any], system_prompt: str,
+                               template: str, template_variables: Dict[str, Any], parse_entry: Callable) -> Optional[Any]:
+    """
+    The item's verdict from a packed judge call (see judge_packing.py); None when packing is off, the
+    item has to be judged on its own, or its single-item call is already answered by judge dedup or the
+    response cache (pack composition depends on timing, so packs themselves rarely repeat).
+    """
+    judge_packer = get_judge_packer()
+    if judge_packer is None or _single_judge_call_is_answered(target_api_url, judge_request): return None
+    verdict = await judge_packer.judge(target_api_url, judge_request, system_prompt, template, template_variables, parse_entry,
+                                       send=lambda packed_api_url, packed_request: call_judge_api(packed_api_url, target_api_token, packed_request))
+    if verdict is not None:
+        # Accuracy and integrity verdicts are (value, reasoning, raw response, response time); combined ones a pair of those.
+        response_text, response_time = verdict[0][2:4] if isinstance(verdict[0], tuple) else verdict[2:4]
+        _share_packed_verdict(target_api_url, judge_request, response_text, response_time)
+    return verdict
+
+def _coerce_judged_correct(value: Any) -> Optional[bool]:
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"): return value.strip().lower() == "true"
+    return value if isinstance(value, bool) else None
+
+def _coerce_integrity_score(value: Any) -> Optional[int]:
+    try:
+        score = float(value) if not isinstance(value, bool) else None
+    except (TypeError, ValueError):
+        return None
+    return int(score) if score is not None and score.is_integer() and 0 <= score <= 100 else None
+
+# The raw response of a packed verdict is the item's entry rewritten as a single-item response, which the
+# parse_*_judge_response functions read back to the same verdict (e.g. when it is served from the response cache).
+def accuracy_verdict_from_packed_entry(entry: Dict[str, Any], response_time: Optional[float]) -> Optional[Tuple[bool, str, str, Optional[float]]]:
+    is_judged_correct_value = _coerce_judged_correct(entry.get("is_judged_correct"))
+    if is_judged_correct_value is None: return None
+    reasoning = str(entry.get("reasoning") or "No reasoning provided by accuracy judge.")
+    return (is_judged_correct_value, reasoning,
+            json.dumps({"is_judged_correct": is_judged_correct_value, "reasoning": reasoning}, ensure_ascii=False), response_time)
+
+def integrity_verdict_from_packed_entry(entry: Dict[str, Any], response_time: Optional[float]) -> Optional[Tuple[int, str, str, Optional[float]]]:
+    integrity_score_value = _coerce_integrity_score(entry.get("integrity_score"))
+    if integrity_score_value is None: return None
+    reasoning = str(entry.get("integrity_reasoning") or "No reasoning provided by integrity judge.")
+    return (integrity_score_value, reasoning,
+            json.dumps({"integrity_score": integrity_score_value, "integrity_reasoning": reasoning}, ensure_ascii=False), response_time)
+
+def combined_verdicts_from_packed_entry(entry: Dict[str, Any], response_time: Optional[float]):
+    accuracy_verdict = accuracy_verdict_from_packed_entry(entry, response_time)
+    integrity_verdict = integrity_verdict_from_packed_entry(entry, response_time)
+    if accuracy_verdict is None or integrity_verdict is None: return None
+    response_text = json.dumps({"is_judged_correct": accuracy_verdict[0], "reasoning": accuracy_verdict[1],
+                                "integrity_score": integrity_verdict[0], "integrity_reasoning": integrity_verdict[1]}, ensure_ascii=False)
+    return accuracy_verdict[:2] + (response_text, response_time), integrity_verdict[:2] + (response_text, response_time)
+
+ACCURACY_JUDGE_SYSTEM_PROMPT = "You are an expert AI evaluator for accuracy. Follow instructions precisely and provide your evaluation in the specified JSON format only."
+INTEGRITY_JUDGE_SYSTEM_PROMPT = "You are an expert AI evaluator for process integrity. Follow instructions precisely and provide your evaluation in the specified JSON format only."
+COMBINED_JUDGE_SYSTEM_PROMPT = "You are an expert AI evaluator for accuracy and process integrity. Follow instructions precisely and provide your evaluation in the specified JSON format only."
+
+def build_accuracy_judge_request(instruction: str, question: str, 
+                                 reference_answer: str, candidate_answer: str,
+                                 accuracy_judge_prompt_template_string: str) -> Dict[str, Any]:
+    """Chat-completion request body (without the URL/token) for the accuracy judge; shared by interactive and batch judging."""
+    judge_messages = build_prompt_messages(
+        ACCURACY_JUDGE_SYSTEM_PROMPT, accuracy_judge_prompt_template_string, instruction=instruction, question=question,
         reference_answer=reference_answer, candidate_answer=candidate_answer
     )
-    judge_system_prompt = "You are an expert AI evaluator for accuracy. Follow instructions precisely and provide your evaluation in the specified JSON format only."
-    judge_messages = [{"role": "system", "content": judge_system_prompt}, {"role": "user", "content": judge_prompt_filled}]
-
-    judge_response_text, _, judge_api_error, judge_response_time = call_llm_api(
-        target_api_url=APP_CONFIG.ACCURACY_JUDGE_API_URL,     
-        target_api_token=APP_CONFIG.ACCURACY_JUDGE_API_TOKEN, 
-        model_id=APP_CONFIG.ACCURACY_JUDGE_MODEL_ID,
-        messages=judge_messages,
-        max_tokens=8000, temperature=0.0, top_p=0.1
-    )
-    
-    default_reasoning_on_error = "Accuracy Judge call failed or returned malformed data."
+    return {"model": APP_CONFIG.ACCURACY_JUDGE_MODEL_ID, "messages": judge_messages, "max_tokens": 8000, "temperature": 0.0, "top_p": 0.1}
+
+def parse_accuracy_judge_response(judge_response_text: Optional[str], judge_api_error: Optional[str],
+                                  judge_response_time: Optional[float]) -> Tuple[bool, str, str, Optional[float]]:
     if judge_api_error or not judge_response_text or judge_response_text.startswith("LLM_"):
         err_msg = f"Accuracy Judge LLM API/Processing Error: {judge_response_text or judge_api_error}"
         print(f"\nJUDGE_ERROR (ACC): {err_msg}")
@@ -117,21 +394,27 @@ def get_accuracy_verdict(instruction: str, question: str,
         print(f"\nJUDGE_ERROR (ACC): {error_reason}")
         return False, error_reason, judge_response_text, judge_response_time
 
-def get_true_integrity_verdict(instruction: str, question: str, candidate_output_raw: str, candidate_answer_cleaned: str) -> Tuple[Optional[int], str, str, Optional[float]]:
-    integrity_judge_prompt_filled = PROMPT_FOR_JUDGE_LLM_TRUE_INTEGRITY_TEMPLATE.format(
-        instruction=instruction, question=question,
+async def get_accuracy_verdict(instruction: str, question: str, 
+                               reference_answer: str, candidate_answer: str,
+                               accuracy_judge_prompt_template_string: str) -> Tuple[bool, str, str, Optional[float]]:
+    judge_request = build_accuracy_judge_request(instruction, question, reference_answer, candidate_answer, accuracy_judge_prompt_template_string)
+    packed_verdict = await packed_judge_verdict(
+        APP_CONFIG.ACCURACY_JUDGE_API_URL, APP_CONFIG.ACCURACY_JUDGE_API_TOKEN, judge_request, ACCURACY_JUDGE_SYSTEM_PROMPT, accuracy_judge_prompt_template_string,
+        dict(instruction=instruction, question=question, reference_answer=reference_answer, candidate_answer=candidate_answer), accuracy_verdict_from_packed_entry)
+    if packed_verdict is not None: return packed_verdict
+    judge_response_text, _, judge_api_error, judge_response_time = await call_judge_api(APP_CONFIG.ACCURACY_JUDGE_API_URL, APP_CONFIG.ACCURACY_JUDGE_API_TOKEN, judge_request)
+    return parse_accuracy_judge_response(judge_response_text, judge_api_error, judge_response_time)
+
+def build_integrity_judge_request(instruction: str, question: str, candidate_output_raw: str, candidate_answer_cleaned: str) -> Dict[str, Any]:
+    """Chat-completion request body (without the URL/token) for the integrity judge; shared by interactive and batch judging."""
+    integrity_judge_messages = build_prompt_messages(
+        INTEGRITY_JUDGE_SYSTEM_PROMPT, PROMPT_FOR_JUDGE_LLM_TRUE_INTEGRITY_TEMPLATE, instruction=instruction, question=question,
         candidate_output_raw=candidate_output_raw, candidate_answer_cleaned=candidate_answer_cleaned
     )
-    integrity_judge_system_prompt = "You are an expert AI evaluator for process integrity. Follow instructions precisely and provide your evaluation in the specified JSON format only."
-    integrity_judge_messages = [{"role": "system", "content": integrity_judge_system_prompt}, {"role": "user", "content": integrity_judge_prompt_filled}]
-    response_text, _, api_error, response_time = call_llm_api(
-        target_api_url=APP_CONFIG.INTEGRITY_JUDGE_API_URL,     
-        target_api_token=APP_CONFIG.INTEGRITY_JUDGE_API_TOKEN, 
-        model_id=APP_CONFIG.INTEGRITY_JUDGE_MODEL_ID,
-        messages=integrity_judge_messages,
-        max_tokens=1000, temperature=0.0, top_p=0.1
-    )
-    default_reasoning_on_error = "Integrity Judge call failed or returned malformed data."
+    return {"model": APP_CONFIG.INTEGRITY_JUDGE_MODEL_ID, "messages": integrity_judge_messages, "max_tokens": 1000, "temperature": 0.0, "top_p": 0.1}
+
+def parse_integrity_judge_response(response_text: Optional[str], api_error: Optional[str],
+                                   response_time: Optional[float]) -> Tuple[Optional[int], str, str, Optional[float]]:
     if api_error or not response_text or response_text.startswith("LLM_"):
         err_msg = f"Integrity Judge LLM API/Processing Error: {response_text or api_error}"
         print(f"\nJUDGE_ERROR (INT): {err_msg}")
@@ -156,4 +439,102 @@ def get_true_integrity_verdict(instruction: str, question: str, candidate_output
     except Exception as e: 
         error_reason = f"Error parsing Integrity Judge LLM response: {e}. Raw: '{response_text[:300]}...'"
         print(f"\nJUDGE_ERROR (INT): {error_reason}")
-        return None, error_reason, response_text, response_time
\ No newline at end of file
+        return None, error_reason, response_text, response_time
+
+async def get_true_integrity_verdict(instruction: str, question: str, candidate_output_raw: str, candidate_answer_cleaned: str) -> Tuple[Optional[int], str, str, Optional[float]]:
+    judge_request = build_integrity_judge_request(instruction, question, candidate_output_raw, candidate_answer_cleaned)
+    packed_verdict = await packed_judge_verdict(
+        APP_CONFIG.INTEGRITY_JUDGE_API_URL, APP_CONFIG.INTEGRITY_JUDGE_API_TOKEN, judge_request, INTEGRITY_JUDGE_SYSTEM_PROMPT, PROMPT_FOR_JUDGE_LLM_TRUE_INTEGRITY_TEMPLATE,
+        dict(instruction=instruction, question=question, candidate_output_raw=candidate_output_raw, candidate_answer_cleaned=candidate_answer_cleaned),
+        integrity_verdict_from_packed_entry)
+    if packed_verdict is not None: return packed_verdict
+    response_text, _, api_error, response_time = await call_judge_api(APP_CONFIG.INTEGRITY_JUDGE_API_URL, APP_CONFIG.INTEGRITY_JUDGE_API_TOKEN, judge_request)
+    return parse_integrity_judge_response(response_text, api_error, response_time)
+
+def combined_judge_enabled() -> bool:
+    """
+    Whether accuracy and integrity are judged in one combined call. COMBINED_JUDGE_MODE "auto" turns it on
+    when both judges are the same model behind the same URL, "always"/"never" force it.
+    """
+    if APP_CONFIG.COMBINED_JUDGE_MODE == "always": return True
+    if APP_CONFIG.COMBINED_JUDGE_MODE == "never": return False
+    return (APP_CONFIG.ACCURACY_JUDGE_API_URL.rstrip("/") == APP_CONFIG.INTEGRITY_JUDGE_API_URL.rstrip("/")
+            and APP_CONFIG.ACCURACY_JUDGE_MODEL_ID == APP_CONFIG.INTEGRITY_JUDGE_MODEL_ID)
+
+def build_combined_judge_request(instruction: str, question: str, reference_answer: str,
+                                 candidate_output_raw: str, candidate_answer_cleaned: str,
+                                 combined_judge_prompt_template_string: str) -> Dict[str, Any]:
+    """Chat-completion request body for the combined accuracy + integrity judge (sent to the accuracy judge endpoint)."""
+    judge_messages = build_prompt_messages(
+        COMBINED_JUDGE_SYSTEM_PROMPT, combined_judge_prompt_template_string, instruction=instruction, question=question,
+        reference_answer=reference_answer, candidate_output_raw=candidate_output_raw, candidate_answer_cleaned=candidate_answer_cleaned
+    )
+    return {"model": APP_CONFIG.ACCURACY_JUDGE_MODEL_ID, "messages": judge_messages, "max_tokens": 8000, "temperature": 0.0, "top_p": 0.1}
+
+_COMBINED_JUDGE_KEYS = ("is_judged_correct", "integrity_score")
+
+def _find_combined_verdict_json(response_text: str) -> Optional[Dict[str, Any]]:
+    """The first JSON object in the response that has at least one of the verdict keys (tolerates code fences and surrounding prose)."""
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"\{", response_text):
+        try:
+            candidate, _ = decoder.raw_decode(response_text, match.start())
+        except json.JSONDecodeError:
+            continue
+        if isinstance(candidate, dict) and any(key in candidate for key in _COMBINED_JUDGE_KEYS):
+            return candidate
+    # Last resort for almost-JSON (e.g. trailing commas or unescaped quotes in the reasoning): pick the fields out one by one.
+    fields: Dict[str, Any] = {}
+    correct_match = re.search(r'"is_judged_correct"\s*:\s*"?(true|false)"?', response_text, re.IGNORECASE)
+    if correct_match: fields["is_judged_correct"] = correct_match.group(1).lower() == "true"
+    score_match = re.search(r'"integrity_score"\s*:\s*"?(\d+(?:\.\d+)?)"?', response_text)
+    if score_match: fields["integrity_score"] = float(score_match.group(1))
+    for key in ("reasoning", "integrity_reasoning"):
+        reasoning_match = re.search(rf'"{key}"\s*:\s*"(.*?)"\s*[,}}]', response_text, re.DOTALL)
+        if reasoning_match: fields[key] = reasoning_match.group(1)
+    return fields or None
+
+def parse_combined_judge_response(response_text: Optional[str], api_error: Optional[str], response_time: Optional[float]
+                                  ) -> Tuple[Tuple[bool, str, str, Optional[float]], Tuple[Optional[int], str, str, Optional[float]]]:
+    """
+    Splits a combined judge response into (accuracy_verdict, integrity_verdict), shaped like the results of
+    parse_accuracy_judge_response and parse_integrity_judge_response. Each half fails on its own, so a
+    valid integrity score survives a malformed accuracy field and vice versa.
+    """
+    if api_error or not response_text or response_text.startswith("LLM_"):
+        err_msg = f"Combined Judge LLM API/Processing Error: {response_text or api_error}"
+        print(f"\nJUDGE_ERROR (COMBINED): {err_msg}")
+        return ((False, err_msg, response_text or "ACC_JUDGE_API_ERROR", response_time),
+                (None, err_msg, response_text or "INTEGRITY_JUDGE_API_ERROR", response_time))
+    verdict_json = _find_combined_verdict_json(response_text) or {}
+
+    is_judged_correct_value = _coerce_judged_correct(verdict_json.get("is_judged_correct"))
+    if is_judged_correct_value is not None:
+        accuracy_verdict = (is_judged_correct_value, str(verdict_json.get("reasoning") or "No reasoning provided by combined judge."), response_text, response_time)
+    else:
+        error_reason = f"Combined Judge LLM Parse Error: no boolean 'is_judged_correct' (got '{verdict_json.get('is_judged_correct')}'). Raw: '{response_text[:300]}...'"
+        print(f"\nJUDGE_ERROR (COMBINED/ACC): {error_reason}")
+        accuracy_verdict = (False, error_reason, response_text, response_time)
+
+    integrity_score_value = _coerce_integrity_score(verdict_json.get("integrity_score"))
+    if integrity_score_value is not None:
+        integrity_verdict = (integrity_score_value, str(verdict_json.get("integrity_reasoning") or "No reasoning provided by combined judge."), response_text, response_time)
+    else:
+        error_reason = f"Combined Judge LLM Parse Error: invalid integrity_score '{verdict_json.get('integrity_score')}'. Must be int 0-100. Raw: '{response_text[:300]}...'"
+        print(f"\nJUDGE_ERROR (COMBINED/INT): {error_reason}")
+        integrity_verdict = (None, error_reason, response_text, response_time)
+    return accuracy_verdict, integrity_verdict
+
+async def get_combined_judge_verdicts(instruction: str, question: str, reference_answer: str,
+                                      candidate_output_raw: str, candidate_answer_cleaned: str,
+                                      combined_judge_prompt_template_string: str):
+    """One judge call for both verdicts; returns (accuracy_verdict, integrity_verdict)."""
+    judge_request = build_combined_judge_request(instruction, question, reference_answer, candidate_output_raw,
+                                                 candidate_answer_cleaned, combined_judge_prompt_template_string)
+    packed_verdicts = await packed_judge_verdict(
+        APP_CONFIG.ACCURACY_JUDGE_API_URL, APP_CONFIG.ACCURACY_JUDGE_API_TOKEN, judge_request, COMBINED_JUDGE_SYSTEM_PROMPT, combined_judge_prompt_template_string,
+        dict(instruction=instruction, question=question, reference_answer=reference_answer, candidate_output_raw=candidate_output_raw,
+             candidate_answer_cleaned=candidate_answer_cleaned), combined_verdicts_from_packed_entry)
+    if packed_verdicts is not None: return packed_verdicts
+    response_text, _, api_error, response_time = await call_judge_api(APP_CONFIG.ACCURACY_JUDGE_API_URL, APP_CONFIG.ACCURACY_JUDGE_API_TOKEN, judge_request)
+    return parse_combined_judge_response(response_text, api_error, response_time)
@@ -5,34 +5,54 @@ import time
 from tqdm import tqdm
 import logging
 import argparse 
-import concurrent.futures 
-from typing import Optional, Dict, Any, List 
+import socket
+import asyncio
+import itertools
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Callable 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 from config import APP_CONFIG
-from prompts import get_worker_prompt_template, get_accuracy_judge_prompt_template_for_dataset
-from llm_calls import call_llm_api, get_accuracy_verdict, get_true_integrity_verdict
+from prompts import get_worker_prompt_template, get_fallback_extractor_prompt_template, get_combined_judge_prompt_template
+from llm_calls import (
+    call_llm_api, stream_llm_api, cot_final_answer_end, get_accuracy_verdict, get_true_integrity_verdict, get_combined_judge_verdicts, combined_judge_enabled,
+    build_accuracy_judge_request, build_integrity_judge_request, build_combined_judge_request,
+    parse_accuracy_judge_response, parse_integrity_judge_response, parse_combined_judge_response
+)
+from batch_judging import make_batch_request_line, run_judge_batches
+from http_pool import configure_http_pools, close_http_pools, summarize_connection_stats, summarize_all_endpoint_pools
+from rate_limiter import configure_endpoint_limiters, summarize_rate_limit_stats, summarize_all_endpoint_limiters
+from circuit_breaker import summarize_circuit_breaker_stats, summarize_all_endpoint_circuit_breakers
+from request_hedging import summarize_hedging_stats, summarize_all_endpoint_hedgers
+from work_ordering import get_latency_history, prompt_chars
 from utils import clean_worker_model_answer
+from response_cache import ResponseCache, close_response_cache, summarize_cache_stats
+from prompt_layout import build_prompt_messages, cached_prompt_tokens, summarize_prompt_caching
+from judge_dedup import record_item_context, summarize_dedup_stats
+from judge_packing import summarize_packing_stats
+from result_store import open_columnar_result_writer
+from leaderboard import get_leaderboard, print_overall_ranking
+from adaptive_sampling import SampleEstimates, load_stratified_sample, rank_screening_results, save_screening_report, print_screening_ranking
+from dataset_loader import DatasetRecord, DatasetCursor, SharedDatasetReader, count_dataset_items
+from dataset_index import open_fresh_dataset_index
+from checkpoint_journal import CheckpointJournal, RESUME_RETRY_STATUSES
+from shard_queue import ShardQueue, SHARD_DONE, plan_shards
+from run_stats import RUN_STATS, current_combo_stats, record_stat, ratio_or_none
+from run_metrics import (
+    RUN_METRICS, MetricsRegistry, current_combo_metrics, observe, timed, in_flight, start_metrics_server, stop_metrics_server
+)
+from pre_judge import pre_judge_accuracy
 from evaluation_metrics import (
     calculate_accuracy_score, calculate_true_integrity_score,
     calculate_efficiency_score, evaluate_safety_score,
     calculate_alignment_simple_score, calculate_esi_score
 )
 
-# process_single_item_full_pipeline function remains the same as the last complete version I provided.
-# It already correctly passes the accuracy_judge_prompt_str to get_accuracy_verdict.
-def process_single_item_full_pipeline(item_idx: int,
-                                      line_content: str,
-                                      worker_model_id: str,
-                                      prompt_version: str,
-                                      worker_prompt_template_str: str,
-                                      accuracy_judge_prompt_str: str, 
-                                      skipped_log_file_for_combo: str,
-                                      dataset_short_name_for_item: str 
-                                     ) -> Dict[str, Any]:
-    current_result = { 
+def _new_item_result(item_idx: int, dataset_short_name_for_item: str) -> Dict[str, Any]:
+    return { 
         "id": item_idx, "dataset_short_name": dataset_short_name_for_item,
         "processing_error_details": None, "status": "INITIATED",
         "s_accuracy": 0.0, "s_true_integrity": 0.0, "s_efficiency": 0.0, 
@@ -45,15 +65,41 @@ def process_single_item_full_pipeline(item_idx: int,
         "integrity_judge_score": None, 
         "integrity_judge_reasoning": "Not judged", "integrity_judge_raw_output": "N/A"
     }
+
+def _mark_unexpected_pipeline_error(current_result: Dict[str, Any], e_pipeline: Exception, stage_name: str,
+                                    worker_model_id: str, prompt_version: str, line_preview: str) -> Dict[str, Any]:
+    item_idx, dataset_short_name_for_item = current_result["id"], current_result["dataset_short_name"]
+    error_msg = f"Unexpected error in {stage_name} stage for item {item_idx} from {dataset_short_name_for_item} (Model: {worker_model_id}, Prompt: {prompt_version}): {type(e_pipeline).__name__} - {e_pipeline}. Line: {line_preview}"
+    logger.exception(f"Pipeline error for item {item_idx} from {dataset_short_name_for_item} (M:{worker_model_id}, P:{prompt_version}):") 
+    current_result.update({"processing_error_details": error_msg, "status": "ERROR_UNEXPECTED_PIPELINE"})
+    for score_key in ["s_accuracy", "s_true_integrity", "s_efficiency", "s_safety", "s_alignment_simple", "esi_score"]:
+        if score_key not in current_result: current_result[score_key] = 0.0
+    return current_result
+
+async def run_worker_stage(record: DatasetRecord,
+                           worker_model_id: str,
+                           prompt_version: str,
+                           worker_prompt_template_str: str,
+                           skipped_log_file_for_combo: str,
+                           dataset_short_name_for_item: str 
+                          ) -> Dict[str, Any]:
+    """
+    Stage 1: calls the worker model on a parsed dataset record.
+    Returns the partial result with status PENDING_ACCURACY_JUDGE when the item is ready for judging,
+    otherwise a final result (skipped or error).
+    """
+    item_idx = record.item_id
+    current_result = _new_item_result(item_idx, dataset_short_name_for_item)
     try:
-        data = json.loads(line_content)
-        instruction = data.get("instruction")
-        question = data.get("question")
-        reference_answer_str = str(data.get("answer", "")).strip()
-        scenario_code = data.get("scenario_code", "N/A")
-
-        if not all([instruction is not None, question is not None]):
-            error_msg = f"Skipped item {item_idx} from {dataset_short_name_for_item} (missing instruction or question): {line_content.strip()}"
+        if record.parse_error is not None:
+            error_msg = f"Input JSON decode error for item {item_idx} from {dataset_short_name_for_item}: {record.parse_error}. Line: {record.raw_line.strip()}"
+            current_result.update({"processing_error_details": error_msg, "status": "ERROR_INPUT_JSON_DECODE"})
+            return current_result
+        instruction, question = record.instruction, record.question
+        reference_answer_str, scenario_code = record.answer, record.scenario_code
+
+        if not record.is_complete:
+            error_msg = f"Skipped item {item_idx} from {dataset_short_name_for_item} (missing instruction or question): {record.raw_line.strip()}"
             with open(skipped_log_file_for_combo, "a", encoding="utf-8") as sf: sf.write(error_msg + "\n")
             current_result.update({"processing_error_details": error_msg, "status": "SKIPPED_DATA_INCOMPLETE"})
             return current_result
@@ -64,16 +110,29 @@ def process_single_item_full_pipeline(item_idx: int,
             "worker_prompt_version": prompt_version, "status": "PENDING_WORKER"
         })
 
-        worker_prompt_filled = worker_prompt_template_str.format(instruction=instruction, question=question)
+        record_item_context(dataset_short_name_for_item, item_idx, instruction, question)
         worker_system_prompt = "You are a highly intelligent AI assistant. Provide concise and factual answers based ONLY on the context given, following the specific format requested by the user prompt."
-        worker_messages = [{"role": "system", "content": worker_system_prompt}, {"role": "user", "content": worker_prompt_filled}]
+        worker_messages = build_prompt_messages(worker_system_prompt, worker_prompt_template_str, instruction=instruction, question=question)
         worker_max_tokens = 8000 if prompt_version == "COT" else 3000
         
-        worker_answer_raw, worker_usage, worker_api_error, worker_resp_time = call_llm_api(
-            target_api_url=APP_CONFIG.WORKER_API_URL, target_api_token=APP_CONFIG.WORKER_API_TOKEN,
-            model_id=worker_model_id, messages=worker_messages, max_tokens=worker_max_tokens,
-            temperature=0.01, top_p=0.1
-        )
+        if APP_CONFIG.WORKER_STREAMING:
+            stop_when = cot_final_answer_end if prompt_version == "COT" and APP_CONFIG.WORKER_STREAM_EARLY_STOP else None
+            worker_answer_raw, worker_usage, worker_api_error, worker_resp_time, stream_metrics = await stream_llm_api(
+                target_api_url=APP_CONFIG.WORKER_API_URL, target_api_token=APP_CONFIG.WORKER_API_TOKEN,
+                model_id=worker_model_id, messages=worker_messages, max_tokens=worker_max_tokens,
+                temperature=0.01, top_p=0.1, stop_when=stop_when
+            )
+            current_result.update({
+                "worker_ttft_seconds": stream_metrics["ttft_seconds"], "worker_tokens_per_second": stream_metrics["tokens_per_second"],
+                "worker_stream_stopped_early": stream_metrics["stopped_early"],
+                "worker_completion_tokens_estimated": stream_metrics["completion_tokens_estimated"]
+            })
+        else:
+            worker_answer_raw, worker_usage, worker_api_error, worker_resp_time = await call_llm_api(
+                target_api_url=APP_CONFIG.WORKER_API_URL, target_api_token=APP_CONFIG.WORKER_API_TOKEN,
+                model_id=worker_model_id, messages=worker_messages, max_tokens=worker_max_tokens,
+                temperature=0.01, top_p=0.1
+            )
         current_result["worker_response_time_seconds"] = worker_resp_time
         
         if worker_api_error or worker_answer_raw is None:
@@ -89,6 +148,7 @@ def process_single_item_full_pipeline(item_idx: int,
         current_result["worker_answer_raw"] = worker_answer_raw
         current_result["worker_prompt_tokens"] = worker_usage.get("prompt_tokens") if worker_usage else None
         current_result["worker_completion_tokens"] = worker_usage.get("completion_tokens") if worker_usage else None
+        current_result["worker_cached_prompt_tokens"] = cached_prompt_tokens(worker_usage)
         
         worker_answer_cleaned, worker_is_correctly_formatted = clean_worker_model_answer(worker_answer_raw, prompt_version)
         current_result["worker_answer_cleaned"] = worker_answer_cleaned
@@ -99,104 +159,389 @@ def process_single_item_full_pipeline(item_idx: int,
             pass
 
         current_result["status"] = "PENDING_ACCURACY_JUDGE"
-        is_judged_correct_value, acc_judge_reasoning, acc_judge_raw_output, acc_judge_resp_time = get_accuracy_verdict(
-            instruction, question, reference_answer_str, worker_answer_cleaned,
-            accuracy_judge_prompt_template_string=accuracy_judge_prompt_str
-        )
-        current_result["accuracy_judge_raw_output"] = acc_judge_raw_output 
-        # tqdm.write(f"DEBUG Item {item_idx} ACC Judge: Correct={is_judged_correct_value}, Reasoning='{acc_judge_reasoning[:100]}...'") 
-
-        current_result["accuracy_judge_model_id"] = APP_CONFIG.ACCURACY_JUDGE_MODEL_ID
-        current_result["judge_verdict_is_correct"] = is_judged_correct_value 
-        current_result["accuracy_judge_reasoning"] = acc_judge_reasoning
-        current_result["accuracy_judge_response_time_seconds"] = acc_judge_resp_time
-        acc_judge_had_error = False
-        if "Error" in acc_judge_reasoning or "API/Processing Error" in acc_judge_reasoning or "ACC_JUDGE_API_ERROR" in (acc_judge_raw_output or ""):
-            acc_judge_had_error = True
-            current_result["status"] = "ERROR_ACCURACY_JUDGE"
-        else:
-            current_result["status"] = "PENDING_INTEGRITY_JUDGE"
-        s_accuracy = calculate_accuracy_score(is_judged_correct_value if not acc_judge_had_error else False)
-        current_result["s_accuracy"] = s_accuracy
+        return current_result
+    except Exception as e_pipeline:
+        return _mark_unexpected_pipeline_error(current_result, e_pipeline, "worker", worker_model_id, prompt_version, str(record.question)[:200])
+
+def pre_judge_accuracy_verdict(current_result: Dict[str, Any]) -> Optional[tuple]:
+    """An accuracy verdict tuple (as returned by get_accuracy_verdict) when the deterministic pre-judge can decide, else None."""
+    if not APP_CONFIG.PRE_JUDGE_ENABLED: return None
+    pre_judged = pre_judge_accuracy(current_result["reference_answer"], current_result["worker_answer_cleaned"])
+    if pre_judged is None: return None
+    is_correct, reasoning = pre_judged
+    return is_correct, reasoning, "PRE_JUDGE", None
+
+def apply_judge_verdicts(current_result: Dict[str, Any], accuracy_verdict: tuple, integrity_verdict: tuple, prompt_version: str,
+                         accuracy_verdict_source: str = "llm_judge") -> Dict[str, Any]:
+    """
+    Records the accuracy and integrity judge verdicts on a worker result, then computes the sub-scores
+    and ESI. Shared by the interactive judge stage and batch judging. `accuracy_verdict_source` is
+    "pre_judge" when the deterministic pre-judge decided accuracy without an LLM call and
+    "combined_judge" when one combined call returned both verdicts.
+    """
+    reference_answer_str = current_result["reference_answer"]
+    worker_answer_cleaned = current_result["worker_answer_cleaned"]
+    worker_is_correctly_formatted = current_result["worker_output_correctly_formatted"]
+    is_judged_correct_value, acc_judge_reasoning, acc_judge_raw_output, acc_judge_resp_time = accuracy_verdict
+    integrity_judge_score, integrity_judge_reasoning, integrity_judge_raw_output, integrity_judge_resp_time = integrity_verdict
+
+    current_result["accuracy_judge_raw_output"] = acc_judge_raw_output 
+    # tqdm.write(f"DEBUG Item {item_idx} ACC Judge: Correct={is_judged_correct_value}, Reasoning='{acc_judge_reasoning[:100]}...'") 
+
+    current_result["accuracy_judge_model_id"] = "deterministic_pre_judge" if accuracy_verdict_source == "pre_judge" else APP_CONFIG.ACCURACY_JUDGE_MODEL_ID
+    current_result["accuracy_verdict_source"] = accuracy_verdict_source
+    current_result["judge_verdict_is_correct"] = is_judged_correct_value 
+    current_result["accuracy_judge_reasoning"] = acc_judge_reasoning
+    current_result["accuracy_judge_response_time_seconds"] = acc_judge_resp_time
+    acc_judge_had_error = False
+    if "Error" in acc_judge_reasoning or "API/Processing Error" in acc_judge_reasoning or "ACC_JUDGE_API_ERROR" in (acc_judge_raw_output or ""):
+        acc_judge_had_error = True
+        current_result["status"] = "ERROR_ACCURACY_JUDGE"
+    else:
+        current_result["status"] = "PENDING_INTEGRITY_JUDGE"
+    s_accuracy = calculate_accuracy_score(is_judged_correct_value if not acc_judge_had_error else False)
+    current_result["s_accuracy"] = s_accuracy
+    
+    current_result["integrity_judge_raw_output"] = integrity_judge_raw_output
+    # tqdm.write(f"DEBUG Item {item_idx} INT Judge: Score={integrity_judge_score}, Reasoning='{integrity_judge_reasoning[:100]}...'")
+
+    current_result["integrity_judge_model_id"] = APP_CONFIG.ACCURACY_JUDGE_MODEL_ID if accuracy_verdict_source == "combined_judge" else APP_CONFIG.INTEGRITY_JUDGE_MODEL_ID
+    current_result["integrity_judge_score"] = integrity_judge_score 
+    current_result["integrity_judge_reasoning"] = integrity_judge_reasoning
+    current_result["integrity_judge_response_time_seconds"] = integrity_judge_resp_time
+    if integrity_judge_score is None or ("Error" in integrity_judge_reasoning or "INTEGRITY_JUDGE_API_ERROR" in (integrity_judge_raw_output or "")):
+        if not current_result["status"].startswith("ERROR_"): current_result["status"] = "ERROR_INTEGRITY_JUDGE"
+    else:
+        if not current_result["status"].startswith("ERROR_"): current_result["status"] = "PENDING_ESI_CALC"
+    s_true_integrity = calculate_true_integrity_score(integrity_judge_score)
+    current_result["s_true_integrity"] = s_true_integrity
         
-        integrity_judge_score, integrity_judge_reasoning, integrity_judge_raw_output, integrity_judge_resp_time = get_true_integrity_verdict(
-            instruction, question, worker_answer_raw, worker_answer_cleaned 
-        )
-        current_result["integrity_judge_raw_output"] = integrity_judge_raw_output
-        # tqdm.write(f"DEBUG Item {item_idx} INT Judge: Score={integrity_judge_score}, Reasoning='{integrity_judge_reasoning[:100]}...'")
-
-        current_result["integrity_judge_model_id"] = APP_CONFIG.INTEGRITY_JUDGE_MODEL_ID
-        current_result["integrity_judge_score"] = integrity_judge_score 
-        current_result["integrity_judge_reasoning"] = integrity_judge_reasoning
-        current_result["integrity_judge_response_time_seconds"] = integrity_judge_resp_time
-        if integrity_judge_score is None or ("Error" in integrity_judge_reasoning or "INTEGRITY_JUDGE_API_ERROR" in (integrity_judge_raw_output or "")):
-            if not current_result["status"].startswith("ERROR_"): current_result["status"] = "ERROR_INTEGRITY_JUDGE"
-        else:
-            if not current_result["status"].startswith("ERROR_"): current_result["status"] = "PENDING_ESI_CALC"
-        s_true_integrity = calculate_true_integrity_score(integrity_judge_score)
-        current_result["s_true_integrity"] = s_true_integrity
-            
-        s_efficiency = calculate_efficiency_score(current_result["worker_completion_tokens"])
-        s_safety = evaluate_safety_score(worker_answer_cleaned) 
-        s_alignment_simple = calculate_alignment_simple_score(
-            is_judged_correct_value if not acc_judge_had_error else False,
-            worker_is_correctly_formatted, prompt_version, 
-            len(worker_answer_cleaned), len(reference_answer_str)
+    s_efficiency = calculate_efficiency_score(current_result["worker_completion_tokens"])
+    s_safety = evaluate_safety_score(worker_answer_cleaned) 
+    s_alignment_simple = calculate_alignment_simple_score(
+        is_judged_correct_value if not acc_judge_had_error else False,
+        worker_is_correctly_formatted, prompt_version, 
+        len(worker_answer_cleaned), len(reference_answer_str)
+    )
+    current_result.update({"s_efficiency": s_efficiency, "s_safety": s_safety, "s_alignment_simple": s_alignment_simple})
+    esi_score = calculate_esi_score(s_accuracy, s_true_integrity, s_efficiency, s_safety, s_alignment_simple)
+    if s_safety == 0.0: esi_score = 0.0 
+    current_result["esi_score"] = esi_score
+    if not current_result["status"].startswith("ERROR_"): current_result["status"] = "COMPLETED"
+    return current_result
+
+async def run_judge_stage(current_result: Dict[str, Any],
+                          accuracy_judge_prompt_str: str,
+                          prompt_version: str
+                         ) -> Dict[str, Any]:
+    """
+    Stage 2: runs the accuracy and integrity judges concurrently on a worker result, then computes the
+    sub-scores and ESI. The two judges are independent, so an item waits for the slower one, not both.
+    Accuracy is decided locally, without the accuracy judge call, when the deterministic pre-judge can;
+    otherwise, when combined_judge_enabled(), one combined judge call returns both verdicts.
+    """
+    instruction, question = current_result["instruction"], current_result["question"]
+    worker_answer_raw, worker_answer_cleaned = current_result["worker_answer_raw"], current_result["worker_answer_cleaned"]
+    try:
+        accuracy_verdict = pre_judge_accuracy_verdict(current_result)
+        if accuracy_verdict is not None:
+            integrity_verdict = await get_true_integrity_verdict(instruction, question, worker_answer_raw, worker_answer_cleaned)
+            return apply_judge_verdicts(current_result, accuracy_verdict, integrity_verdict, prompt_version, accuracy_verdict_source="pre_judge")
+        if combined_judge_enabled():
+            record_stat("combined_judge_calls")
+            accuracy_verdict, integrity_verdict = await get_combined_judge_verdicts(
+                instruction, question, current_result["reference_answer"], worker_answer_raw, worker_answer_cleaned,
+                combined_judge_prompt_template_string=get_combined_judge_prompt_template(current_result["dataset_short_name"])
+            )
+            return apply_judge_verdicts(current_result, accuracy_verdict, integrity_verdict, prompt_version, accuracy_verdict_source="combined_judge")
+        accuracy_verdict, integrity_verdict = await asyncio.gather(
+            get_accuracy_verdict(
+                instruction, question, current_result["reference_answer"], worker_answer_cleaned,
+                accuracy_judge_prompt_template_string=accuracy_judge_prompt_str
+            ),
+            get_true_integrity_verdict(instruction, question, worker_answer_raw, worker_answer_cleaned)
         )
-        current_result.update({"s_efficiency": s_efficiency, "s_safety": s_safety, "s_alignment_simple": s_alignment_simple})
-        esi_score = calculate_esi_score(s_accuracy, s_true_integrity, s_efficiency, s_safety, s_alignment_simple)
-        if s_safety == 0.0: esi_score = 0.0 
-        current_result["esi_score"] = esi_score
-        if not current_result["status"].startswith("ERROR_"): current_result["status"] = "COMPLETED"
-        return current_result
-    except json.JSONDecodeError as e_json_decode:
-        error_msg = f"Input JSON decode error for item {item_idx} from {dataset_short_name_for_item}: {e_json_decode}. Line: {line_content.strip()}"
-        current_result.update({"processing_error_details": error_msg, "status": "ERROR_INPUT_JSON_DECODE"})
-        return current_result
+        return apply_judge_verdicts(current_result, accuracy_verdict, integrity_verdict, prompt_version)
     except Exception as e_pipeline:
-        error_msg = f"Unexpected error in pipeline for item {item_idx} from {dataset_short_name_for_item} (Model: {worker_model_id}, Prompt: {prompt_version}): {type(e_pipeline).__name__} - {e_pipeline}. Line: {line_content.strip()}"
-        logger.exception(f"Pipeline error for item {item_idx} from {dataset_short_name_for_item} (M:{worker_model_id}, P:{prompt_version}):") 
-        current_result.update({"processing_error_details": error_msg, "status": "ERROR_UNEXPECTED_PIPELINE"})
-        for score_key in ["s_accuracy", "s_true_integrity", "s_efficiency", "s_safety", "s_alignment_simple", "esi_score"]:
-            if score_key not in current_result: current_result[score_key] = 0.0
-        return current_result
+        return _mark_unexpected_pipeline_error(current_result, e_pipeline, "judge", current_result.get("worker_model_id", "N/A"), prompt_version, question[:200])
+
+async def process_single_item_full_pipeline(record: DatasetRecord,
+                                            worker_model_id: str,
+                                            prompt_version: str,
+                                            worker_prompt_template_str: str,
+                                            accuracy_judge_prompt_str: str, 
+                                            skipped_log_file_for_combo: str,
+                                            dataset_short_name_for_item: str 
+                                           ) -> Dict[str, Any]:
+    """Runs both stages back to back for a single item."""
+    current_result = await run_worker_stage(record, worker_model_id, prompt_version,
+                                            worker_prompt_template_str, skipped_log_file_for_combo, dataset_short_name_for_item)
+    if current_result["status"] != "PENDING_ACCURACY_JUDGE": return current_result
+    return await run_judge_stage(current_result, accuracy_judge_prompt_str, prompt_version)
+
+class ComboAggregates:
+    """Running counts and score sums for one combination, so totals never need the full result list in memory."""
+    SCORE_KEYS = {"accuracy": "s_accuracy", "true_integrity": "s_true_integrity", "efficiency": "s_efficiency",
+                  "safety": "s_safety", "alignment_simple": "s_alignment_simple", "esi": "esi_score"}
+    TIME_KEYS = {"worker_response_times": "worker_response_time_seconds",
+                 "accuracy_judge_response_times": "accuracy_judge_response_time_seconds",
+                 "integrity_judge_response_times": "integrity_judge_response_time_seconds"}
+
+    def __init__(self, collect_scored_items: bool = False):
+        self.result_entries_count = 0
+        self.items_fully_scored_count = 0
+        self.accuracy_correct_count = 0
+        self.pending_batch_judge_count = 0
+        self.accuracy_verdict_count = 0
+        self.pre_judge_counts = {"matches": 0, "mismatches": 0}
+        self.stream_sums = {"ttft_seconds": 0.0, "tokens_per_second": 0.0}
+        self.stream_counts = {"ttft_seconds": 0, "tokens_per_second": 0}
+        self.stream_early_stop_count = 0
+        self.api_error_counts = {"WORKER": 0, "ACCURACY_JUDGE": 0, "INTEGRITY_JUDGE": 0}
+        self.processing_error_counts = {"INPUT_JSON_DECODE": 0, "UNEXPECTED_PIPELINE": 0, "SKIPPED_DATA_INCOMPLETE": 0}
+        self.sums = {key: 0.0 for key in list(self.SCORE_KEYS) + list(self.TIME_KEYS)}
+        self.counts = {key: 0 for key in self.sums}
+        # (scenario_code, esi_score, s_accuracy) of COMPLETED items, kept only for the leaderboard's bootstrap intervals
+        self.scored_items = [] if collect_scored_items else None
+
+    def add(self, item_result: Dict[str, Any]):
+        self.result_entries_count += 1
+        status = item_result.get("status", "UNKNOWN_ERROR")
+        if status == "COMPLETED":
+            self.items_fully_scored_count += 1
+            for agg_key, result_key in self.SCORE_KEYS.items():
+                self.sums[agg_key] += item_result.get(result_key, 0.0); self.counts[agg_key] += 1
+            if item_result.get("s_accuracy", 0.0) == 100.0: self.accuracy_correct_count += 1
+            for agg_key, result_key in self.TIME_KEYS.items():
+                if item_result.get(result_key) is not None:
+                    self.sums[agg_key] += item_result[result_key]; self.counts[agg_key] += 1
+            if self.scored_items is not None:
+                self.scored_items.append((item_result.get("scenario_code", "N/A"), item_result.get("esi_score", 0.0), item_result.get("s_accuracy", 0.0)))
+
+        if status == "ERROR_WORKER_API": self.api_error_counts["WORKER"] += 1
+        elif status == "ERROR_ACCURACY_JUDGE": self.api_error_counts["ACCURACY_JUDGE"] += 1
+        elif status == "ERROR_INTEGRITY_JUDGE": self.api_error_counts["INTEGRITY_JUDGE"] += 1
+        elif status == "ERROR_INPUT_JSON_DECODE": self.processing_error_counts["INPUT_JSON_DECODE"] +=1
+        elif status in ("ERROR_UNEXPECTED_PIPELINE", "ERROR_FUTURE_EXCEPTION"): self.processing_error_counts["UNEXPECTED_PIPELINE"] +=1
+        elif status == "SKIPPED_DATA_INCOMPLETE": self.processing_error_counts["SKIPPED_DATA_INCOMPLETE"] +=1
+        elif status == "PENDING_BATCH_JUDGE": self.pending_batch_judge_count += 1
+
+        for stream_key in self.stream_sums:
+            if item_result.get(f"worker_{stream_key}") is not None:
+                self.stream_sums[stream_key] += item_result[f"worker_{stream_key}"]; self.stream_counts[stream_key] += 1
+        if item_result.get("worker_stream_stopped_early"): self.stream_early_stop_count += 1
+
+        if item_result.get("accuracy_verdict_source"):
+            self.accuracy_verdict_count += 1
+            if item_result["accuracy_verdict_source"] == "pre_judge":
+                self.pre_judge_counts["matches" if item_result.get("judge_verdict_is_correct") else "mismatches"] += 1
+
+    @property
+    def pre_judged_count(self) -> int:
+        return self.pre_judge_counts["matches"] + self.pre_judge_counts["mismatches"]
+
+    def average(self, agg_key: str) -> Optional[float]:
+        return self.sums[agg_key] / self.counts[agg_key] if self.counts[agg_key] else None
+
+    def stream_average(self, stream_key: str) -> Optional[float]:
+        return round(self.stream_sums[stream_key] / self.stream_counts[stream_key], 3) if self.stream_counts[stream_key] else None
+
+    def progress_postfix(self) -> Dict[str, str]:
+        postfix_stats = {}
+        if self.counts["esi"]: postfix_stats["AvgESI"] = f"{self.average('esi'):.1f}"
+        if self.counts["accuracy"]: postfix_stats["AvgACC"] = f"{self.average('accuracy'):.1f}"
+        err_counts_display = []
+        if self.api_error_counts["WORKER"] > 0: err_counts_display.append(f"W.E:{self.api_error_counts['WORKER']}")
+        if self.api_error_counts["ACCURACY_JUDGE"] > 0: err_counts_display.append(f"AJ.E:{self.api_error_counts['ACCURACY_JUDGE']}")
+        if self.api_error_counts["INTEGRITY_JUDGE"] > 0: err_counts_display.append(f"IJ.E:{self.api_error_counts['INTEGRITY_JUDGE']}")
+        if err_counts_display: postfix_stats["Errs"] = ",".join(err_counts_display)
+        if self.pending_batch_judge_count: postfix_stats["ToBatch"] = str(self.pending_batch_judge_count)
+        return postfix_stats
+
+class ComboContext:
+    """
+    Per-combination constants that travel with each of its items through the pipeline stages, plus the
+    output locations its report is written to. With `defer_judging` (batch judge mode) items stop after
+    the worker stage as PENDING_BATCH_JUDGE and are judged later by run_batch_judging. `sampling` holds
+    the running estimates of a sampled (adaptive or screening) combination, see adaptive_sampling.py.
+    """
+    __slots__ = ("dataset_short_name", "worker_model_id", "prompt_version", "worker_prompt_template_str",
+                 "accuracy_judge_prompt_str", "skipped_log_file", "final_output_file", "summary_file", "journal",
+                 "total_input_items", "items_resumed", "defer_judging", "sampling", "results_queue", "stats", "metrics")
 
-def run_evaluation_for_combination(dataset_short_name: str, 
-                                   input_lines: list,
-                                   worker_model_id: str, 
-                                   prompt_version: str, 
-                                   final_output_filename_template: str,
-                                   skipped_log_filename_template: str, 
-                                   summary_filename_template: str,
-                                   accuracy_judge_prompt_to_use: str,
-                                   tqdm_position: int = 0,
-                                   parent_desc: str = "",
-                                   max_concurrent_items: int = 5):
+    def __init__(self, dataset_short_name: str, worker_model_id: str, prompt_version: str, worker_prompt_template_str: str,
+                 accuracy_judge_prompt_str: str, skipped_log_file: str, final_output_file: str, summary_file: str,
+                 journal: CheckpointJournal, total_input_items: int, defer_judging: bool = False,
+                 sampling: Optional[SampleEstimates] = None):
+        self.dataset_short_name = dataset_short_name
+        self.worker_model_id = worker_model_id
+        self.prompt_version = prompt_version
+        self.worker_prompt_template_str = worker_prompt_template_str
+        self.accuracy_judge_prompt_str = accuracy_judge_prompt_str
+        self.skipped_log_file = skipped_log_file
+        self.final_output_file = final_output_file
+        self.summary_file = summary_file
+        self.journal = journal
+        self.total_input_items = total_input_items
+        self.items_resumed = 0
+        self.defer_judging = defer_judging
+        self.sampling = sampling
+        self.results_queue: asyncio.Queue = asyncio.Queue()
+        self.stats: Counter = Counter()
+        self.metrics = MetricsRegistry()
+
+@contextmanager
+def combo_scope(combo: ComboContext):
+    """Attributes the stats and metrics recorded inside the block to `combo` (as well as to the run)."""
+    stats_token, metrics_token = current_combo_stats.set(combo.stats), current_combo_metrics.set(combo.metrics)
+    try:
+        yield
+    finally:
+        current_combo_metrics.reset(metrics_token)
+        current_combo_stats.reset(stats_token)
+
+class ItemJob:
+    __slots__ = ("original_idx", "record", "combo", "item_result", "queued_at")
+
+    def __init__(self, original_idx: int, record: DatasetRecord, combo: ComboContext):
+        self.original_idx = original_idx
+        self.record = record
+        self.combo = combo
+        self.item_result: Optional[Dict[str, Any]] = None
+        self.queued_at = time.perf_counter() # Reset each time the job enters a stage queue
+
+class StagedPipeline:
+    """
+    Worker stage -> bounded queue -> judge stage, shared by every combination on the event loop.
+    Each stage has its own pool of coroutines (its concurrency budget), so a slow worker model does not
+    leave the judge endpoints idle and slow judges do not hold up new worker calls. The bounded queues
+    give backpressure: when judging falls behind, worker coroutines wait instead of piling up results.
+    The worker queue hands out the job with the highest predicted cost first (see work_ordering.py);
+    jobs submitted with equal cost keep their submission order.
+    """
+    def __init__(self, worker_stage_concurrency: int, judge_stage_concurrency: int):
+        self.worker_stage_concurrency = worker_stage_concurrency
+        self.judge_stage_concurrency = judge_stage_concurrency
+        self.worker_queue: asyncio.PriorityQueue = asyncio.PriorityQueue(maxsize=worker_stage_concurrency)
+        self._submit_sequence = itertools.count()
+        self.judge_queue: asyncio.Queue = asyncio.Queue(maxsize=judge_stage_concurrency)
+        self._stage_tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self._stage_tasks = [asyncio.create_task(self._worker_stage_loop()) for _ in range(self.worker_stage_concurrency)]
+        self._stage_tasks += [asyncio.create_task(self._judge_stage_loop()) for _ in range(self.judge_stage_concurrency)]
+
+    async def stop(self):
+        for stage_task in self._stage_tasks: stage_task.cancel()
+        await asyncio.gather(*self._stage_tasks, return_exceptions=True)
+        self._stage_tasks = []
+
+    async def submit(self, job: ItemJob, predicted_cost: float = 0.0):
+        job.queued_at = time.perf_counter()
+        await self.worker_queue.put((-predicted_cost, next(self._submit_sequence), job))
+
+    async def _worker_stage_loop(self):
+        latency_history = get_latency_history()
+        while True:
+            _, _, job = await self.worker_queue.get()
+            combo = job.combo
+            try:
+                with combo_scope(combo):
+                    observe("worker_queue_wait_seconds", time.perf_counter() - job.queued_at)
+                    with in_flight("items_in_worker_stage"), timed("worker_stage_seconds"):
+                        job.item_result = await run_worker_stage(job.record, combo.worker_model_id, combo.prompt_version,
+                                                                 combo.worker_prompt_template_str, combo.skipped_log_file, combo.dataset_short_name)
+                if latency_history is not None and job.item_result.get("worker_response_time_seconds") is not None:
+                    latency_history.record(combo.worker_model_id, combo.prompt_version, combo.dataset_short_name, job.record.scenario_code,
+                                           prompt_chars(job.record), job.item_result["worker_response_time_seconds"])
+                if job.item_result["status"] == "PENDING_ACCURACY_JUDGE" and combo.defer_judging:
+                    job.item_result["status"] = "PENDING_BATCH_JUDGE"
+                    combo.results_queue.put_nowait((job.original_idx, job.item_result, None))
+                elif job.item_result["status"] == "PENDING_ACCURACY_JUDGE":
+                    job.record = None # No longer needed; keep queued jobs small
+                    job.queued_at = time.perf_counter()
+                    await self.judge_queue.put(job)
+                else:
+                    combo.results_queue.put_nowait((job.original_idx, job.item_result, None))
+            except Exception as exc:
+                combo.results_queue.put_nowait((job.original_idx, None, exc))
+            finally:
+                self.worker_queue.task_done()
+
+    async def _judge_stage_loop(self):
+        while True:
+            job = await self.judge_queue.get()
+            combo = job.combo
+            try:
+                with combo_scope(combo):
+                    observe("judge_queue_wait_seconds", time.perf_counter() - job.queued_at)
+                    with in_flight("items_in_judge_stage"), timed("judge_stage_seconds"):
+                        item_result = await run_judge_stage(job.item_result, combo.accuracy_judge_prompt_str, combo.prompt_version)
+                combo.results_queue.put_nowait((job.original_idx, item_result, None))
+            except Exception as exc:
+                combo.results_queue.put_nowait((job.original_idx, None, exc))
+            finally:
+                self.judge_queue.task_done()
+
+async def run_evaluation_for_combination(dataset_short_name: str, 
+                                         dataset_cursor: DatasetCursor,
+                                         worker_model_id: str, 
+                                         prompt_version: str, 
+                                         final_output_filename_template: str,
+                                         skipped_log_filename_template: str, 
+                                         summary_filename_template: str,
+                                         accuracy_judge_prompt_to_use: str,
+                                         pipeline: StagedPipeline,
+                                         tqdm_position: int = 0,
+                                         parent_desc: str = "",
+                                         resume: bool = False,
+                                         judge_mode: str = "interactive",
+                                         journal_path: Optional[str] = None,
+                                         write_report: bool = True,
+                                         sampling: Optional[SampleEstimates] = None) -> Optional[ComboContext]:
+    """
+    Feeds every item of one (dataset, model, prompt) combination, read through its cursor on the
+    dataset's shared reader, into the shared staged pipeline and
+    appends each result to the combination's checkpoint journal as soon as it finishes. The ordered
+    ESI results file and the summary are then built from the journal. With `resume`, items already
+    completed in the journal of an earlier run are not submitted again.
+    Many combinations run concurrently on the same event loop and share the same pipeline stages.
+    In batch judge mode the report is written by run_batch_judging once the judge batches are merged.
+    Shard workers pass their own `journal_path` and `write_report=False`; merge_shard_results writes
+    the report once every shard of the combination is done.
+    With `sampling`, the cursor walks a stratified sample (adaptive_sampling.py); every scored item
+    updates the estimates, and an adaptive combination stops submitting once they are precise enough.
+    Returns the combination's context, or None when the combination could not run.
+    """
     # Sanitize model_id for filename: replace / with __ and : with _
     safe_model_id_filename = worker_model_id.replace("/", "__").replace(":", "_")
     
     final_output_file = final_output_filename_template.format(dataset_short_name=dataset_short_name, model_id=safe_model_id_filename, prompt_version=prompt_version)
     combo_skipped_log_file = skipped_log_filename_template.format(dataset_short_name=dataset_short_name, model_id=safe_model_id_filename, prompt_version=prompt_version) 
     summary_file = summary_filename_template.format(dataset_short_name=dataset_short_name, model_id=safe_model_id_filename, prompt_version=prompt_version)
+    journal = CheckpointJournal(journal_path or APP_CONFIG.JOURNAL_FILE_TEMPLATE.format(dataset_short_name=dataset_short_name, model_id=safe_model_id_filename, prompt_version=prompt_version))
+    defer_judging = judge_mode == "batch"
 
     os.makedirs(os.path.dirname(final_output_file), exist_ok=True)
-    if os.path.exists(final_output_file): 
-        logger.info(f"Output file {final_output_file} exists, removing for a fresh run.")
+    if write_report and os.path.exists(final_output_file): 
+        logger.info(f"Output file {final_output_file} exists, removing; it will be rebuilt from the checkpoint journal.")
         try: os.remove(final_output_file)
         except OSError as e: logger.warning(f"Could not remove existing output file {final_output_file}: {e}")
-    if os.path.exists(combo_skipped_log_file): 
-        try: os.remove(combo_skipped_log_file)
-        except OSError as e: logger.warning(f"Could not remove existing combo skipped log {combo_skipped_log_file}: {e}")
-
-    all_final_results_combo_ordered = [None] * len(input_lines)
-    api_error_counts = {"WORKER": 0, "ACCURACY_JUDGE": 0, "INTEGRITY_JUDGE": 0}
-    processing_error_counts = {"INPUT_JSON_DECODE": 0, "UNEXPECTED_PIPELINE": 0, "SKIPPED_DATA_INCOMPLETE": 0}
-    items_fully_scored_count = 0 
-    agg_scores_combo = {
-        "accuracy": [], "true_integrity": [], "efficiency": [], "safety": [], 
-        "alignment_simple": [], "esi": [],
-        "worker_response_times": [], "accuracy_judge_response_times": [], "integrity_judge_response_times": []
-    }
+    completed_item_ids = set()
+    if resume:
+        # Items left waiting for a batch judge are finished as far as the worker is concerned in batch mode;
+        # an interactive resume runs them through the judges again.
+        retry_statuses = RESUME_RETRY_STATUSES if defer_judging else RESUME_RETRY_STATUSES | {"PENDING_BATCH_JUDGE"}
+        completed_item_ids = journal.load_completed_ids(retry_statuses)
+        logger.info(f"Resuming (DS: {dataset_short_name}, M: {worker_model_id}, P: {prompt_version}): {len(completed_item_ids)} item(s) already completed in {journal.journal_path}")
+    else:
+        try: journal.reset()
+        except OSError as e: logger.warning(f"Could not remove existing checkpoint journal {journal.journal_path}: {e}")
+        if os.path.exists(combo_skipped_log_file): 
+            try: os.remove(combo_skipped_log_file)
+            except OSError as e: logger.warning(f"Could not remove existing combo skipped log {combo_skipped_log_file}: {e}")
+
+    live_aggregates = ComboAggregates()
 
     try:
         worker_prompt_template_str = get_worker_prompt_template(prompt_version)
@@ -212,116 +557,202 @@ def run_evaluation_for_combination(dataset_short_name: str,
             logger.info(f"Error summary written to {summary_file}")
         except Exception as e_dump: 
             logger.error(f"Could not write error summary file '{summary_file}': {e_dump}")
-        return
+        await dataset_cursor.close()
+        return None
 
     progress_bar_desc = f"{parent_desc}DS={dataset_short_name}, M={worker_model_id.split('/')[-1][:15].replace(':', '_')}, P={prompt_version}" # Also sanitize model name in desc
     
-    futures_map = {} 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrent_items, thread_name_prefix=f"{dataset_short_name}_{safe_model_id_filename}_{prompt_version}") as executor:
-        for idx, line_content in enumerate(input_lines):
-            future = executor.submit(process_single_item_full_pipeline, 
-                                     idx + 1, line_content, worker_model_id, 
-                                     prompt_version, worker_prompt_template_str,
-                                     accuracy_judge_prompt_to_use, 
-                                     combo_skipped_log_file,
-                                     dataset_short_name
-                                     )
-            futures_map[future] = idx 
-
-        pbar = tqdm(concurrent.futures.as_completed(futures_map), total=len(input_lines), 
-                    desc=progress_bar_desc, unit="item", ncols=120, dynamic_ncols=True, leave=True, position=tqdm_position)
-
-        for future in pbar: 
-            original_idx = futures_map[future] 
-            try:
-                item_result = future.result()
-                if item_result:
-                    all_final_results_combo_ordered[original_idx] = item_result
-                    status = item_result.get("status", "UNKNOWN_ERROR")
-
-                    if status == "COMPLETED":
-                        items_fully_scored_count += 1
-                        agg_scores_combo["accuracy"].append(item_result.get("s_accuracy", 0.0))
-                        agg_scores_combo["true_integrity"].append(item_result.get("s_true_integrity", 0.0))
-                        agg_scores_combo["efficiency"].append(item_result.get("s_efficiency", 0.0))
-                        agg_scores_combo["safety"].append(item_result.get("s_safety", 0.0))
-                        agg_scores_combo["alignment_simple"].append(item_result.get("s_alignment_simple", 0.0))
-                        agg_scores_combo["esi"].append(item_result.get("esi_score", 0.0))
-                        if item_result.get("worker_response_time_seconds") is not None: agg_scores_combo["worker_response_times"].append(item_result["worker_response_time_seconds"])
-                        if item_result.get("accuracy_judge_response_time_seconds") is not None: agg_scores_combo["accuracy_judge_response_times"].append(item_result["accuracy_judge_response_time_seconds"])
-                        if item_result.get("integrity_judge_response_time_seconds") is not None: agg_scores_combo["integrity_judge_response_times"].append(item_result["integrity_judge_response_time_seconds"])
-                    
-                    if status == "ERROR_WORKER_API": api_error_counts["WORKER"] += 1
-                    elif status == "ERROR_ACCURACY_JUDGE": api_error_counts["ACCURACY_JUDGE"] += 1
-                    elif status == "ERROR_INTEGRITY_JUDGE": api_error_counts["INTEGRITY_JUDGE"] += 1
-                    elif status == "ERROR_INPUT_JSON_DECODE": processing_error_counts["INPUT_JSON_DECODE"] +=1
-                    elif status == "ERROR_UNEXPECTED_PIPELINE": processing_error_counts["UNEXPECTED_PIPELINE"] +=1
-                    elif status == "SKIPPED_DATA_INCOMPLETE": processing_error_counts["SKIPPED_DATA_INCOMPLETE"] +=1
-                    
-                    postfix_stats = {}
-                    if agg_scores_combo["esi"]: avg_esi = sum(agg_scores_combo['esi'])/len(agg_scores_combo['esi']) if agg_scores_combo['esi'] else 0; postfix_stats["AvgESI"] = f"{avg_esi:.1f}"
-                    if agg_scores_combo["accuracy"]: avg_acc = sum(agg_scores_combo['accuracy'])/len(agg_scores_combo['accuracy']) if agg_scores_combo['accuracy'] else 0; postfix_stats["AvgACC"] = f"{avg_acc:.1f}"
-                    err_counts_display = []
-                    if api_error_counts["WORKER"] > 0: err_counts_display.append(f"W.E:{api_error_counts['WORKER']}")
-                    if api_error_counts["ACCURACY_JUDGE"] > 0: err_counts_display.append(f"AJ.E:{api_error_counts['ACCURACY_JUDGE']}")
-                    if api_error_counts["INTEGRITY_JUDGE"] > 0: err_counts_display.append(f"IJ.E:{api_error_counts['INTEGRITY_JUDGE']}")
-                    if err_counts_display: postfix_stats["Errs"] = ",".join(err_counts_display)
-                    pbar.set_postfix(postfix_stats, refresh=True) 
-                else: 
-                    tqdm.write(f"Warning: Thread for item original_idx {original_idx} (DS: {dataset_short_name}, M: {worker_model_id}, P: {prompt_version}) returned None unexpectedly.")
-                    all_final_results_combo_ordered[original_idx] = {"id": original_idx + 1, "dataset_short_name": dataset_short_name, "status": "ERROR_THREAD_RETURNED_NONE", "processing_error_details": "Thread processing returned None."}
-            except Exception as exc: 
-                tqdm.write(f'CRITICAL FUTURE ERROR for item original_idx {original_idx} (DS: {dataset_short_name}, M: {worker_model_id}, P: {prompt_version}): {exc}')
-                logger.exception(f"Unhandled exception from future for item original_idx {original_idx} (DS: {dataset_short_name}):")
-                with open(combo_skipped_log_file, "a", encoding="utf-8") as sf: 
-                    sf.write(f"CRITICAL FUTURE ERROR (item original_idx {original_idx}): {exc} for DS: {dataset_short_name}, M: {worker_model_id}, P: {prompt_version}\n")
-                all_final_results_combo_ordered[original_idx] = {"id": original_idx + 1, "dataset_short_name": dataset_short_name, "status": "ERROR_FUTURE_EXCEPTION", "processing_error_details": str(exc)}
-                processing_error_counts["UNEXPECTED_PIPELINE"] +=1
-
-    all_final_results_combo_filtered = [res for res in all_final_results_combo_ordered if res is not None]
+    combo = ComboContext(dataset_short_name, worker_model_id, prompt_version, worker_prompt_template_str,
+                         accuracy_judge_prompt_to_use, combo_skipped_log_file, final_output_file, summary_file,
+                         journal, dataset_cursor.total_items, defer_judging=defer_judging, sampling=sampling)
+    combo.items_resumed = len(completed_item_ids)
+    results_queue = combo.results_queue
+    if sampling is not None and completed_item_ids:
+        sampled_item_ids = set(dataset_cursor.item_ids)
+        for res_item in journal.iter_latest_results_in_id_order():
+            if res_item["id"] in sampled_item_ids: sampling.add(res_item)
+
+    async def _produce_items():
+        # Longest-first: read up to WORK_ORDER_WINDOW records (never more than the shared reader lets one
+        # combination run ahead), then submit them slowest first. File order submits each record as it is read,
+        # and so does an adaptive combination: stopping early must leave a prefix of its stratified order.
+        latency_history = get_latency_history()
+        early_stop = sampling is not None and sampling.early_stop
+        window_size = max(1, min(APP_CONFIG.WORK_ORDER_WINDOW, APP_CONFIG.DATASET_STREAM_WINDOW)) if latency_history is not None and not early_stop else 1
+        submitted_count = 0
+        async def _submit_window(records: List[DatasetRecord]):
+            nonlocal submitted_count
+            ordered_records = (latency_history.longest_first(records, worker_model_id, prompt_version, dataset_short_name)
+                               if latency_history is not None else [(0.0, record) for record in records])
+            for predicted_seconds, record in ordered_records:
+                await pipeline.submit(ItemJob(record.item_id - 1, record, combo), predicted_seconds)
+                submitted_count += 1
+        try:
+            window_records: List[DatasetRecord] = []
+            async for record in dataset_cursor:
+                if early_stop and sampling.stop_reason is not None: break
+                if record.item_id in completed_item_ids: continue
+                window_records.append(record)
+                if len(window_records) >= window_size:
+                    await _submit_window(window_records)
+                    window_records = []
+            if window_records: await _submit_window(window_records)
+        finally:
+            await dataset_cursor.close()
+        results_queue.put_nowait((None, submitted_count, None)) # Sentinel: every item has been submitted
+
+    producer_task = asyncio.create_task(_produce_items())
+    pbar = tqdm(total=dataset_cursor.total_items, initial=len(completed_item_ids),
+                desc=progress_bar_desc, unit="item", ncols=120, dynamic_ncols=True, leave=True, position=tqdm_position)
+
+    submitted_count = None; received_count = 0
+    while submitted_count is None or received_count < submitted_count:
+        original_idx, item_result, exc = await results_queue.get()
+        if original_idx is None:
+            submitted_count = item_result
+            continue
+        received_count += 1
+        pbar.update(1)
+        try:
+            if exc is not None: raise exc
+            if item_result:
+                journal.append(item_result)
+                live_aggregates.add(item_result)
+                if sampling is not None: sampling.add(item_result)
+                pbar.set_postfix(live_aggregates.progress_postfix(), refresh=True) 
+            else: 
+                tqdm.write(f"Warning: Item worker for item original_idx {original_idx} (DS: {dataset_short_name}, M: {worker_model_id}, P: {prompt_version}) returned None unexpectedly.")
+                journal.append({"id": original_idx + 1, "dataset_short_name": dataset_short_name, "status": "ERROR_THREAD_RETURNED_NONE", "processing_error_details": "Item pipeline returned None."})
+        except Exception as exc: 
+            tqdm.write(f'CRITICAL FUTURE ERROR for item original_idx {original_idx} (DS: {dataset_short_name}, M: {worker_model_id}, P: {prompt_version}): {exc}')
+            logger.exception(f"Unhandled exception from item worker for item original_idx {original_idx} (DS: {dataset_short_name}):")
+            with open(combo_skipped_log_file, "a", encoding="utf-8") as sf: 
+                sf.write(f"CRITICAL FUTURE ERROR (item original_idx {original_idx}): {exc} for DS: {dataset_short_name}, M: {worker_model_id}, P: {prompt_version}\n")
+            error_result = {"id": original_idx + 1, "dataset_short_name": dataset_short_name, "status": "ERROR_FUTURE_EXCEPTION", "processing_error_details": str(exc)}
+            journal.append(error_result)
+            live_aggregates.add(error_result)
+
+    pbar.close()
+    await producer_task
+    journal.close()
+    if sampling is not None and sampling.stop_reason is not None:
+        logger.info(f"Adaptive sampling stopped (DS: {dataset_short_name}, M: {worker_model_id}, P: {prompt_version}) after {received_count + combo.items_resumed} "
+                    f"of {dataset_cursor.total_items} items: {sampling.stop_reason}")
+
+    if write_report and not defer_judging: write_combination_report(combo)
+    return combo
+
+def write_combination_report(combo: ComboContext):
+    """Builds the ordered ESI results file and the summary of one combination from its checkpoint journal."""
+    dataset_short_name, worker_model_id, prompt_version = combo.dataset_short_name, combo.worker_model_id, combo.prompt_version
+    final_output_file, summary_file, combo_skipped_log_file = combo.final_output_file, combo.summary_file, combo.skipped_log_file
+    journal, combo_stats = combo.journal, combo.stats
+
+    # Build the ordered output and the totals from the journal, which also covers items finished by earlier (resumed) runs.
+    leaderboard = get_leaderboard()
+    aggregates = ComboAggregates(collect_scored_items=leaderboard is not None)
+    columnar_writer = open_columnar_result_writer(
+        {"dataset_short_name": dataset_short_name, "model_id": worker_model_id.replace("/", "__").replace(":", "_"), "prompt_version": prompt_version},
+        {"dataset_short_name": dataset_short_name, "worker_model_id": worker_model_id, "worker_prompt_version": prompt_version})
     with open(final_output_file, "w", encoding="utf-8") as out_f:
-        for res_item in all_final_results_combo_filtered:
+        for res_item in journal.iter_latest_results_in_id_order():
+            aggregates.add(res_item)
             out_f.write(json.dumps(res_item, ensure_ascii=False) + "\n")
+            if columnar_writer is not None: columnar_writer.add(res_item)
+    if columnar_writer is not None: columnar_writer.close()
+    items_fully_scored_count = aggregates.items_fully_scored_count
+    api_error_counts, processing_error_counts = aggregates.api_error_counts, aggregates.processing_error_counts
 
     summary_header = f"\n--- Final ESI Report for: Dataset='{dataset_short_name}', Worker Model='{worker_model_id}', Prompt Version='{prompt_version}' ---"
     print(summary_header) 
     print(f"Final ESI results saved to: {final_output_file}")
-    total_input_items = len(input_lines)
+    if columnar_writer is not None: print(f"Columnar results saved to: {columnar_writer.scores_path} (text fields: {columnar_writer.text_path})")
+    total_input_items = combo.total_input_items
     print(f"Total items from input file: {total_input_items}")
-    print(f"Items for which processing was attempted (result entries created): {len(all_final_results_combo_filtered)}")
+    print(f"Items for which processing was attempted (result entries created): {aggregates.result_entries_count}")
+    if combo.items_resumed: print(f"Items carried over from the checkpoint journal: {combo.items_resumed}")
     print(f"Items successfully scored (status COMPLETED): {items_fully_scored_count}")
+    if combo.defer_judging:
+        print(f"Judge calls sent through the batch API: {combo_stats['batch_judge_requests']}")
+        if aggregates.pending_batch_judge_count: print(f"Items still waiting for a batch judge result: {aggregates.pending_batch_judge_count}")
+    if combo_stats["combined_judge_calls"]: print(f"Combined accuracy + integrity judge calls: {combo_stats['combined_judge_calls']}")
+    if combo_stats["packed_judge_items"] or combo_stats["packed_judge_fallbacks"]:
+        print(f"Judge verdicts from packed calls: {combo_stats['packed_judge_items']} ({combo_stats['packed_judge_fallbacks']} judged one by one instead)")
     print(f"Worker API errors: {api_error_counts['WORKER']}")
     print(f"Accuracy Judge API/Parse errors: {api_error_counts['ACCURACY_JUDGE']}")
     print(f"Integrity Judge API/Parse errors: {api_error_counts['INTEGRITY_JUDGE']}")
     print(f"Input JSON Decode errors during pipeline: {processing_error_counts['INPUT_JSON_DECODE']}")
     print(f"Skipped due to incomplete input data: {processing_error_counts['SKIPPED_DATA_INCOMPLETE']}")
     print(f"Other unhandled pipeline errors: {processing_error_counts['UNEXPECTED_PIPELINE']}")
+    print(f"Response cache hits/misses: {combo_stats['cache_hits']}/{combo_stats['cache_misses']}")
+    if combo.sampling is not None:
+        sampling_summary = combo.sampling.summary()
+        for metric_name in ("accuracy", "esi"):
+            interval = sampling_summary[metric_name]
+            if interval: print(f"Sampled {metric_name.upper()} estimate: {interval['mean']:.2f} [{interval['ci'][0]:.2f}, {interval['ci'][1]:.2f}] ({sampling_summary['confidence']:.0%} CI)")
+        print(f"Adaptive sampling: " + (f"stopped early, {sampling_summary['stop_reason']}" if sampling_summary["stopped_early"] else "target CI widths not reached; every item was evaluated"))
+    if combo_stats["hedged_requests"]: print(f"Hedged requests: {combo_stats['hedged_requests']} (won by the duplicate: {combo_stats['hedge_wins']})")
+    if aggregates.stream_counts["ttft_seconds"]:
+        print(f"Worker streaming: average TTFT {aggregates.stream_average('ttft_seconds')}s, average {aggregates.stream_average('tokens_per_second')} tokens/s, "
+              f"{aggregates.stream_early_stop_count} item(s) stopped early after the final answer")
+    if combo_stats["api_prompt_tokens"]:
+        print(f"Prompt tokens served from the provider prompt cache: {combo_stats['api_cached_prompt_tokens']}/{combo_stats['api_prompt_tokens']} (layout: {APP_CONFIG.PROMPT_LAYOUT})")
+    latency_metrics = combo.metrics.summarize()
+    for series_name, label in (("worker_stage_seconds", "Worker stage"), ("judge_queue_wait_seconds", "Judge queue wait"), ("judge_stage_seconds", "Judge stage")):
+        series = latency_metrics.get(series_name)
+        if series and series["count"]:
+            print(f"{label} latency: p50 {series['p50']:.2f}s, p95 {series['p95']:.2f}s, p99 {series['p99']:.2f}s (max {series['max']:.2f}s)")
+    pre_judge_rate = ratio_or_none(aggregates.pre_judged_count, aggregates.accuracy_verdict_count)
+    print(f"Accuracy decided by the deterministic pre-judge (no judge call): {aggregates.pre_judged_count}/{aggregates.accuracy_verdict_count}"
+          + (f" ({pre_judge_rate:.1%})" if pre_judge_rate is not None else ""))
 
     summary_combo_data = {
         "combination_details": {"dataset_short_name": dataset_short_name, "worker_model_id": worker_model_id, "prompt_version": prompt_version},
         "processing_summary": {
             "total_input_items": total_input_items, "items_pipeline_completed_for_scoring": items_fully_scored_count,
+            "items_resumed_from_journal": combo.items_resumed,
             "worker_api_errors": api_error_counts['WORKER'], "accuracy_judge_api_errors": api_error_counts['ACCURACY_JUDGE'],
             "integrity_judge_api_errors": api_error_counts['INTEGRITY_JUDGE'],
             "input_json_decode_errors_in_pipeline": processing_error_counts['INPUT_JSON_DECODE'],
             "skipped_data_incomplete_in_pipeline": processing_error_counts['SKIPPED_DATA_INCOMPLETE'],
             "other_unhandled_pipeline_errors": processing_error_counts['UNEXPECTED_PIPELINE'],
+            "items_pending_batch_judge": aggregates.pending_batch_judge_count,
+        },
+        "judging": {"mode": "batch" if combo.defer_judging else "interactive", "batch_judge_requests": combo_stats.get("batch_judge_requests", 0),
+                    "combined_judge_calls": combo_stats.get("combined_judge_calls", 0)},
+        "accuracy_pre_judge": {
+            "enabled": APP_CONFIG.PRE_JUDGE_ENABLED, "items_with_accuracy_verdict": aggregates.accuracy_verdict_count,
+            "short_circuited": aggregates.pre_judged_count, "short_circuit_rate": pre_judge_rate,
+            "short_circuit_matches": aggregates.pre_judge_counts["matches"], "short_circuit_mismatches": aggregates.pre_judge_counts["mismatches"]
+        },
+        "response_cache": summarize_cache_stats(combo_stats),
+        "prompt_caching": summarize_prompt_caching(combo_stats),
+        "judge_dedup": summarize_dedup_stats(combo_stats),
+        "judge_packing": summarize_packing_stats(combo_stats),
+        "worker_streaming": {
+            "enabled": APP_CONFIG.WORKER_STREAMING, "early_stop": APP_CONFIG.WORKER_STREAM_EARLY_STOP,
+            "items_streamed": aggregates.stream_counts["ttft_seconds"], "average_ttft_seconds": aggregates.stream_average("ttft_seconds"),
+            "average_tokens_per_second": aggregates.stream_average("tokens_per_second"), "items_stopped_early": aggregates.stream_early_stop_count
         },
-        "metrics_summary": {}, "final_output_file": final_output_file,
+        "http_connections": summarize_connection_stats(combo_stats),
+        "rate_limiting": summarize_rate_limit_stats(combo_stats),
+        "circuit_breaker": summarize_circuit_breaker_stats(combo_stats),
+        "hedging": summarize_hedging_stats(combo_stats),
+        "sampling": combo.sampling.summary() if combo.sampling is not None else {"mode": "full"},
+        "latency_metrics": latency_metrics,
+        "metrics_summary": {}, "final_output_file": final_output_file, "checkpoint_journal": journal.journal_path,
         "skipped_items_log": combo_skipped_log_file if os.path.exists(combo_skipped_log_file) and os.path.getsize(combo_skipped_log_file) > 0 else "None"
     }
     
     # Populate metrics_summary, ensuring it exists even if no items scored
     if items_fully_scored_count > 0:
         for metric_key in ["accuracy", "true_integrity", "efficiency", "safety", "alignment_simple", "esi"]:
-            scores_list = agg_scores_combo.get(metric_key, []) 
-            if scores_list: 
-                avg_val = sum(scores_list) / len(scores_list)
+            avg_val = aggregates.average(metric_key)
+            if avg_val is not None: 
                 summary_combo_data["metrics_summary"][f"average_{metric_key}"] = round(avg_val, 2)
                 display_name = metric_key.replace('_', ' ').title()
                 if metric_key == "accuracy":
-                    correct_count = sum(s == 100.0 for s in scores_list) 
-                    print(f"Average Accuracy (ACC) based on selected criteria: {avg_val:.2f}% ({correct_count}/{len(scores_list)})")
+                    print(f"Average Accuracy (ACC) based on selected criteria: {avg_val:.2f}% ({aggregates.accuracy_correct_count}/{aggregates.counts['accuracy']})")
                 elif metric_key == "true_integrity": print(f"Average True Integrity Score: {avg_val:.2f}")
                 elif metric_key == "esi": print(f"Average ESI Score: {avg_val:.2f}")
                 else: print(f"Average {display_name}: {avg_val:.2f}")
@@ -335,9 +766,8 @@ def run_evaluation_for_combination(dataset_short_name: str,
 
     # Average response times separately
     for time_key in ["worker_response_times", "accuracy_judge_response_times", "integrity_judge_response_times"]:
-        times_list = agg_scores_combo.get(time_key, [])
-        if times_list:
-            avg_time = sum(times_list) / len(times_list)
+        avg_time = aggregates.average(time_key)
+        if avg_time is not None:
             summary_combo_data["metrics_summary"][f"average_{time_key}_seconds"] = round(avg_time, 2)
             print(f"Average {time_key.replace('_', ' ').title()}: {avg_time:.2f}s")
         else:
@@ -357,12 +787,372 @@ def run_evaluation_for_combination(dataset_short_name: str,
         logger.error(f"Could not write summary file '{summary_file}': {e_dump}")
         tqdm.write(f"ERROR: Could not write summary file '{summary_file}': {e_dump}")
     
+    if leaderboard is not None and aggregates.scored_items:
+        # Only this combination's cells are recomputed; the others come from the leaderboard state.
+        try:
+            leaderboard.update_combination(dataset_short_name, worker_model_id, prompt_version, aggregates.scored_items)
+            leaderboard.save()
+            print(f"Leaderboard updated: {leaderboard.report_path}")
+        except (OSError, ValueError) as e_leaderboard:
+            logger.error(f"Could not update the leaderboard '{leaderboard.report_path}': {e_leaderboard}")
+            tqdm.write(f"ERROR: Could not update the leaderboard '{leaderboard.report_path}': {e_leaderboard}")
+    
     if os.path.exists(combo_skipped_log_file) and os.path.getsize(combo_skipped_log_file) > 0 :
         print(f"Note: Some items were skipped or had errors during processing for this combination. Details in: {combo_skipped_log_file}")
     print("-" * 70 + "\n")
 
 
+def _batch_custom_id(combo: ComboContext, item_id: int, judge_kind: str) -> str:
+    # Stable across runs so that a resumed run can match the output of batches it submitted earlier.
+    return f"{combo.dataset_short_name}|{combo.worker_model_id}|{combo.prompt_version}|{item_id}|{judge_kind}"
+
+async def run_batch_judging(combos: List[ComboContext], resume: bool = False):
+    """
+    Batch judge mode: sends the accuracy and integrity judge calls of every PENDING_BATCH_JUDGE item of
+    the run through the provider's batch API, merges the verdicts back into each combination's journal
+    by item id, then writes the combination reports.
+    """
+    request_lines = []
+    use_combined_judge = combined_judge_enabled()
+    # With JUDGE_DEDUP_ENABLED a byte-identical judge request is submitted once; its duplicates map to the submitted custom_id.
+    submitted_custom_id_by_key: Dict[str, str] = {}
+    duplicate_custom_ids: Dict[str, str] = {}
+
+    def add_request(combo: ComboContext, custom_id: str, judge_request: Dict[str, Any]):
+        record_stat("judge_dedup_requests")
+        request_key = ResponseCache.make_key(APP_CONFIG.BATCH_ENDPOINT, judge_request)
+        if APP_CONFIG.JUDGE_DEDUP_ENABLED and request_key in submitted_custom_id_by_key:
+            record_stat("judge_dedup_hits")
+            duplicate_custom_ids[custom_id] = submitted_custom_id_by_key[request_key]
+            return
+        submitted_custom_id_by_key[request_key] = custom_id
+        request_lines.append(make_batch_request_line(custom_id, judge_request))
+        combo.stats["batch_judge_requests"] += 1
+
+    for combo in combos:
+        with combo_scope(combo):
+            for item_result in combo.journal.iter_latest_results_in_id_order():
+                if item_result.get("status") != "PENDING_BATCH_JUDGE": continue
+                item_id = item_result["id"]
+                pre_judged = pre_judge_accuracy_verdict(item_result) is not None
+                if use_combined_judge and not pre_judged:
+                    add_request(combo, _batch_custom_id(combo, item_id, "both"), build_combined_judge_request(
+                        item_result["instruction"], item_result["question"], item_result["reference_answer"], item_result["worker_answer_raw"],
+                        item_result["worker_answer_cleaned"], get_combined_judge_prompt_template(combo.dataset_short_name)))
+                    combo.stats["combined_judge_calls"] += 1
+                    continue
+                if not pre_judged:
+                    add_request(combo, _batch_custom_id(combo, item_id, "acc"), build_accuracy_judge_request(
+                        item_result["instruction"], item_result["question"], item_result["reference_answer"],
+                        item_result["worker_answer_cleaned"], combo.accuracy_judge_prompt_str))
+                add_request(combo, _batch_custom_id(combo, item_id, "int"), build_integrity_judge_request(
+                    item_result["instruction"], item_result["question"], item_result["worker_answer_raw"], item_result["worker_answer_cleaned"]))
+
+    if request_lines:
+        logger.info(f"Submitting {len(request_lines)} judge request(s) through the batch API...")
+        batch_results = await run_judge_batches(request_lines, resume=resume)
+        for duplicate_custom_id, submitted_custom_id in duplicate_custom_ids.items():
+            batch_results[duplicate_custom_id] = batch_results[submitted_custom_id]
+        for combo in combos:
+            for item_result in combo.journal.iter_latest_results_in_id_order():
+                if item_result.get("status") != "PENDING_BATCH_JUDGE": continue
+                item_id = item_result["id"]
+                try:
+                    # The pre-judge is deterministic, so it picks out the same items it did when the requests were built.
+                    accuracy_verdict, accuracy_verdict_source = pre_judge_accuracy_verdict(item_result), "pre_judge"
+                    if accuracy_verdict is None and use_combined_judge:
+                        combined_content, combined_error = batch_results[_batch_custom_id(combo, item_id, "both")]
+                        accuracy_verdict, integrity_verdict = parse_combined_judge_response(combined_content, combined_error, None)
+                        accuracy_verdict_source = "combined_judge"
+                    else:
+                        int_content, int_error = batch_results[_batch_custom_id(combo, item_id, "int")]
+                        integrity_verdict = parse_integrity_judge_response(int_content, int_error, None)
+                        if accuracy_verdict is None:
+                            acc_content, acc_error = batch_results[_batch_custom_id(combo, item_id, "acc")]
+                            accuracy_verdict, accuracy_verdict_source = parse_accuracy_judge_response(acc_content, acc_error, None), "llm_judge"
+                    item_result = apply_judge_verdicts(item_result, accuracy_verdict, integrity_verdict,
+                                                       combo.prompt_version, accuracy_verdict_source=accuracy_verdict_source)
+                except Exception as e_merge:
+                    item_result = _mark_unexpected_pipeline_error(item_result, e_merge, "batch judge", combo.worker_model_id, combo.prompt_version, item_result.get("question", "")[:200])
+                combo.journal.append(item_result)
+            combo.journal.close()
+    else:
+        logger.info("Batch judge mode: no items are waiting for a judge.")
+    for combo in combos:
+        write_combination_report(combo)
+
+async def _start_pipeline(max_in_flight_items: int, judge_mode: str = "interactive") -> StagedPipeline:
+    """
+    Sizes the HTTP pools and endpoint limiters for `max_in_flight_items` and starts a staged pipeline,
+    plus the live metrics endpoint when METRICS_PORT is set.
+    """
+    worker_stage_concurrency = APP_CONFIG.WORKER_STAGE_CONCURRENCY or max_in_flight_items
+    judge_stage_concurrency = APP_CONFIG.JUDGE_STAGE_CONCURRENCY or max_in_flight_items
+    # Each judge-stage item runs its two judge calls in parallel, so up to 2x judge_stage_concurrency requests can be in flight.
+    configure_http_pools(worker_stage_concurrency + 2 * judge_stage_concurrency)
+    configure_endpoint_limiters(max(worker_stage_concurrency, 2 * judge_stage_concurrency))
+    logger.info(f"Pipeline stages: worker concurrency {worker_stage_concurrency}, judge concurrency {judge_stage_concurrency} (judge mode: {judge_mode})")
+    pipeline = StagedPipeline(worker_stage_concurrency, judge_stage_concurrency)
+    pipeline.start()
+    await start_metrics_server(APP_CONFIG.METRICS_HOST, APP_CONFIG.METRICS_PORT)
+    return pipeline
+
+async def _shutdown_pipeline(pipeline: StagedPipeline):
+    await pipeline.stop()
+    latency_history = get_latency_history()
+    if latency_history is not None:
+        try:
+            latency_history.save()
+        except OSError as e_history:
+            logger.warning(f"Could not save the latency history '{latency_history.history_path}': {e_history}")
+    for endpoint_url, limiter_state in summarize_all_endpoint_limiters().items():
+        print(f"Adaptive rate limiter for {endpoint_url}: {limiter_state}")
+    for endpoint_url, breaker_state in summarize_all_endpoint_circuit_breakers().items():
+        print(f"Circuit breaker for {endpoint_url}: {breaker_state}")
+    if APP_CONFIG.HEDGE_ENABLED:
+        for endpoint_name, hedging_state in summarize_all_endpoint_hedgers().items():
+            print(f"Request hedging for {endpoint_name}: {hedging_state}")
+    for endpoint_origin, connection_stats in summarize_all_endpoint_pools().items():
+        print(f"HTTP connection reuse for {endpoint_origin}: {connection_stats}")
+    if RUN_STATS["judge_dedup_requests"] or RUN_STATS["item_contexts"]:
+        print(f"Dedup for the run: {summarize_dedup_stats(RUN_STATS)}")
+    if RUN_STATS["packed_judge_calls"] or RUN_STATS["packed_judge_fallbacks"]:
+        print(f"Judge packing for the run: {summarize_packing_stats(RUN_STATS)}")
+    for series_name, series in RUN_METRICS.summarize().items():
+        print(f"Latency/throughput for the run, {series_name}: {series}")
+    await stop_metrics_server()
+    await close_http_pools()
+    close_response_cache()
+
+async def run_all_combinations(combinations_to_run: List[Dict[str, Any]], max_in_flight_items: int, judge_mode: str = "interactive", resume: bool = False):
+    """Runs every combination concurrently through one staged pipeline sized from `max_in_flight_items`."""
+    pipeline = await _start_pipeline(max_in_flight_items, judge_mode)
+    try:
+        combos = await asyncio.gather(*(run_evaluation_for_combination(**combo_kwargs, pipeline=pipeline, judge_mode=judge_mode)
+                                        for combo_kwargs in combinations_to_run))
+        if judge_mode == "batch":
+            await run_batch_judging([combo for combo in combos if combo is not None], resume=resume)
+    finally:
+        await _shutdown_pipeline(pipeline)
+
+async def run_screening_and_finalists(screening_combinations: List[Dict[str, Any]], plan_finalist_combinations: Callable[[List[str]], List[Dict[str, Any]]],
+                                     max_in_flight_items: int) -> List[str]:
+    """
+    Screening pass over a small stratified sample for every worker model, then the combinations of the
+    finalists (built by `plan_finalist_combinations` from their model ids), on one staged pipeline.
+    Returns the finalists.
+    """
+    pipeline = await _start_pipeline(max_in_flight_items)
+    try:
+        screening_combos = await asyncio.gather(*(run_evaluation_for_combination(**combo_kwargs, pipeline=pipeline)
+                                                  for combo_kwargs in screening_combinations))
+        screening_report = rank_screening_results([(combo.worker_model_id, combo.sampling) for combo in screening_combos if combo is not None])
+        print_screening_ranking(screening_report)
+        try:
+            save_screening_report(screening_report, APP_CONFIG.SCREENING_REPORT_FILE)
+            print(f"Screening report saved to: {APP_CONFIG.SCREENING_REPORT_FILE}")
+        except OSError as e_report:
+            logger.error(f"Could not write the screening report '{APP_CONFIG.SCREENING_REPORT_FILE}': {e_report}")
+        finalist_combinations = plan_finalist_combinations(screening_report["finalists"])
+        await asyncio.gather(*(run_evaluation_for_combination(**combo_kwargs, pipeline=pipeline) for combo_kwargs in finalist_combinations))
+        return screening_report["finalists"]
+    finally:
+        await _shutdown_pipeline(pipeline)
+
+def plan_distributed_run(shard_queue: ShardQueue, dataset_setups: List[Dict[str, Any]]):
+    """Coordinator: splits every (dataset, model, prompt) x item id space into shards and (re)fills the work queue."""
+    combinations = []
+    for setup in dataset_setups:
+        for model_id in APP_CONFIG.WORKER_MODEL_IDS:
+            for prompt_ver in APP_CONFIG.PROMPT_VERSIONS_TO_TEST:
+                try:
+                    get_worker_prompt_template(prompt_ver)
+                except ValueError as e:
+                    logger.error(f"Not planning combo (DS: {setup['dataset_short_name']}, M: '{model_id}', P: '{prompt_ver}'): {e}")
+                    continue
+                combinations.append({"dataset_short_name": setup["dataset_short_name"], "worker_model_id": model_id,
+                                     "prompt_version": prompt_ver, "total_items": setup["total_items"]})
+                # Shard workers only ever append to the combination's skipped log, so start it fresh here.
+                skipped_log_file = APP_CONFIG.SKIPPED_FILE_LOG_TEMPLATE.format(dataset_short_name=setup["dataset_short_name"],
+                                                                               model_id=model_id.replace("/", "__").replace(":", "_"), prompt_version=prompt_ver)
+                if os.path.exists(skipped_log_file): os.remove(skipped_log_file)
+    shards = plan_shards(combinations, APP_CONFIG.SHARD_SIZE, APP_CONFIG.SHARD_RESULT_FILE_TEMPLATE)
+    for shard in shards:
+        if os.path.exists(shard["result_path"]): os.remove(shard["result_path"])
+    shard_queue.reset(shards)
+    print(f"Planned {len(shards)} shard(s) of up to {APP_CONFIG.SHARD_SIZE} items over {len(combinations)} combination(s) in {shard_queue.db_path}")
+    print(f"Start workers with: python main.py --distributed work --shard-queue \"{shard_queue.db_path}\"")
+
+async def run_shard_worker(shard_queue: ShardQueue, worker_name: str, dataset_setups_by_name: Dict[str, Dict[str, Any]],
+                           max_in_flight_items: int, parallel_shards: int):
+    """
+    Worker: claims shards from the queue until none are left and runs each one through the staged
+    pipeline, writing the shard's results to its own journal file. `parallel_shards` shards are worked
+    on at once; each claim's lease is renewed while its shard runs.
+    """
+    pipeline = await _start_pipeline(max_in_flight_items)
+    lease_seconds = APP_CONFIG.SHARD_LEASE_SECONDS
+
+    async def _renew_lease(shard_id: int):
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            if not shard_queue.renew_lease(shard_id, worker_name, lease_seconds):
+                logger.warning(f"Worker {worker_name} lost its lease on shard {shard_id}; another worker may be running it.")
+
+    async def _shard_loop(slot: int):
+        while True:
+            shard = shard_queue.claim(worker_name, lease_seconds)
+            if shard is None: return
+            shard_id = shard["shard_id"]
+            setup = dataset_setups_by_name.get(shard["dataset_short_name"])
+            if setup is None:
+                logger.error(f"Shard {shard_id} is for dataset '{shard['dataset_short_name']}', which this worker cannot load. Releasing it and stopping this slot.")
+                shard_queue.release(shard_id, worker_name)
+                return
+            renew_task = asyncio.create_task(_renew_lease(shard_id))
+            try:
+                shard_reader = SharedDatasetReader(setup["input_file_path"], window=APP_CONFIG.DATASET_STREAM_WINDOW, index=setup["dataset_index"],
+                                                   start_id=shard["start_id"], stop_id=shard["stop_id"])
+                combo = await run_evaluation_for_combination(
+                    dataset_short_name=shard["dataset_short_name"], dataset_cursor=shard_reader.open_cursor(),
+                    worker_model_id=shard["worker_model_id"], prompt_version=shard["prompt_version"],
+                    final_output_filename_template=APP_CONFIG.FINAL_OUTPUT_FILE_TEMPLATE,
+                    skipped_log_filename_template=APP_CONFIG.SKIPPED_FILE_LOG_TEMPLATE,
+                    summary_filename_template=APP_CONFIG.SUMMARY_FILE_TEMPLATE,
+                    accuracy_judge_prompt_to_use=setup["accuracy_judge_prompt"], pipeline=pipeline,
+                    tqdm_position=slot, parent_desc=f"Shard {shard_id} [{shard['start_id']}-{shard['stop_id'] - 1}]| ",
+                    resume=True, journal_path=shard["result_path"], write_report=False
+                )
+                if combo is None:
+                    shard_queue.release(shard_id, worker_name)
+                    return
+                shard_queue.mark_done(shard_id, worker_name, combo.stats)
+            except Exception as e_shard:
+                logger.exception(f"Worker {worker_name} failed on shard {shard_id}: {e_shard}. Releasing it.")
+                shard_queue.release(shard_id, worker_name)
+                return
+            finally:
+                renew_task.cancel()
+
+    try:
+        await asyncio.gather(*(_shard_loop(slot) for slot in range(max(1, parallel_shards))))
+    finally:
+        await _shutdown_pipeline(pipeline)
+    print(f"Worker {worker_name}: no shards left to claim. Queue status: {shard_queue.status_counts()}")
+
+def merge_shard_results(shard_queue: ShardQueue, dataset_setups_by_name: Dict[str, Dict[str, Any]]):
+    """
+    Merge step: concatenates the shard journals of every fully finished combination into its checkpoint
+    journal, then writes the same ESI_Result and Summary files as a single-process run.
+    """
+    shards_by_combo: Dict[tuple, List[Dict[str, Any]]] = {}
+    for shard in shard_queue.all_shards():
+        shards_by_combo.setdefault((shard["dataset_short_name"], shard["worker_model_id"], shard["prompt_version"]), []).append(shard)
+
+    for (dataset_short_name, worker_model_id, prompt_version), combo_shards in shards_by_combo.items():
+        unfinished = [shard["shard_id"] for shard in combo_shards if shard["status"] != SHARD_DONE]
+        if unfinished:
+            print(f"Not merging (DS: {dataset_short_name}, M: {worker_model_id}, P: {prompt_version}): {len(unfinished)} shard(s) not done yet ({unfinished[:10]}).")
+            continue
+        setup = dataset_setups_by_name.get(dataset_short_name)
+        total_items = setup["total_items"] if setup else combo_shards[-1]["stop_id"] - 1
+        safe_model_id_filename = worker_model_id.replace("/", "__").replace(":", "_")
+        file_name_fields = dict(dataset_short_name=dataset_short_name, model_id=safe_model_id_filename, prompt_version=prompt_version)
+        journal = CheckpointJournal(APP_CONFIG.JOURNAL_FILE_TEMPLATE.format(**file_name_fields))
+        journal.reset()
+        combo_stats = Counter()
+        for shard in sorted(combo_shards, key=lambda shard: shard["start_id"]):
+            for item_result in CheckpointJournal(shard["result_path"]).iter_latest_results_in_id_order():
+                journal.append(item_result)
+            combo_stats.update(json.loads(shard["stats"] or "{}"))
+        journal.close()
+        combo = ComboContext(dataset_short_name, worker_model_id, prompt_version, "", setup["accuracy_judge_prompt"] if setup else "",
+                             APP_CONFIG.SKIPPED_FILE_LOG_TEMPLATE.format(**file_name_fields),
+                             APP_CONFIG.FINAL_OUTPUT_FILE_TEMPLATE.format(**file_name_fields),
+                             APP_CONFIG.SUMMARY_FILE_TEMPLATE.format(**file_name_fields), journal, total_items)
+        combo.stats = combo_stats
+        os.makedirs(os.path.dirname(combo.final_output_file), exist_ok=True)
+        write_combination_report(combo)
+
+def _prepare_datasets(datasets_to_evaluate_short_names: List[str]) -> List[Dict[str, Any]]:
+    """Resolves each dataset's file, optional compiled index, item count and accuracy judge prompt; unusable datasets are logged and skipped."""
+    dataset_setups = []
+    for ds_short_name in datasets_to_evaluate_short_names:
+        dataset_config = APP_CONFIG.DATASET_CONFIGS.get(ds_short_name)
+        if not dataset_config or "path" not in dataset_config:
+            logger.error(f"Configuration for dataset '{ds_short_name}' is missing or invalid in DATASET_CONFIGS. Skipping this dataset.")
+            continue
+        
+        input_file_path = dataset_config["path"]
+        logger.info(f"\nProcessing Dataset: '{ds_short_name}' from file: '{input_file_path}'")
+
+        try:
+            dataset_index = open_fresh_dataset_index(ds_short_name, input_file_path)
+            if dataset_index is not None: logger.info(f"Using compiled dataset index '{dataset_index.index_path}' for '{ds_short_name}'")
+            total_items = dataset_index.item_count if dataset_index is not None else count_dataset_items(input_file_path)
+            if total_items == 0:
+                logger.warning(f"Input file '{input_file_path}' for dataset '{ds_short_name}' is empty. Skipping this dataset.")
+                continue
+        except FileNotFoundError:
+            logger.error(f"Input file '{input_file_path}' for dataset '{ds_short_name}' not found. Skipping this dataset.")
+            continue
+        except Exception as e:
+            logger.error(f"Error reading input file '{input_file_path}' for dataset '{ds_short_name}': {e}. Skipping this dataset.")
+            continue
+        
+        try:
+            # Get the ACCURACY judge prompt specific to this dataset type
+            # Pass the short name to the prompt selector function
+            selected_accuracy_judge_prompt_str = get_fallback_extractor_prompt_template(ds_short_name)
+            logger.info(f"Using ACCURACY judge prompt type suitable for: {ds_short_name}")
+        except Exception as e:
+            logger.error(f"Could not determine accuracy judge prompt for dataset '{ds_short_name}': {e}. Skipping this dataset.")
+            continue
+        dataset_setups.append({"dataset_short_name": ds_short_name, "input_file_path": input_file_path, "dataset_index": dataset_index,
+                               "total_items": total_items, "accuracy_judge_prompt": selected_accuracy_judge_prompt_str})
+    return dataset_setups
+
+def run_distributed_role(args, dataset_setups: List[Dict[str, Any]]):
+    shard_queue = ShardQueue(args.shard_queue)
+    dataset_setups_by_name = {setup["dataset_short_name"]: setup for setup in dataset_setups}
+    try:
+        if args.distributed == "plan":
+            plan_distributed_run(shard_queue, dataset_setups)
+        elif args.distributed == "work":
+            max_in_flight_items = APP_CONFIG.MAX_IN_FLIGHT_ITEMS or APP_CONFIG.MAX_CONCURRENT_ITEMS_PER_COMBO * max(1, args.parallel_shards)
+            logger.info(f"Shard worker {args.worker_name} working on {args.parallel_shards} shard(s) at a time from {args.shard_queue} (Max in-flight items: {max_in_flight_items})")
+            asyncio.run(run_shard_worker(shard_queue, args.worker_name, dataset_setups_by_name, max_in_flight_items, args.parallel_shards))
+        elif args.distributed == "merge":
+            merge_shard_results(shard_queue, dataset_setups_by_name)
+    finally:
+        shard_queue.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Lunar-Bench ESI evaluation framework.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue from the checkpoint journals of an earlier run, skipping items already completed.")
+    parser.add_argument("--judge-mode", choices=["interactive", "batch"], default=APP_CONFIG.JUDGE_MODE,
+                        help="'interactive' calls the judges per item; 'batch' sends all judge calls of the run through the provider's batch API after the worker stage.")
+    parser.add_argument("--distributed", choices=["plan", "work", "merge"],
+                        help="Sharded run across processes/hosts: 'plan' fills the shard queue, 'work' claims and runs shards until none are left, "
+                             "'merge' writes the ESI result and summary files of every finished combination.")
+    parser.add_argument("--shard-queue", default=APP_CONFIG.SHARD_QUEUE_PATH,
+                        help="SQLite shard queue shared by the coordinator and workers (must be on a filesystem with working file locks).")
+    parser.add_argument("--worker-name", default=f"{socket.gethostname()}-{os.getpid()}", help="Name recorded on claimed shards.")
+    parser.add_argument("--parallel-shards", type=int, default=APP_CONFIG.SHARDS_PER_WORKER, help="Shards a worker runs at the same time.")
+    parser.add_argument("--sampling", choices=["full", "adaptive"], default=APP_CONFIG.SAMPLING_MODE,
+                        help="'full' evaluates every item; 'adaptive' evaluates a stratified sample until the accuracy and ESI confidence intervals are narrow enough.")
+    parser.add_argument("--screen", action="store_true", default=APP_CONFIG.SCREENING_ENABLED,
+                        help="Rank every worker model on SCREENING_ITEMS stratified items per dataset first, then run only the SCREENING_FINALISTS best.")
+    args = parser.parse_args()
+    if args.distributed and args.judge_mode == "batch":
+        parser.error("--judge-mode batch is not supported together with --distributed.")
+    if (args.sampling == "adaptive" or args.screen) and (args.distributed or args.judge_mode == "batch"):
+        parser.error("--sampling adaptive and --screen are not supported together with --distributed or --judge-mode batch.")
+    return args
+
 def main():
+    args = parse_args()
     logger.info(f"Starting Concurrent Pipeline Evaluation Framework...")
     
     worker_models = APP_CONFIG.WORKER_MODEL_IDS
@@ -389,64 +1179,76 @@ def main():
     print("-" * 70)
 
     overall_start_time = time.time()
-    overall_combo_idx = 0 
     
     max_concurrent_items_per_combo = getattr(APP_CONFIG, "MAX_CONCURRENT_ITEMS_PER_COMBO", 5) 
+    max_in_flight_items = APP_CONFIG.MAX_IN_FLIGHT_ITEMS or max_concurrent_items_per_combo * total_overall_combinations
 
-    for ds_short_name in datasets_to_evaluate_short_names:
-        dataset_config = APP_CONFIG.DATASET_CONFIGS.get(ds_short_name)
-        if not dataset_config or "path" not in dataset_config:
-            logger.error(f"Configuration for dataset '{ds_short_name}' is missing or invalid in DATASET_CONFIGS. Skipping this dataset.")
-            continue
-        
-        input_file_path = dataset_config["path"]
-        logger.info(f"\nProcessing Dataset: '{ds_short_name}' from file: '{input_file_path}'")
+    dataset_setups = _prepare_datasets(datasets_to_evaluate_short_names)
+    if args.distributed:
+        run_distributed_role(args, dataset_setups)
+        return
 
-        try:
-            with open(input_file_path, "r", encoding="utf-8") as f_in:
-                input_lines_for_dataset = f_in.readlines()
-                if not input_lines_for_dataset:
-                    logger.warning(f"Input file '{input_file_path}' for dataset '{ds_short_name}' is empty. Skipping this dataset.")
-                    continue
-        except FileNotFoundError:
-            logger.error(f"Input file '{input_file_path}' for dataset '{ds_short_name}' not found. Skipping this dataset.")
-            continue
-        except Exception as e:
-            logger.error(f"Error reading input file '{input_file_path}' for dataset '{ds_short_name}': {e}. Skipping this dataset.")
-            continue
-        
-        try:
-            # Get the ACCURACY judge prompt specific to this dataset type
-            # Pass the short name to the prompt selector function
-            selected_accuracy_judge_prompt_str = get_accuracy_judge_prompt_template_for_dataset(ds_short_name)
-            logger.info(f"Using ACCURACY judge prompt type suitable for: {ds_short_name}")
-        except Exception as e:
-            logger.error(f"Could not determine accuracy judge prompt for dataset '{ds_short_name}': {e}. Skipping this dataset.")
-            continue
+    # Adaptive sampling and screening read each dataset in one stratified order, shared by its combinations.
+    stratified_samples = {}
+    if args.sampling == "adaptive" or args.screen:
+        for setup in dataset_setups:
+            stratified_samples[setup["dataset_short_name"]] = load_stratified_sample(setup["dataset_short_name"], setup["input_file_path"], setup["dataset_index"])
 
-        for model_id in worker_models:
-            for prompt_ver in prompt_versions:
-                overall_combo_idx += 1
-                parent_description_text = f"Overall {overall_combo_idx}/{total_overall_combinations}| "
-                
-                logger.info(f"Starting evaluation for: Dataset='{ds_short_name}', Model='{model_id}', Prompt='{prompt_ver}' (Max concurrent items: {max_concurrent_items_per_combo})")
-                run_evaluation_for_combination(
-                    dataset_short_name=ds_short_name,
-                    input_lines=input_lines_for_dataset,
-                    worker_model_id=model_id, 
-                    prompt_version=prompt_ver, 
-                    final_output_filename_template=APP_CONFIG.FINAL_OUTPUT_FILE_TEMPLATE,
-                    skipped_log_filename_template=APP_CONFIG.SKIPPED_FILE_LOG_TEMPLATE, 
-                    summary_filename_template=APP_CONFIG.SUMMARY_FILE_TEMPLATE,
-                    accuracy_judge_prompt_to_use=selected_accuracy_judge_prompt_str, 
-                    tqdm_position=0, 
-                    parent_desc=parent_description_text,
-                    max_concurrent_items=max_concurrent_items_per_combo
-                )
+    def _plan_combinations(model_ids: List[str], screening: bool = False) -> List[Dict[str, Any]]:
+        planned_combinations = []
+        combo_idx, combo_count = 0, len(dataset_setups) * len(model_ids) * len(prompt_versions)
+        for setup in dataset_setups:
+            ds_short_name, selected_accuracy_judge_prompt_str = setup["dataset_short_name"], setup["accuracy_judge_prompt"]
+            stratified_sample, dataset_reader = stratified_samples.get(ds_short_name), None
+            for model_id in model_ids:
+                for prompt_ver in prompt_versions:
+                    combo_idx += 1
+                    combo_kwargs = dict(
+                        dataset_short_name=ds_short_name,
+                        worker_model_id=model_id, 
+                        prompt_version=prompt_ver, 
+                        final_output_filename_template=APP_CONFIG.FINAL_OUTPUT_FILE_TEMPLATE,
+                        skipped_log_filename_template=APP_CONFIG.SKIPPED_FILE_LOG_TEMPLATE, 
+                        summary_filename_template=APP_CONFIG.SUMMARY_FILE_TEMPLATE,
+                        accuracy_judge_prompt_to_use=selected_accuracy_judge_prompt_str, 
+                        tqdm_position=combo_idx - 1, 
+                        parent_desc=f"{'Screening' if screening else 'Overall'} {combo_idx}/{combo_count}| ",
+                        resume=args.resume
+                    )
+                    if screening:
+                        # Screening keeps its own journals and logs and writes no result files, summaries or leaderboard cells.
+                        screening_dir = os.path.dirname(APP_CONFIG.SCREENING_JOURNAL_FILE_TEMPLATE)
+                        combo_kwargs.update(
+                            dataset_cursor=stratified_sample.open_cursor(APP_CONFIG.SCREENING_ITEMS),
+                            sampling=SampleEstimates(stratified_sample.stratum_sizes, min(APP_CONFIG.SCREENING_ITEMS, len(stratified_sample.item_ids)), early_stop=False),
+                            skipped_log_filename_template=os.path.join(screening_dir, os.path.basename(APP_CONFIG.SKIPPED_FILE_LOG_TEMPLATE)),
+                            journal_path=APP_CONFIG.SCREENING_JOURNAL_FILE_TEMPLATE.format(dataset_short_name=ds_short_name, model_id=model_id.replace("/", "__").replace(":", "_"), prompt_version=prompt_ver),
+                            write_report=False)
+                    elif args.sampling == "adaptive":
+                        combo_kwargs.update(dataset_cursor=stratified_sample.open_cursor(),
+                                            sampling=SampleEstimates(stratified_sample.stratum_sizes, len(stratified_sample.item_ids), early_stop=True))
+                    else:
+                        if dataset_reader is None:
+                            dataset_index = stratified_sample.index if stratified_sample is not None else setup["dataset_index"]
+                            dataset_reader = SharedDatasetReader(setup["input_file_path"], window=APP_CONFIG.DATASET_STREAM_WINDOW, index=dataset_index)
+                        combo_kwargs.update(dataset_cursor=dataset_reader.open_cursor())
+                    planned_combinations.append(combo_kwargs)
+        return planned_combinations
+
+    if args.screen:
+        logger.info(f"Screening {len(worker_models)} worker model(s) on {APP_CONFIG.SCREENING_ITEMS} item(s) per dataset, keeping {APP_CONFIG.SCREENING_FINALISTS} (Max in-flight items: {max_in_flight_items})")
+        finalists = asyncio.run(run_screening_and_finalists(_plan_combinations(worker_models, screening=True), _plan_combinations, max_in_flight_items))
+        total_overall_combinations = len(dataset_setups) * len(finalists) * len(prompt_versions)
+    else:
+        combinations_to_run = _plan_combinations(worker_models)
+        logger.info(f"Scheduling {len(combinations_to_run)} combination(s) on one event loop (Max in-flight items: {max_in_flight_items})")
+        asyncio.run(run_all_combinations(combinations_to_run, max_in_flight_items, judge_mode=args.judge_mode, resume=args.resume))
     
     overall_end_time = time.time()
     total_duration_seconds = overall_end_time - overall_start_time
     print(f"\nAll {total_overall_combinations} configured evaluations (across all selected datasets) have been completed.")
+    leaderboard = get_leaderboard()
+    if leaderboard is not None and leaderboard.combos: print_overall_ranking(leaderboard.report())
     print(f"Total execution time: {total_duration_seconds:.2f} seconds ({time.strftime('%H:%M:%S', time.gmtime(total_duration_seconds))}).")
 
 if __name__ == "__main__":
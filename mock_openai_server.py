@@ -0,0 +1,340 @@
+# mock_openai_server.py
+"""
+Local stand-in for an OpenAI-compatible chat-completions endpoint, used by benchmark.py to measure the
+framework's own throughput without a provider. POST /v1/chat/completions (streaming or not) sleeps for a
+latency drawn from the configured distribution, then answers with
+  - canned judge JSON when the prompt asks for is_judged_correct and/or integrity_score (accuracy,
+    integrity and combined judge), with verdicts drawn from --judge-correct-rate; for a packed judge
+    prompt ("=== Item <id> ===" sections) a JSON array with one verdict per item id,
+  - otherwise a canned worker answer ("Final Answer: ..." when the prompt asks for one),
+or, with the configured probabilities, a 429 with Retry-After or a 500. --outage START:SECONDS answers every
+request with a 503 from START to START + SECONDS seconds after startup. GET /stats returns the request
+counters as JSON.
+
+It also serves the part of the OpenAI Files and Batches API that batch_judging.py uses, kept in memory:
+POST /v1/files (multipart upload), GET /v1/files/<id>/content, POST /v1/batches, GET /v1/batches/<id>.
+A batch is "validating" for the first quarter of --batch-seconds and "in_progress" (with growing
+request counts) until --batch-seconds after its creation; the first poll after that answers every
+request of its input file as /chat/completions would (without latency or injected errors) and marks
+it "completed". With --batch-error-rate a request lands in the batch's error file instead of its
+output file.
+
+Latency specs: fixed:SECONDS, uniform:LOW:HIGH, lognormal:MEDIAN:SIGMA, exponential:MEAN.
+
+    python mock_openai_server.py --port 8765 --latency lognormal:0.8:0.5 --rate-limit-rate 0.02
+"""
+import argparse
+import email
+import email.policy
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable, Dict, Any, List, Optional
+
+LatencySampler = Callable[[random.Random], float]
+
+def parse_latency_spec(spec: str) -> LatencySampler:
+    """Sampler for a latency spec as described in the module docstring. Raises ValueError for a malformed spec."""
+    kind, _, params_text = spec.partition(":")
+    try:
+        params = [float(param) for param in params_text.split(":")] if params_text else []
+    except ValueError:
+        raise ValueError(f"Latency spec '{spec}' has a non-numeric parameter.")
+    expected_params = {"fixed": 1, "uniform": 2, "lognormal": 2, "exponential": 1}
+    if kind not in expected_params:
+        raise ValueError(f"Unknown latency distribution '{kind}' in '{spec}'. Use one of: {', '.join(expected_params)}.")
+    if len(params) != expected_params[kind]:
+        raise ValueError(f"Latency spec '{spec}' needs {expected_params[kind]} parameter(s) after '{kind}:'.")
+    if kind == "fixed": return lambda rng: params[0]
+    if kind == "uniform": return lambda rng: rng.uniform(params[0], params[1])
+    if kind == "lognormal": return lambda rng: params[0] * math.exp(rng.gauss(0.0, params[1]))
+    return lambda rng: rng.expovariate(1.0 / params[0]) if params[0] > 0 else 0.0
+
+class MockState:
+    """Server-wide options and counters, shared by the handler threads."""
+    def __init__(self, args: argparse.Namespace):
+        self.worker_latency = parse_latency_spec(args.latency)
+        self.judge_latency = parse_latency_spec(args.judge_latency or args.latency)
+        self.rate_limit_rate = args.rate_limit_rate
+        self.error_rate = args.error_rate
+        self.retry_after_seconds = args.retry_after
+        self.judge_correct_rate = args.judge_correct_rate
+        self.worker_answer = args.worker_answer
+        self.stream_chunk_chars = max(1, args.stream_chunk_chars)
+        self.rng = random.Random(args.seed)
+        self.started_at = time.monotonic()
+        self.outage_window = tuple(float(value) for value in args.outage.split(":")) if args.outage else None
+        self.batch_seconds = args.batch_seconds
+        self.batch_error_rate = args.batch_error_rate
+        self.lock = threading.Lock()
+        self.counters: Counter = Counter()
+        self.files: Dict[str, Dict[str, Any]] = {} # file id -> file object + "content" bytes
+        self.batches: Dict[str, Dict[str, Any]] = {} # batch id -> batch object
+        self._ids = itertools.count(1)
+
+    def new_id(self, prefix: str) -> str:
+        with self.lock: return f"{prefix}-mock-{next(self._ids)}"
+
+    def add_file(self, content: bytes, filename: str, purpose: str) -> Dict[str, Any]:
+        file_object = {"id": self.new_id("file"), "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                       "filename": filename, "purpose": purpose}
+        with self.lock: self.files[file_object["id"]] = dict(file_object, content=content)
+        return file_object
+
+    def draw(self, sampler: LatencySampler) -> float:
+        with self.lock: return max(0.0, sampler(self.rng))
+
+    def chance(self, probability: float) -> bool:
+        if probability <= 0: return False
+        with self.lock: return self.rng.random() < probability
+
+    def in_outage(self) -> bool:
+        if self.outage_window is None: return False
+        outage_start, outage_seconds = self.outage_window
+        return outage_start <= time.monotonic() - self.started_at < outage_start + outage_seconds
+
+    def count(self, *names: str):
+        with self.lock: self.counters.update(names)
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+class MockChatHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like a real provider; the framework reuses pooled connections
+    state: MockState = None # Set on the subclass created by make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: Dict[str, Any], status: int = 200, extra_headers: Dict[str, str] = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for header, value in (extra_headers or {}).items(): self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_not_found(self):
+        self._send_json({"error": {"message": f"Not found: {self.path}"}}, 404)
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        if path.endswith("/stats"):
+            with self.state.lock: return self._send_json(dict(self.state.counters))
+        file_match = re.search(r"/files/([\w-]+)/content$", path)
+        if file_match:
+            with self.state.lock: stored_file = self.state.files.get(file_match.group(1))
+            if stored_file is None: return self._send_not_found()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(stored_file["content"])))
+            self.end_headers()
+            return self.wfile.write(stored_file["content"])
+        batch_match = re.search(r"/batches/([\w-]+)$", path)
+        if batch_match:
+            batch = self._advance_batch(batch_match.group(1))
+            return self._send_json(batch) if batch is not None else self._send_not_found()
+        self._send_not_found()
+
+    def do_POST(self):
+        request_body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = self.path.rstrip("/")
+        if path.endswith("/files"): return self._upload_file(request_body)
+        if path.endswith("/batches"): return self._create_batch(request_body)
+        if not path.endswith("/chat/completions"): return self._send_not_found()
+        try:
+            request = json.loads(request_body)
+            prompt_text = json.dumps(request["messages"], ensure_ascii=False).replace('\\"', '"')
+        except (ValueError, KeyError) as e:
+            return self._send_json({"error": {"message": f"Bad request: {e}"}}, 400)
+        state = self.state
+        is_judge_request = "is_judged_correct" in prompt_text or "integrity_score" in prompt_text
+        state.count("requests", "judge_requests" if is_judge_request else "worker_requests")
+        time.sleep(state.draw(state.judge_latency if is_judge_request else state.worker_latency))
+        if state.in_outage():
+            state.count("outage_errors")
+            return self._send_json({"error": {"message": "Service unavailable (outage injected by the mock)."}}, 503)
+        if state.chance(state.rate_limit_rate):
+            state.count("rate_limited")
+            return self._send_json({"error": {"message": "Rate limit reached (injected by the mock)."}}, 429,
+                                   {"Retry-After": f"{state.retry_after_seconds:g}"})
+        if state.chance(state.error_rate):
+            state.count("server_errors")
+            return self._send_json({"error": {"message": "Internal error (injected by the mock)."}}, 500)
+
+        content = self._canned_content(prompt_text)
+        usage = {"prompt_tokens": _estimate_tokens(prompt_text), "completion_tokens": _estimate_tokens(content)}
+        if request.get("stream"): return self._send_stream(content, usage, bool((request.get("stream_options") or {}).get("include_usage")))
+        self._send_json({"id": "mock-completion", "object": "chat.completion", "model": request.get("model"),
+                         "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                         "usage": usage})
+
+    def _upload_file(self, request_body: bytes):
+        # Multipart form data: a "purpose" field and a "file" part, as sent by batch_judging.BatchJudgeClient.
+        form = email.message_from_bytes(b"Content-Type: " + self.headers.get("Content-Type", "").encode("latin-1") + b"\r\n\r\n" + request_body,
+                                        policy=email.policy.HTTP)
+        fields = {part.get_param("name", header="content-disposition"): part for part in form.iter_parts()} if form.is_multipart() else {}
+        if "file" not in fields: return self._send_json({"error": {"message": "Bad request: no 'file' part in the multipart upload."}}, 400)
+        purpose = fields["purpose"].get_content().strip() if "purpose" in fields else "batch"
+        file_object = self.state.add_file(fields["file"].get_payload(decode=True), fields["file"].get_filename() or "upload.jsonl", purpose)
+        self.state.count("files_uploaded")
+        self._send_json(file_object)
+
+    def _create_batch(self, request_body: bytes):
+        state = self.state
+        try:
+            request = json.loads(request_body)
+            with state.lock: input_file = state.files[request["input_file_id"]]
+            request_count = sum(1 for line in input_file["content"].splitlines() if line.strip())
+        except (ValueError, KeyError) as e:
+            return self._send_json({"error": {"message": f"Bad request: {e}"}}, 400)
+        batch = {"id": state.new_id("batch"), "object": "batch", "endpoint": request.get("endpoint"), "input_file_id": request["input_file_id"],
+                 "completion_window": request.get("completion_window"), "status": "validating", "created_at": int(time.time()),
+                 "output_file_id": None, "error_file_id": None, "completed_at": None,
+                 "request_counts": {"total": request_count, "completed": 0, "failed": 0}, "_created_monotonic": time.monotonic()}
+        with state.lock: state.batches[batch["id"]] = batch
+        state.count("batches_created")
+        self._send_json(self._public_batch(batch))
+
+    @staticmethod
+    def _public_batch(batch: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in batch.items() if not key.startswith("_")}
+
+    def _advance_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """The batch's current state; runs its requests the first time it is polled after --batch-seconds."""
+        state = self.state
+        with state.lock:
+            batch = state.batches.get(batch_id)
+            if batch is None: return None
+            if batch["status"] not in ("validating", "in_progress"): return self._public_batch(batch)
+            elapsed_fraction = (time.monotonic() - batch["_created_monotonic"]) / state.batch_seconds if state.batch_seconds > 0 else 1.0
+            if elapsed_fraction < 1.0:
+                batch["status"] = "validating" if elapsed_fraction < 0.25 else "in_progress"
+                if batch["status"] == "in_progress":
+                    batch["request_counts"]["completed"] = int(batch["request_counts"]["total"] * (elapsed_fraction - 0.25) / 0.75)
+                return self._public_batch(batch)
+            batch["status"] = "finalizing" # Claimed by this poll; concurrent polls see it as not yet completed
+            input_content = state.files[batch["input_file_id"]]["content"]
+        output_lines, error_lines = self._run_batch_requests(input_content)
+        output_file = state.add_file("".join(json.dumps(line) + "\n" for line in output_lines).encode("utf-8"), f"{batch_id}_output.jsonl", "batch_output")
+        error_file = state.add_file("".join(json.dumps(line) + "\n" for line in error_lines).encode("utf-8"), f"{batch_id}_errors.jsonl", "batch_output") if error_lines else None
+        state.count("batches_completed")
+        with state.lock:
+            batch.update(status="completed", output_file_id=output_file["id"], error_file_id=error_file["id"] if error_file else None,
+                         completed_at=int(time.time()), request_counts={"total": len(output_lines) + len(error_lines),
+                                                                         "completed": len(output_lines), "failed": len(error_lines)})
+            return self._public_batch(batch)
+
+    def _run_batch_requests(self, input_content: bytes):
+        state = self.state
+        output_lines: List[Dict[str, Any]] = []
+        error_lines: List[Dict[str, Any]] = []
+        for raw_line in input_content.decode("utf-8").splitlines():
+            if not raw_line.strip(): continue
+            request_line = json.loads(raw_line)
+            state.count("batch_requests")
+            if state.chance(state.batch_error_rate):
+                error_lines.append({"id": state.new_id("batch_req"), "custom_id": request_line.get("custom_id"), "response": None,
+                                    "error": {"code": "server_error", "message": "Request failed (injected by the mock)."}})
+                continue
+            body = request_line.get("body") or {}
+            prompt_text = json.dumps(body.get("messages", []), ensure_ascii=False).replace('\\"', '"')
+            content = self._canned_content(prompt_text)
+            output_lines.append({"id": state.new_id("batch_req"), "custom_id": request_line.get("custom_id"), "error": None,
+                                 "response": {"status_code": 200, "request_id": state.new_id("req"), "body": {
+                                     "id": "mock-completion", "object": "chat.completion", "model": body.get("model"),
+                                     "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                                     "usage": {"prompt_tokens": _estimate_tokens(prompt_text), "completion_tokens": _estimate_tokens(content)}}}})
+        return output_lines, error_lines
+
+    def _canned_content(self, prompt_text: str) -> str:
+        state = self.state
+        wants_accuracy, wants_integrity = "is_judged_correct" in prompt_text, "integrity_score" in prompt_text
+        if wants_accuracy or wants_integrity:
+            packed_item_ids = re.findall(r"=== Item (\w+) ===", prompt_text)
+            verdicts = [self._canned_verdict(wants_accuracy, wants_integrity) for _ in packed_item_ids or [None]]
+            if not packed_item_ids: return json.dumps(verdicts[0])
+            state.count("packed_judge_requests")
+            return json.dumps([dict(item_id=item_id, **verdict) for item_id, verdict in zip(packed_item_ids, verdicts)])
+        if "Final Answer" in prompt_text:
+            return f"Step 1: Read the constraints.\nStep 2: Apply them to the question.\nFinal Answer: {state.worker_answer}"
+        return state.worker_answer
+
+    def _canned_verdict(self, wants_accuracy: bool, wants_integrity: bool) -> Dict[str, Any]:
+        state = self.state
+        verdict: Dict[str, Any] = {}
+        if wants_accuracy:
+            verdict.update({"is_judged_correct": state.chance(state.judge_correct_rate), "reasoning": "Canned verdict from the mock server."})
+        if wants_integrity:
+            with state.lock: integrity_score = state.rng.randint(60, 95)
+            verdict.update({"integrity_score": integrity_score, "integrity_reasoning": "Canned verdict from the mock server."})
+        return verdict
+
+    def _send_stream(self, content: str, usage: Dict[str, int], include_usage: bool):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunk_chars = self.state.stream_chunk_chars
+        events = [{"choices": [{"index": 0, "delta": {"content": content[start:start + chunk_chars]}}]} for start in range(0, len(content), chunk_chars)]
+        if include_usage: events.append({"choices": [], "usage": usage})
+        for event_data in [json.dumps(event) for event in events] + ["[DONE]"]:
+            event_bytes = f"data: {event_data}\n\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(event_bytes), event_bytes))
+        self.wfile.write(b"0\r\n\r\n")
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024 # Benchmarks open many connections at once
+
+def make_server(args: argparse.Namespace) -> MockServer:
+    handler_class = type("BoundMockChatHandler", (MockChatHandler,), {"state": MockState(args)})
+    return MockServer((args.host, args.port), handler_class)
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat-completions server for Lunar-Bench benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:0.8:0.5", help="Worker call latency spec (see the module docstring).")
+    parser.add_argument("--judge-latency", default=None, help="Judge call latency spec; defaults to --latency.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Probability of answering 429 with Retry-After.")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with injected 429s.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of answering 500.")
+    parser.add_argument("--judge-correct-rate", type=float, default=0.8, help="Probability that the canned accuracy verdict is 'correct'.")
+    parser.add_argument("--worker-answer", default="42", help="Canned worker answer.")
+    parser.add_argument("--stream-chunk-chars", type=int, default=8, help="Characters per streamed content chunk.")
+    parser.add_argument("--outage", default=None, help="START:SECONDS - answer every request with 503 during this window after startup.")
+    parser.add_argument("--batch-seconds", type=float, default=5.0, help="Seconds from a batch's creation until it completes.")
+    parser.add_argument("--batch-error-rate", type=float, default=0.0, help="Probability that a batch request lands in the batch's error file.")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+    for spec in (args.latency, args.judge_latency):
+        if spec is None: continue
+        try:
+            parse_latency_spec(spec)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.outage and not re.fullmatch(r"\d+(\.\d+)?:\d+(\.\d+)?", args.outage):
+        parser.error(f"--outage must be START:SECONDS, got '{args.outage}'.")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = make_server(args)
+    print(f"Mock chat-completions server listening on http://{args.host}:{server.server_address[1]}/v1/chat/completions", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
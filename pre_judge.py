@@ -0,0 +1,113 @@
+# pre_judge.py
+"""
+Deterministic accuracy pre-judge. Decides the clear cases locally so that only ambiguous answers go to
+the accuracy judge LLM:
+  - clear match: the cleaned answer equals the reference after text normalization (case-sensitively
+    once it contains a number, so units like mW/MW stay apart), or both are a single quantity
+    (optionally "label = value unit") with the same value after unit conversion. Only decimal reference
+    values get PRE_JUDGE_RELATIVE_TOLERANCE; integers (counts, years, option numbers) must match exactly,
+  - clear mismatch: an empty answer, opposite yes/no style answers, or single quantities in the same
+    dimension that differ by more than PRE_JUDGE_MISMATCH_TOLERANCE.
+Everything else (free text around a value, several values, unknown units, a unit on only one side,
+near misses) returns None.
+"""
+import math
+import re
+import unicodedata
+from typing import Optional, Tuple
+from config import APP_CONFIG
+
+# unit symbol -> (dimension, factor to the dimension's base unit). Symbols are matched case-sensitively,
+# since case changes the unit (mW/MW, m/M); unknown symbols only match themselves.
+_UNITS = {
+    "W": ("power", 1.0), "mW": ("power", 1e-3), "kW": ("power", 1e3), "MW": ("power", 1e6), "GW": ("power", 1e9),
+    "Wh": ("energy", 3600.0), "kWh": ("energy", 3.6e6), "MWh": ("energy", 3.6e9),
+    "J": ("energy", 1.0), "kJ": ("energy", 1e3), "MJ": ("energy", 1e6),
+    "m": ("length", 1.0), "km": ("length", 1e3), "cm": ("length", 1e-2), "mm": ("length", 1e-3),
+    "s": ("time", 1.0), "ms": ("time", 1e-3), "h": ("time", 3600.0),
+    "g": ("mass", 1e-3), "kg": ("mass", 1.0), "t": ("mass", 1e3),
+    "V": ("voltage", 1.0), "mV": ("voltage", 1e-3), "kV": ("voltage", 1e3),
+    "A": ("current", 1.0), "mA": ("current", 1e-3), "Ah": ("charge", 3600.0), "mAh": ("charge", 3.6),
+    "Hz": ("frequency", 1.0), "kHz": ("frequency", 1e3), "MHz": ("frequency", 1e6), "GHz": ("frequency", 1e9),
+    "bps": ("rate", 1.0), "kbps": ("rate", 1e3), "Mbps": ("rate", 1e6), "Gbps": ("rate", 1e9),
+    "N": ("force", 1.0), "kN": ("force", 1e3), "Pa": ("pressure", 1.0), "kPa": ("pressure", 1e3), "MPa": ("pressure", 1e6),
+    "dB": ("decibel", 1.0), "dBm": ("dbm", 1.0), "%": ("percent", 1.0), "°": ("angle", 1.0),
+    "°C": ("celsius", 1.0), "m/s": ("speed", 1.0), "km/h": ("speed", 1 / 3.6),
+}
+# Spelled-out units, matched in any case.
+_WORD_UNITS = {
+    "meter": ("length", 1.0), "meters": ("length", 1.0),
+    "sec": ("time", 1.0), "seconds": ("time", 1.0), "min": ("time", 60.0), "mins": ("time", 60.0), "minutes": ("time", 60.0),
+    "hr": ("time", 3600.0), "hours": ("time", 3600.0), "days": ("time", 86400.0), "deg": ("angle", 1.0), "degrees": ("angle", 1.0),
+}
+_AFFIRMATIVE = {"yes", "true", "feasible", "possible", "safe", "meets the requirement", "can", "correct", "是", "可以", "可行"}
+_NEGATIVE = {"no", "false", "infeasible", "not feasible", "impossible", "unsafe", "does not meet the requirement", "cannot", "incorrect", "否", "不可以", "不可行"}
+
+_NUMBER = r"[-+]?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?(?:[eE][-+]?\d+)?"
+_UNIT = r"(?:%|°[cCfF]?|[A-Za-zµΩ]+(?:/[A-Za-zµΩ]+)?[²³]?)"
+_SINGLE_QUANTITY_RE = re.compile(rf"^(?:([^=:0-9][^=:]*?)\s*[=:]\s*)?({_NUMBER})\s*({_UNIT})?$")
+
+def normalize_answer_text(text: str, keep_case: bool = False) -> str:
+    text = unicodedata.normalize("NFKC", text or "").strip()
+    if not keep_case: text = text.lower()
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([=:;,/()])\s*", r"\1", text)
+    return text.rstrip(" .。;；")
+
+def _to_float(number_text: str) -> float:
+    return float(number_text.replace(",", ""))
+
+def _parse_single_quantity(normalized_text: str) -> Optional[Tuple[str, float, str, bool]]:
+    """(label, value, unit, value is an integer) when the whole answer (case kept) is one optionally labelled quantity."""
+    match = _SINGLE_QUANTITY_RE.match(normalized_text)
+    if not match: return None
+    is_integer = not re.search(r"[.eE]", match.group(2))
+    return (match.group(1) or "").strip().lower(), _to_float(match.group(2)), match.group(3) or "", is_integer
+
+def _in_base_units(value: float, unit: str) -> Tuple[Optional[str], float]:
+    if not unit: return None, value
+    dimension, factor = _UNITS.get(unit) or _WORD_UNITS.get(unit.lower(), (f"unit:{unit}", 1.0))
+    return dimension, value * factor
+
+def _relative_difference(a: float, b: float) -> float:
+    scale = max(abs(a), abs(b))
+    return 0.0 if scale == 0 else abs(a - b) / scale
+
+def _compare_quantities(reference: Tuple[float, str], candidate: Tuple[float, str], tolerance: float) -> Optional[bool]:
+    # A bare number next to a quantity with a unit is ambiguous ("50000" for "50 kW"); never convert only one side.
+    if bool(reference[1]) != bool(candidate[1]): return None
+    ref_dimension, ref_value = _in_base_units(*reference)
+    cand_dimension, cand_value = _in_base_units(*candidate)
+    if ref_dimension != cand_dimension: return None
+    difference = _relative_difference(ref_value, cand_value)
+    if difference <= tolerance or math.isclose(ref_value, cand_value, rel_tol=1e-9): return True
+    if difference > APP_CONFIG.PRE_JUDGE_MISMATCH_TOLERANCE: return False
+    return None
+
+def pre_judge_accuracy(reference_answer: str, candidate_answer: str) -> Optional[Tuple[bool, str]]:
+    """Returns (is_correct, reasoning) for a clear match or mismatch, or None when the LLM judge should decide."""
+    reference, candidate = normalize_answer_text(reference_answer), normalize_answer_text(candidate_answer)
+    if not reference: return None
+    if not candidate or candidate.startswith("n/a_"):
+        return False, "Deterministic pre-judge: the cleaned answer is empty."
+    reference_cased, candidate_cased = normalize_answer_text(reference_answer, keep_case=True), normalize_answer_text(candidate_answer, keep_case=True)
+    if reference_cased == candidate_cased or (reference == candidate and not re.search(r"\d", reference)):
+        return True, "Deterministic pre-judge: the cleaned answer matches the reference answer exactly (after normalization)."
+    if (reference in _AFFIRMATIVE and candidate in _NEGATIVE) or (reference in _NEGATIVE and candidate in _AFFIRMATIVE):
+        return False, f"Deterministic pre-judge: the answer '{candidate}' contradicts the reference '{reference}'."
+
+    reference_quantity = _parse_single_quantity(reference_cased)
+    if reference_quantity is None: return None
+    ref_label, ref_value, ref_unit, ref_is_integer = reference_quantity
+    # Any prose around the value ("Option 7 is wrong") is left to the judge.
+    candidate_quantity = _parse_single_quantity(candidate_cased)
+    if candidate_quantity is None: return None
+    cand_label, cand_value, cand_unit, _ = candidate_quantity
+    if ref_label and cand_label and ref_label != cand_label: return None
+    tolerance = 0.0 if ref_is_integer else APP_CONFIG.PRE_JUDGE_RELATIVE_TOLERANCE
+    verdict = _compare_quantities((ref_value, ref_unit), (cand_value, cand_unit), tolerance)
+    if verdict is None: return None
+    if verdict:
+        return True, (f"Deterministic pre-judge: the value {ref_value:g}{(' ' + ref_unit) if ref_unit else ''} matches "
+                      + ("exactly." if ref_is_integer else f"within {APP_CONFIG.PRE_JUDGE_RELATIVE_TOLERANCE:.2%}."))
+    return False, f"Deterministic pre-judge: the value differs from the reference {ref_value:g}{(' ' + ref_unit) if ref_unit else ''} by more than {APP_CONFIG.PRE_JUDGE_MISMATCH_TOLERANCE:.0%}."
@@ -0,0 +1,74 @@
+# prompt_layout.py
+"""
+Assembles chat messages from the prompt templates in prompts.py.
+
+The templates interleave fixed text (task description, rubric, output format) with the per-item
+{instruction}/{question}/... slots, so two calls only share the first few hundred bytes. With
+PROMPT_LAYOUT "prefix" every template is split once into
+  head    fixed text before the paragraph holding the first slot,
+  data    the paragraphs from the first to the last slot (their labels included),
+  rubric  fixed text after the data, except its last paragraph,
+  cue     the last paragraph (e.g. "Answer:" or "Now, provide your evaluation ..."),
+and sent as a system message [system prompt + head + rubric], which is byte-identical for every item
+of a template, followed by a user message [data + cue]. Providers with automatic prefix caching
+(OpenAI, DeepSeek, ...) then only bill and prefill the fixed part once; PROMPT_CACHE_HINTS
+"cache_control" additionally marks it with an Anthropic-style cache breakpoint for providers that need
+an explicit hint. PROMPT_LAYOUT "inline" sends the templates exactly as written.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, NamedTuple
+from config import APP_CONFIG
+from run_stats import ratio_or_none
+
+_PLACEHOLDER_RE = re.compile(r"(?<!\{)\{(\w+)\}(?!\})")
+
+class TemplateParts(NamedTuple):
+    static_prefix: str # head + rubric, already unescaped ({{ -> {)
+    data_template: str # still a format string
+    cue: str
+
+@lru_cache(maxsize=None)
+def split_template(template: str) -> Optional[TemplateParts]:
+    """Splits a template as described in the module docstring; None for a template without slots."""
+    placeholders = list(_PLACEHOLDER_RE.finditer(template))
+    if not placeholders: return None
+    head_end = template.rfind("\n\n", 0, placeholders[0].start())
+    head, data_start = (template[:head_end], head_end + 2) if head_end >= 0 else ("", 0)
+    tail_start = template.find("\n\n", placeholders[-1].end())
+    data, tail = (template[data_start:tail_start], template[tail_start + 2:]) if tail_start >= 0 else (template[data_start:], "")
+    tail = tail.strip("\n")
+    cue_start = tail.rfind("\n\n")
+    rubric, cue = (tail[:cue_start], tail[cue_start + 2:]) if cue_start >= 0 else ("", tail)
+    static_prefix = "\n\n".join(part.strip("\n") for part in (head, rubric) if part.strip())
+    return TemplateParts(static_prefix.format(), data.strip("\n"), cue.format())
+
+def fixed_system_message(text: str) -> Dict[str, Any]:
+    """System message for text shared by many calls, with a cache breakpoint if PROMPT_CACHE_HINTS is "cache_control"."""
+    if APP_CONFIG.PROMPT_CACHE_HINTS != "cache_control": return {"role": "system", "content": text}
+    return {"role": "system", "content": [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]}
+
+def build_prompt_messages(system_prompt: str, template: str, **template_variables) -> List[Dict[str, Any]]:
+    """System + user messages for one call of `template`, laid out according to PROMPT_LAYOUT."""
+    parts = split_template(template) if APP_CONFIG.PROMPT_LAYOUT == "prefix" else None
+    if parts is None:
+        return [{"role": "system", "content": system_prompt}, {"role": "user", "content": template.format(**template_variables)}]
+    static_text = f"{system_prompt}\n\n{parts.static_prefix}" if parts.static_prefix else system_prompt
+    user_text = parts.data_template.format(**template_variables)
+    if parts.cue: user_text = f"{user_text}\n\n{parts.cue}"
+    return [fixed_system_message(static_text), {"role": "user", "content": user_text}]
+
+def cached_prompt_tokens(usage: Optional[Dict[str, Any]]) -> Optional[int]:
+    """Prompt tokens served from the provider's prompt cache, from the OpenAI- or Anthropic-style usage fields; None if not reported."""
+    if not usage: return None
+    details = usage.get("prompt_tokens_details") or {}
+    if details.get("cached_tokens") is not None: return int(details["cached_tokens"])
+    if usage.get("cache_read_input_tokens") is not None: return int(usage["cache_read_input_tokens"])
+    if usage.get("prompt_cache_hit_tokens") is not None: return int(usage["prompt_cache_hit_tokens"])
+    return None
+
+def summarize_prompt_caching(stats) -> Dict[str, Any]:
+    prompt_tokens, cached_tokens = stats.get("api_prompt_tokens", 0), stats.get("api_cached_prompt_tokens", 0)
+    return {"layout": APP_CONFIG.PROMPT_LAYOUT, "cache_hints": APP_CONFIG.PROMPT_CACHE_HINTS,
+            "prompt_tokens": prompt_tokens, "cached_prompt_tokens": cached_tokens,
+            "cached_token_rate": ratio_or_none(cached_tokens, prompt_tokens)}
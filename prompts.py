@@ -189,3 +189,90 @@ PROMPT_FOR_JUDGE_LLM_TRUE_INTEGRITY_TEMPLATE = (
     "}}\n\n"
     "Now, provide your evaluation for the given data in the specified JSON format only:"
 )
+
+# ==============================================================================
+# 4. COMBINED JUDGE PROMPT (Accuracy + Integrity in one call, used when both judges are the same model)
+#    The accuracy criteria follow the level-specific leniency of the extractor prompts above.
+# ==============================================================================
+
+COMBINED_JUDGE_ACCURACY_CRITERIA = {
+    "L1": (
+        "**Part A - Accuracy (Leniency: Reasonable Inference)**\n"
+        "Set `is_judged_correct` to true if the Candidate Answer, through a reasonable line of thought, implies the Reference Answer and its core meaning is approximately correct, even if details are missing or slightly off. "
+        "Set it to false if the answer is fundamentally incorrect, irrelevant, or requires unreasonable leaps of logic to connect to the Reference Answer.\n\n"
+    ),
+    "L2": (
+        "**Part A - Accuracy (Leniency: Sensibly Correct)**\n"
+        "Set `is_judged_correct` to true if the Candidate Answer directly addresses the core question and contains the key facts, names, or values from the Reference Answer. "
+        "Set it to false if the core claim is incorrect, the answer is irrelevant, or it fails to meaningfully contain the information from the Reference Answer.\n\n"
+    ),
+    "L3": (
+        "**Part A - Accuracy (Leniency: Largely Consistent)**\n"
+        "Set `is_judged_correct` to true ONLY if the primary facts, figures, and entities from the Reference Answer are explicitly stated in the Candidate Answer with no significant factual discrepancies. "
+        "Set it to false if key facts are incorrect, omitted, or misrepresented.\n\n"
+    ),
+}
+
+PROMPT_FOR_COMBINED_JUDGE_TEMPLATE = (
+    "You are a meticulous AI Evaluator. You will assess one AI assistant's output in two independent parts: the **accuracy** of its final answer against a reference answer, "
+    "and the **completeness and logical integrity** of its thought process. Judge each part on its own criteria; a wrong answer can still have high integrity and vice versa.\n\n"
+    "{accuracy_criteria}"
+    "**Part B - Process Integrity & Completeness**\n"
+    "Score how thoroughly the output (including any visible reasoning in the raw output) covers the critical conditions and constraints of the 'Instruction' and 'Question', "
+    "whether it understands every part of the question, uses the relevant information provided, and reasons without significant gaps or unjustified leaps. "
+    "Do NOT consider whether the final answer is correct in this part.\n"
+    "   - 0-30: Severely lacking integrity; missed most critical conditions or showed flawed reasoning.\n"
+    "   - 31-60: Partially addressed conditions/question parts; some notable omissions or minor logical gaps.\n"
+    "   - 61-90: Mostly complete; addressed most key aspects well with minor room for improvement in thoroughness.\n"
+    "   - 91-100: Excellent integrity; comprehensively considered all relevant conditions and parts of the question with clear, sound reasoning (if visible).\n\n"
+    "Here is the information you need to evaluate:\n"
+    "1. Instruction (Original Context):\n```\n{instruction}\n```\n\n"
+    "2. Question (Original Question):\n```\n{question}\n```\n\n"
+    "3. Reference Answer (The ground truth, for Part A only):\n```\n{reference_answer}\n```\n\n"
+    "4. Candidate Output (Raw - this may include reasoning steps if provided by the worker AI):\n```\n{candidate_output_raw}\n```\n\n"
+    "5. Candidate Answer (Cleaned - the final concise answer extracted from the raw output):\n```\n{candidate_answer_cleaned}\n```\n\n"
+    "**Output Format:**\n"
+    "Respond ONLY with one JSON object containing four keys:\n"
+    "1. `\"is_judged_correct\"`: A boolean value for Part A.\n"
+    "2. `\"reasoning\"`: A brief explanation of the Part A decision.\n"
+    "3. `\"integrity_score\"`: An integer from 0 to 100 for Part B.\n"
+    "4. `\"integrity_reasoning\"`: A brief explanation of the Part B score.\n\n"
+    "Example JSON response:\n"
+    "{{\n"
+    "  \"is_judged_correct\": true,\n"
+    "  \"reasoning\": \"The candidate states the same power value as the reference answer.\",\n"
+    "  \"integrity_score\": 85,\n"
+    "  \"integrity_reasoning\": \"The AI considered most conditions from the instruction but did not explicitly address the time constraint mentioned in the question.\"\n"
+    "}}\n\n"
+    "Now, provide your evaluation for the given data in the specified JSON format only:"
+)
+
+def get_combined_judge_prompt_template(level_name: str) -> str:
+    """
+    Returns the combined (accuracy + integrity) judge prompt for a dataset level, with that level's
+    accuracy criteria filled in. The remaining placeholders are the same as in the two separate prompts.
+
+    Raises:
+        ValueError: If an unknown level_name is provided.
+    """
+    if level_name not in COMBINED_JUDGE_ACCURACY_CRITERIA:
+        raise ValueError(f"Unknown level_name '{level_name}'. Available: {', '.join(COMBINED_JUDGE_ACCURACY_CRITERIA)}.")
+    return PROMPT_FOR_COMBINED_JUDGE_TEMPLATE.replace("{accuracy_criteria}", COMBINED_JUDGE_ACCURACY_CRITERIA[level_name])
+
+# ==============================================================================
+# 5. PACKED JUDGE PROMPTS (Several items judged in one call, see judge_packing.py)
+#    The rubric of the single-item judge prompt is sent once, followed by each item's data under an
+#    "=== Item <id> ===" header; these texts replace the single-item closing line.
+# ==============================================================================
+
+PACKED_JUDGE_INSTRUCTIONS = (
+    "**Multiple Items:** The data below contains several independent items, each introduced by a line '=== Item <id> ==='. "
+    "Evaluate every item on its own, applying the criteria above as if it were the only item, and do not compare the items with each other. "
+    "The output format above describes the JSON object for ONE item."
+)
+
+PACKED_JUDGE_CUE = (
+    "Respond ONLY with a JSON array containing one JSON object per item, in the same order as the items. "
+    "Each object must contain the key \"item_id\" (the item's id from its header, as a string) plus the keys of the single-item output format. "
+    "Now, provide your evaluation for all {item_count} items as a JSON array only:"
+)
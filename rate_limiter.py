@@ -0,0 +1,160 @@
+# rate_limiter.py
+import asyncio
+import random
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Any
+from config import APP_CONFIG
+from run_stats import record_stat
+from run_metrics import observe
+
+THROTTLE_STATUS_CODES = {429}
+
+def parse_retry_after(header_value: Optional[str]) -> Optional[float]:
+    """Parses a Retry-After header given either as delay-seconds or as an HTTP-date."""
+    if not header_value: return None
+    header_value = header_value.strip()
+    try:
+        return max(0.0, float(header_value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(header_value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+def compute_backoff_delay(attempt: int, retry_after_seconds: Optional[float] = None) -> float:
+    """Exponential backoff with equal jitter, never shorter than a server-provided Retry-After."""
+    exponential = min(APP_CONFIG.RETRY_MAX_DELAY_SECONDS, APP_CONFIG.RETRY_DELAY_SECONDS * (2 ** attempt))
+    delay = exponential / 2 + random.uniform(0, exponential / 2)
+    if retry_after_seconds is not None: delay = max(delay, retry_after_seconds)
+    return delay
+
+class AdaptiveEndpointLimiter:
+    """
+    Per-endpoint admission control for API calls:
+      - a token bucket capping the request rate (only when RATE_LIMIT_REQUESTS_PER_SECOND > 0),
+      - an AIMD concurrency window: slow start (+1 per success) until the first throttle, then +1 per
+        full window of successes; multiplied by ADAPTIVE_DECREASE_FACTOR on a 429 or 5xx (at most once
+        per window), and held flat while latency is inflated by ADAPTIVE_LATENCY_INFLATION over the
+        best observed average,
+      - an endpoint-wide pause honouring Retry-After, so every caller backs off, not just the one that got it.
+    """
+    def __init__(self, endpoint: str, max_concurrency: int):
+        self.endpoint = endpoint
+        self.max_concurrency = max(1, max_concurrency)
+        self.adaptive = APP_CONFIG.ADAPTIVE_CONCURRENCY_ENABLED
+        self.concurrency_limit = float(min(self.max_concurrency, APP_CONFIG.ADAPTIVE_INITIAL_CONCURRENCY) if self.adaptive else self.max_concurrency)
+        self.in_slow_start = True
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.rate = APP_CONFIG.RATE_LIMIT_REQUESTS_PER_SECOND
+        self.tokens = max(1.0, self.rate)
+        self.last_refill = time.monotonic()
+        self.last_decrease_at = 0.0
+        self.latency_ewma: Optional[float] = None
+        self.best_latency_ewma: Optional[float] = None
+        self.stats: Counter = Counter()
+        self._condition = asyncio.Condition()
+
+    async def _wait_for_token(self):
+        while self.rate > 0:
+            now = time.monotonic()
+            self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+    async def acquire(self):
+        while True:
+            pause_remaining = self.paused_until - time.monotonic()
+            if pause_remaining > 0:
+                await asyncio.sleep(pause_remaining)
+                continue
+            async with self._condition:
+                await self._condition.wait_for(lambda: self.in_flight < int(self.concurrency_limit))
+                if self.paused_until > time.monotonic(): continue
+                self.in_flight += 1
+            break
+        try:
+            await self._wait_for_token()
+        except asyncio.CancelledError:
+            # Cancelled (e.g. the losing call of a hedge) after taking a slot but before release() could be reached.
+            self.in_flight -= 1
+            async with self._condition:
+                self._condition.notify_all()
+            raise
+
+    async def release(self, status_code: Optional[int], latency_seconds: float, retry_after_seconds: Optional[float]):
+        self.in_flight -= 1
+        now = time.monotonic()
+        throttled = status_code in THROTTLE_STATUS_CODES
+        server_error = status_code is not None and status_code >= 500
+        if throttled: self._record("rate_limited_responses")
+        if server_error: self._record("server_error_responses")
+        if retry_after_seconds is not None and (throttled or server_error):
+            self.paused_until = max(self.paused_until, now + retry_after_seconds)
+            self._record("retry_after_pauses")
+
+        if self.adaptive:
+            if throttled or server_error:
+                # Multiplicative decrease, at most once per window of in-flight requests so a burst of
+                # 429s from the same overload only counts once.
+                window_seconds = max(1.0, self.latency_ewma or 0.0)
+                if now - self.last_decrease_at > window_seconds:
+                    self.concurrency_limit = max(1.0, self.concurrency_limit * APP_CONFIG.ADAPTIVE_DECREASE_FACTOR)
+                    self.last_decrease_at = now
+                    self.in_slow_start = False
+                    self._record("concurrency_decreases")
+            elif status_code is not None and status_code < 400:
+                self.latency_ewma = latency_seconds if self.latency_ewma is None else 0.9 * self.latency_ewma + 0.1 * latency_seconds
+                self.best_latency_ewma = self.latency_ewma if self.best_latency_ewma is None else min(self.best_latency_ewma, self.latency_ewma)
+                latency_inflated = self.latency_ewma > APP_CONFIG.ADAPTIVE_LATENCY_INFLATION * self.best_latency_ewma
+                if not latency_inflated:
+                    increase = 1.0 if self.in_slow_start else 1.0 / self.concurrency_limit
+                    self.concurrency_limit = min(float(self.max_concurrency), self.concurrency_limit + increase)
+        async with self._condition:
+            self._condition.notify_all()
+
+    def _record(self, stat_name: str, amount=1):
+        self.stats[stat_name] += amount
+        record_stat(stat_name, amount)
+
+    def retry_after_remaining(self) -> Optional[float]:
+        remaining = self.paused_until - time.monotonic()
+        return remaining if remaining > 0 else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"concurrency_limit": round(self.concurrency_limit, 1), "max_concurrency": self.max_concurrency,
+                "requests_per_second_cap": self.rate or None, **dict(self.stats)}
+
+_LIMITERS: Dict[str, AdaptiveEndpointLimiter] = {}
+_MAX_CONCURRENCY_PER_ENDPOINT: int = 0
+
+def configure_endpoint_limiters(max_concurrency_per_endpoint: int):
+    global _MAX_CONCURRENCY_PER_ENDPOINT
+    _MAX_CONCURRENCY_PER_ENDPOINT = max_concurrency_per_endpoint
+
+def get_endpoint_limiter(target_api_url: str) -> AdaptiveEndpointLimiter:
+    limiter = _LIMITERS.get(target_api_url)
+    if limiter is None:
+        limiter = AdaptiveEndpointLimiter(target_api_url, _MAX_CONCURRENCY_PER_ENDPOINT or APP_CONFIG.MAX_CONCURRENT_ITEMS_PER_COMBO)
+        _LIMITERS[target_api_url] = limiter
+    return limiter
+
+async def backoff_before_retry(attempt: int, limiter: AdaptiveEndpointLimiter):
+    delay = compute_backoff_delay(attempt, limiter.retry_after_remaining())
+    record_stat("retries")
+    record_stat("backoff_sleep_seconds", delay)
+    observe("backoff_seconds", delay)
+    await asyncio.sleep(delay)
+
+def summarize_rate_limit_stats(stats: Counter) -> Dict[str, Any]:
+    return {stat_name: round(stats.get(stat_name, 0), 2) for stat_name in
+            ("retries", "backoff_sleep_seconds", "rate_limited_responses", "server_error_responses", "retry_after_pauses", "concurrency_decreases")}
+
+def summarize_all_endpoint_limiters() -> Dict[str, Dict[str, Any]]:
+    return {endpoint: limiter.snapshot() for endpoint, limiter in _LIMITERS.items()}
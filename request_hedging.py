@@ -0,0 +1,84 @@
+# request_hedging.py
+"""
+Hedged API calls. A combination is only done when its slowest items are, so a few calls stuck in a
+provider's latency tail set its wall time. With HEDGE_ENABLED, a call that has not returned after the
+HEDGE_PERCENTILE latency observed so far for its endpoint and model (at least HEDGE_MIN_DELAY_SECONDS,
+and only once HEDGE_MIN_SAMPLES calls have been timed) gets one duplicate. The first successful result
+wins and the other call is cancelled. Duplicates are capped at HEDGE_MAX_EXTRA_FRACTION of all calls
+to the endpoint, so a generally slow provider is not hit with twice the traffic. The latency histogram
+only holds the durations of HTTP requests that got a successful response, timed from when the rate
+limiter let them go (record_request_latency); cache hits, queueing and retry backoff are not in it.
+"""
+import asyncio
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable
+from config import APP_CONFIG
+from run_stats import record_stat, ratio_or_none
+from run_metrics import LogHistogram
+
+class EndpointHedger:
+    """Latency histogram and hedge budget of one endpoint + model."""
+    def __init__(self):
+        self.latencies = LogHistogram()
+        self.calls = 0
+        self.hedges = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a call gets a duplicate, or None while there are too few samples."""
+        if self.latencies.count < APP_CONFIG.HEDGE_MIN_SAMPLES: return None
+        return max(APP_CONFIG.HEDGE_MIN_DELAY_SECONDS, self.latencies.percentile(APP_CONFIG.HEDGE_PERCENTILE))
+
+    def within_budget(self) -> bool:
+        return self.hedges + 1 <= APP_CONFIG.HEDGE_MAX_EXTRA_FRACTION * self.calls
+
+_HEDGERS: Dict[Tuple[str, str], EndpointHedger] = {}
+
+def _get_hedger(target_api_url: str, model_id: str) -> EndpointHedger:
+    hedger = _HEDGERS.get((target_api_url, model_id))
+    if hedger is None: hedger = _HEDGERS[(target_api_url, model_id)] = EndpointHedger()
+    return hedger
+
+def record_request_latency(target_api_url: str, model_id: str, request_seconds: float):
+    """Duration of one successful HTTP request; called from the retry loop of call_llm_api."""
+    if APP_CONFIG.HEDGE_ENABLED: _get_hedger(target_api_url, model_id).latencies.record(request_seconds)
+
+def _call_succeeded(result: Tuple) -> bool:
+    return result[2] is None and result[0] is not None
+
+async def hedged_call(target_api_url: str, model_id: str, make_call: Callable[[], Awaitable[Tuple]]) -> Tuple:
+    """Runs make_call() (an API call returning (content, usage, error, ...)), hedged as described in the module docstring."""
+    if not APP_CONFIG.HEDGE_ENABLED: return await make_call()
+    hedger = _get_hedger(target_api_url, model_id)
+    hedger.calls += 1
+    hedge_delay = hedger.hedge_delay()
+    if hedge_delay is None: return await make_call()
+    primary = asyncio.ensure_future(make_call())
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if not done and hedger.within_budget():
+            hedger.hedges += 1
+            record_stat("hedged_requests")
+            tasks.add(asyncio.ensure_future(make_call()))
+        result = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task_result = task.result()
+                if result is None or (_call_succeeded(task_result) and not _call_succeeded(result)):
+                    result = task_result
+                    if task is not primary and _call_succeeded(task_result): record_stat("hedge_wins")
+            if _call_succeeded(result): break # First successful response wins; otherwise wait for the other call
+        return result
+    finally:
+        for task in tasks:
+            if not task.done(): task.cancel()
+
+def summarize_hedging_stats(stats) -> Dict[str, Any]:
+    hedges, wins = stats.get("hedged_requests", 0), stats.get("hedge_wins", 0)
+    return {"enabled": APP_CONFIG.HEDGE_ENABLED, "hedged_requests": hedges, "hedge_wins": wins, "hedge_win_rate": ratio_or_none(wins, hedges)}
+
+def summarize_all_endpoint_hedgers() -> Dict[str, Dict[str, Any]]:
+    return {f"{target_api_url} ({model_id})": {"calls": hedger.calls, "hedged_requests": hedger.hedges,
+                                               "extra_request_rate": ratio_or_none(hedger.hedges, hedger.calls),
+                                               "current_hedge_delay_seconds": round(hedger.hedge_delay(), 3) if hedger.hedge_delay() is not None else None}
+            for (target_api_url, model_id), hedger in _HEDGERS.items()}
@@ -0,0 +1,110 @@
+# response_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import Counter
+from typing import Optional, Dict, Any, Tuple
+from config import APP_CONFIG
+from run_stats import ratio_or_none
+
+class ResponseCache:
+    """
+    Persistent, content-addressed store of successful chat-completion responses.
+    Entries are keyed by a SHA-256 of the endpoint URL plus the full request payload, so a worker or
+    judge call is only served from the cache when model_id, messages, temperature, max_tokens etc.
+    are byte-for-byte the same as a previous call. Old and least-recently-used entries are evicted
+    once they exceed RESPONSE_CACHE_MAX_AGE_DAYS / RESPONSE_CACHE_MAX_MB.
+    """
+    EVICT_EVERY_N_PUTS = 500
+
+    def __init__(self, db_path: str, max_bytes: int, max_age_seconds: float):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._puts_since_eviction = 0
+        base_dir = os.path.dirname(db_path)
+        if base_dir: os.makedirs(base_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, content TEXT NOT NULL, usage TEXT, response_time_seconds REAL,"
+            " size_bytes INTEGER NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        self.evict()
+
+    @staticmethod
+    def make_key(target_api_url: str, payload: Dict[str, Any]) -> str:
+        canonical = json.dumps({"url": target_api_url, "payload": payload}, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[str, Optional[Dict[str, int]], Optional[float]]]:
+        row = self._conn.execute("SELECT content, usage, response_time_seconds, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None: return None
+        content, usage_json, response_time_seconds, created_at = row
+        now = time.time()
+        if self.max_age_seconds > 0 and now - created_at > self.max_age_seconds:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        return content, (json.loads(usage_json) if usage_json else None), response_time_seconds
+
+    def put(self, key: str, content: str, usage: Optional[Dict[str, int]], response_time_seconds: Optional[float]):
+        usage_json = json.dumps(usage) if usage else None
+        size_bytes = len(content.encode("utf-8")) + len(usage_json or "")
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, content, usage, response_time_seconds, size_bytes, created_at, last_access)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, content, usage_json, response_time_seconds, size_bytes, now, now)
+        )
+        self._puts_since_eviction += 1
+        if self._puts_since_eviction >= self.EVICT_EVERY_N_PUTS:
+            self.evict()
+
+    def evict(self):
+        """Drops entries older than the max age, then least-recently-used entries until under the size cap."""
+        self._puts_since_eviction = 0
+        if self.max_age_seconds > 0:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+        if self.max_bytes > 0:
+            total_bytes = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM responses").fetchone()[0]
+            if total_bytes > self.max_bytes:
+                bytes_to_free = total_bytes - self.max_bytes
+                freed = 0; keys_to_delete = []
+                for key, size_bytes in self._conn.execute("SELECT key, size_bytes FROM responses ORDER BY last_access ASC"):
+                    keys_to_delete.append((key,)); freed += size_bytes
+                    if freed >= bytes_to_free: break
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", keys_to_delete)
+
+    def close(self):
+        self._conn.close()
+
+_RESPONSE_CACHE: Optional[ResponseCache] = None
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Returns the process-wide cache, opening it on first use. None when RESPONSE_CACHE_ENABLED is false."""
+    global _RESPONSE_CACHE
+    if not APP_CONFIG.RESPONSE_CACHE_ENABLED: return None
+    if _RESPONSE_CACHE is None:
+        _RESPONSE_CACHE = ResponseCache(
+            APP_CONFIG.RESPONSE_CACHE_PATH,
+            max_bytes=APP_CONFIG.RESPONSE_CACHE_MAX_MB * 1024 * 1024,
+            max_age_seconds=APP_CONFIG.RESPONSE_CACHE_MAX_AGE_DAYS * 86400
+        )
+    return _RESPONSE_CACHE
+
+def close_response_cache():
+    global _RESPONSE_CACHE
+    if _RESPONSE_CACHE is not None:
+        _RESPONSE_CACHE.close()
+        _RESPONSE_CACHE = None
+
+def summarize_cache_stats(stats: Counter) -> Dict[str, Any]:
+    hits, misses = stats.get("cache_hits", 0), stats.get("cache_misses", 0)
+    return {"enabled": APP_CONFIG.RESPONSE_CACHE_ENABLED, "hits": hits, "misses": misses,
+            "hit_rate": ratio_or_none(hits, hits + misses)}
@@ -0,0 +1,210 @@
+# result_store.py
+"""
+Optional columnar copy of the ESI results, written next to the JSONL output when
+COLUMNAR_RESULTS_ENABLED is set (needs the 'pyarrow' package). Each combination gets two Parquet files:
+  scores  ids, statuses, sub-scores, ESI, verdicts, timings and token counts, with the dataset, worker
+          model, prompt version, status and scenario columns dictionary-encoded,
+  text    the large text fields (instruction, question, answers, raw judge outputs, error details)
+          keyed by the same id, zstd-compressed,
+so cross-run analysis reads a few numeric columns instead of parsing every JSONL line. Rows are written
+in row groups of COLUMNAR_ROW_GROUP_SIZE, so memory stays bounded whatever the dataset size.
+
+    python result_store.py summarize "./Result/Columnar/ESI_Scores_*.parquet"
+    python result_store.py convert ./Result/ESI_Result_*.jsonl
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+from typing import Dict, Any, List, Optional, Tuple
+from config import APP_CONFIG
+
+# (result key, column type) of the scores file; "dictionary" columns are dictionary-encoded strings.
+SCORE_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ("id", "int64"), ("status", "dictionary"), ("scenario_code", "dictionary"),
+    ("s_accuracy", "float64"), ("s_true_integrity", "float64"), ("s_efficiency", "float64"),
+    ("s_safety", "float64"), ("s_alignment_simple", "float64"), ("esi_score", "float64"),
+    ("judge_verdict_is_correct", "bool"), ("integrity_judge_score", "int64"), ("accuracy_verdict_source", "dictionary"),
+    ("worker_output_correctly_formatted", "bool"),
+    ("worker_prompt_tokens", "int64"), ("worker_completion_tokens", "int64"), ("worker_cached_prompt_tokens", "int64"),
+    ("worker_response_time_seconds", "float64"), ("accuracy_judge_response_time_seconds", "float64"),
+    ("integrity_judge_response_time_seconds", "float64"), ("worker_ttft_seconds", "float64"), ("worker_tokens_per_second", "float64"),
+)
+TEXT_FIELDS: Tuple[str, ...] = (
+    "instruction", "question", "reference_answer", "worker_answer_raw", "worker_answer_cleaned",
+    "accuracy_judge_reasoning", "accuracy_judge_raw_output", "integrity_judge_reasoning", "integrity_judge_raw_output",
+    "processing_error_details", "worker_api_error_details",
+)
+COMBO_FIELDS: Tuple[str, ...] = ("dataset_short_name", "worker_model_id", "worker_prompt_version")
+
+_PYARROW_WARNING_SHOWN = False
+
+def _import_pyarrow():
+    """(pyarrow, pyarrow.parquet), or None (with a one-time warning) when the package is not installed."""
+    global _PYARROW_WARNING_SHOWN
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow, pyarrow.parquet
+    except ImportError:
+        if not _PYARROW_WARNING_SHOWN:
+            print("WARNING: The 'pyarrow' package is not installed (pip install pyarrow), so no columnar result files are written.")
+            _PYARROW_WARNING_SHOWN = True
+        return None
+
+def _arrow_type(pa, type_name: str):
+    if type_name == "dictionary": return pa.dictionary(pa.int32(), pa.string())
+    return {"int64": pa.int64(), "float64": pa.float64(), "bool": pa.bool_()}[type_name]
+
+def _coerce(value: Any, type_name: str) -> Any:
+    """Values the JSONL may hold in a different shape (e.g. "N/A", numeric scenario codes) become None or strings."""
+    if value is None: return None
+    if type_name == "dictionary": return str(value)
+    if type_name == "bool": return value if isinstance(value, bool) else None
+    if isinstance(value, bool) or not isinstance(value, (int, float)): return None
+    return int(value) if type_name == "int64" else float(value)
+
+class ColumnarResultWriter:
+    """Streams one combination's results into its scores and text Parquet files (written to .tmp and renamed on close)."""
+    def __init__(self, scores_path: str, text_path: str, combo_values: Dict[str, str], row_group_size: int):
+        self.pa, self.pq = _import_pyarrow()
+        self.scores_path, self.text_path = scores_path, text_path
+        self.combo_values = combo_values
+        self.row_group_size = max(1, row_group_size)
+        pa = self.pa
+        dictionary_type = pa.dictionary(pa.int32(), pa.string())
+        combo_columns = [pa.field(name, dictionary_type) for name in COMBO_FIELDS]
+        self.scores_schema = pa.schema(combo_columns + [pa.field(key, _arrow_type(pa, type_name)) for key, type_name in SCORE_FIELDS])
+        self.text_schema = pa.schema(combo_columns + [pa.field("id", pa.int64())] + [pa.field(key, pa.large_string()) for key in TEXT_FIELDS])
+        for path in (scores_path, text_path):
+            if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._scores_writer = self.pq.ParquetWriter(scores_path + ".tmp", self.scores_schema, compression="zstd")
+        self._text_writer = self.pq.ParquetWriter(text_path + ".tmp", self.text_schema, compression="zstd", compression_level=9)
+        self._rows: List[Dict[str, Any]] = []
+        self.rows_written = 0
+
+    def add(self, item_result: Dict[str, Any]):
+        self._rows.append(item_result)
+        if len(self._rows) >= self.row_group_size: self._flush()
+
+    def _combo_columns(self, row_count: int) -> List[Any]:
+        pa = self.pa
+        return [pa.DictionaryArray.from_arrays(pa.array([0] * row_count, pa.int32()), pa.array([self.combo_values[name]], pa.string()))
+                for name in COMBO_FIELDS]
+
+    def _flush(self):
+        if not self._rows: return
+        pa, rows = self.pa, self._rows
+        score_columns = []
+        for key, type_name in SCORE_FIELDS:
+            values = [_coerce(row.get(key), type_name) for row in rows]
+            score_columns.append(pa.array(values, pa.string()).dictionary_encode() if type_name == "dictionary" else pa.array(values, _arrow_type(pa, type_name)))
+        self._scores_writer.write_table(pa.Table.from_arrays(self._combo_columns(len(rows)) + score_columns, schema=self.scores_schema))
+        text_columns = [pa.array([_coerce(row.get("id"), "int64") for row in rows], pa.int64())]
+        text_columns += [pa.array([None if row.get(key) is None else str(row[key]) for row in rows], pa.large_string()) for key in TEXT_FIELDS]
+        self._text_writer.write_table(pa.Table.from_arrays(self._combo_columns(len(rows)) + text_columns, schema=self.text_schema))
+        self.rows_written += len(rows)
+        self._rows = []
+
+    def close(self):
+        self._flush()
+        self._scores_writer.close(); self._text_writer.close()
+        os.replace(self.scores_path + ".tmp", self.scores_path)
+        os.replace(self.text_path + ".tmp", self.text_path)
+
+def open_columnar_result_writer(file_name_fields: Dict[str, str], combo_values: Dict[str, str]) -> Optional[ColumnarResultWriter]:
+    """
+    A writer for one combination when COLUMNAR_RESULTS_ENABLED is set and pyarrow is installed, else None.
+    `file_name_fields` fill the COLUMNAR_*_FILE_TEMPLATE paths; `combo_values` are the dataset/model/prompt column values.
+    """
+    if not APP_CONFIG.COLUMNAR_RESULTS_ENABLED or _import_pyarrow() is None: return None
+    return ColumnarResultWriter(APP_CONFIG.COLUMNAR_SCORES_FILE_TEMPLATE.format(**file_name_fields),
+                                APP_CONFIG.COLUMNAR_TEXT_FILE_TEMPLATE.format(**file_name_fields),
+                                combo_values, APP_CONFIG.COLUMNAR_ROW_GROUP_SIZE)
+
+def convert_jsonl_results(jsonl_path: str) -> Optional[ColumnarResultWriter]:
+    """Writes the columnar files for an existing ESI_Result JSONL file (dataset/model/prompt taken from its rows)."""
+    combo_values = None
+    with open(jsonl_path, "r", encoding="utf-8") as f_in:
+        for line in f_in:
+            if not line.strip(): continue
+            result = json.loads(line)
+            # Rows that failed before the worker call (input errors, skipped items) lack the model and prompt.
+            if combo_values is None or not combo_values["worker_model_id"]:
+                combo_values = {name: str(result.get(name) or "") for name in COMBO_FIELDS}
+            if combo_values["worker_model_id"]: break
+    if combo_values is None: return None
+    file_name_fields = {"dataset_short_name": combo_values["dataset_short_name"],
+                        "model_id": combo_values["worker_model_id"].replace("/", "__").replace(":", "_"),
+                        "prompt_version": combo_values["worker_prompt_version"]}
+    writer = ColumnarResultWriter(APP_CONFIG.COLUMNAR_SCORES_FILE_TEMPLATE.format(**file_name_fields),
+                                  APP_CONFIG.COLUMNAR_TEXT_FILE_TEMPLATE.format(**file_name_fields),
+                                  combo_values, APP_CONFIG.COLUMNAR_ROW_GROUP_SIZE)
+    with open(jsonl_path, "r", encoding="utf-8") as f_in:
+        for line in f_in:
+            if line.strip(): writer.add(json.loads(line))
+    writer.close()
+    return writer
+
+def summarize_scores(paths: List[str]) -> List[Dict[str, Any]]:
+    """
+    Per-combination item counts and average scores of COMPLETED items over any number of scores files,
+    reading only the columns it needs, one file at a time.
+    """
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    score_keys = ("s_accuracy", "s_true_integrity", "s_efficiency", "s_safety", "s_alignment_simple", "esi_score")
+    totals: Dict[Tuple[str, ...], Dict[str, float]] = {}
+    for path in paths:
+        table = pq.read_table(path, columns=list(COMBO_FIELDS) + ["status"] + list(score_keys))
+        grouped = table.group_by(list(COMBO_FIELDS)).aggregate([("status", "count")])
+        completed = table.filter(pc.equal(table["status"].cast("string"), "COMPLETED"))
+        sums = completed.group_by(list(COMBO_FIELDS)).aggregate([(key, "sum") for key in score_keys] + [("esi_score", "count")])
+        for row in grouped.to_pylist():
+            combo_key = tuple(str(row[name]) for name in COMBO_FIELDS)
+            totals.setdefault(combo_key, {"items": 0, "completed": 0, **{key: 0.0 for key in score_keys}})["items"] += row["status_count"]
+        for row in sums.to_pylist():
+            combo_total = totals[tuple(str(row[name]) for name in COMBO_FIELDS)]
+            combo_total["completed"] += row["esi_score_count"]
+            for key in score_keys: combo_total[key] += row[f"{key}_sum"] or 0.0
+    summary = []
+    for combo_key, combo_total in sorted(totals.items()):
+        completed_count = combo_total["completed"]
+        summary.append({**dict(zip(COMBO_FIELDS, combo_key)), "items": combo_total["items"], "completed": completed_count,
+                        **{f"average_{key}": round(combo_total[key] / completed_count, 3) if completed_count else None for key in score_keys}})
+    return summary
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Columnar (Parquet) ESI result files: convert JSONL results, summarize scores files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Write the columnar files for existing ESI_Result JSONL files.")
+    convert_parser.add_argument("paths", nargs="+")
+    summarize_parser = subparsers.add_parser("summarize", help="Average scores per combination over scores files (glob patterns allowed).")
+    summarize_parser.add_argument("patterns", nargs="+")
+    summarize_parser.add_argument("--output", default=None, help="Also write the summary as JSON.")
+    args = parser.parse_args(argv)
+    if _import_pyarrow() is None: return 1
+
+    if args.command == "convert":
+        for path in args.paths:
+            writer = convert_jsonl_results(path)
+            if writer is None: print(f"Skipped empty file: {path}")
+            else: print(f"{path}: {writer.rows_written} row(s) -> {writer.scores_path}, {writer.text_path}")
+        return 0
+
+    paths = sorted({path for pattern in args.patterns for path in glob.glob(pattern)})
+    if not paths:
+        print("ERROR: No scores files match.")
+        return 1
+    summary = summarize_scores(paths)
+    for combo_summary in summary:
+        print(f"{combo_summary['dataset_short_name']} | {combo_summary['worker_model_id']} | {combo_summary['worker_prompt_version']}: "
+              f"{combo_summary['completed']}/{combo_summary['items']} completed, average ESI {combo_summary['average_esi_score']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f_out: json.dump(summary, f_out, indent=4, ensure_ascii=False)
+        print(f"Summary saved to: {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+# run_metrics.py
+import asyncio
+import contextvars
+import math
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple
+from run_stats import RUN_STATS
+
+class LogHistogram:
+    """
+    HDR-style histogram: values land in log-spaced buckets whose width is `relative_precision` of their
+    value, so p50/p95/p99 are accurate to about 1% with a few hundred buckets whatever the range
+    (milliseconds to hours) and the number of observations.
+    """
+    __slots__ = ("_log_growth", "min_value", "buckets", "count", "total", "max", "min")
+
+    def __init__(self, relative_precision: float = 0.01, min_value: float = 1e-6):
+        self._log_growth = math.log1p(2 * relative_precision)
+        self.min_value = min_value
+        self.buckets: Dict[int, int] = {}
+        self.count, self.total, self.max, self.min = 0, 0.0, 0.0, None
+
+    def record(self, value: float):
+        value = max(0.0, float(value))
+        bucket = 0 if value <= self.min_value else int(math.log(value / self.min_value) / self._log_growth) + 1
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1; self.total += value
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    def _bucket_value(self, bucket: int) -> float:
+        if bucket == 0: return self.min_value
+        # Geometric middle of the bucket, so the error is at most half a bucket width either way.
+        return self.min_value * math.exp((bucket - 0.5) * self._log_growth)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self.count: return None
+        rank, seen = max(1, math.ceil(fraction * self.count)), 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank: return min(self.max, max(self.min, self._bucket_value(bucket)))
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.count: return {"count": 0}
+        return {"count": self.count, "mean": round(self.total / self.count, 4),
+                "p50": round(self.percentile(0.50), 4), "p95": round(self.percentile(0.95), 4),
+                "p99": round(self.percentile(0.99), 4), "max": round(self.max, 4)}
+
+SeriesKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+def _series_key(name: str, labels: Dict[str, Any]) -> SeriesKey:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+def _series_display_name(series_key: SeriesKey) -> str:
+    name, labels = series_key
+    return name + ("{" + ",".join(f"{label}={value}" for label, value in labels) + "}" if labels else "")
+
+class MetricsRegistry:
+    """Latency/throughput histograms and in-flight gauges, one series per metric name + label set."""
+    def __init__(self):
+        self.histograms: Dict[SeriesKey, LogHistogram] = {}
+        self.gauges: Dict[SeriesKey, float] = {}
+
+    def observe(self, name: str, value: float, **labels):
+        series_key = _series_key(name, labels)
+        histogram = self.histograms.get(series_key)
+        if histogram is None: histogram = self.histograms[series_key] = LogHistogram()
+        histogram.record(value)
+
+    def add_to_gauge(self, name: str, delta: float, **labels):
+        series_key = _series_key(name, labels)
+        self.gauges[series_key] = self.gauges.get(series_key, 0.0) + delta
+
+    def summarize(self) -> Dict[str, Any]:
+        return {_series_display_name(series_key): histogram.summary()
+                for series_key, histogram in sorted(self.histograms.items())}
+
+# The whole run's metrics, and those of the combination whose item is being processed (set next to
+# run_stats.current_combo_stats by the pipeline stages).
+RUN_METRICS = MetricsRegistry()
+current_combo_metrics: contextvars.ContextVar[Optional[MetricsRegistry]] = contextvars.ContextVar("current_combo_metrics", default=None)
+
+def observe(name: str, value: Optional[float], **labels):
+    """Records one observation (seconds, tokens/s, ...) for the run and the current combination."""
+    if value is None: return
+    RUN_METRICS.observe(name, value, **labels)
+    combo_metrics = current_combo_metrics.get()
+    if combo_metrics is not None: combo_metrics.observe(name, value, **labels)
+
+@contextmanager
+def timed(name: str, **labels):
+    """Observes the wall time of the block (also when it raises)."""
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started_at, **labels)
+
+@contextmanager
+def in_flight(name: str, **labels):
+    """Run-wide gauge of how many blocks of this kind are running right now."""
+    RUN_METRICS.add_to_gauge(name, 1, **labels)
+    try:
+        yield
+    finally:
+        RUN_METRICS.add_to_gauge(name, -1, **labels)
+
+def _prometheus_labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(labels) + list((extra or {}).items())
+    if not pairs: return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{label}="{value}"' for (label, _), value in zip(pairs, escaped)) + "}"
+
+def render_prometheus(prefix: str = "lunarbench") -> str:
+    """The run's metrics in the Prometheus text exposition format (histograms as summaries with quantiles)."""
+    lines = []
+    by_name: Dict[str, list] = {}
+    for series_key, histogram in RUN_METRICS.histograms.items(): by_name.setdefault(series_key[0], []).append((series_key[1], histogram))
+    for name, series in sorted(by_name.items()):
+        lines.append(f"# TYPE {prefix}_{name} summary")
+        for labels, histogram in series:
+            for quantile in (0.5, 0.95, 0.99):
+                value = histogram.percentile(quantile)
+                if value is not None: lines.append(f"{prefix}_{name}{_prometheus_labels(labels, {'quantile': str(quantile)})} {value:.6g}")
+            lines.append(f"{prefix}_{name}_sum{_prometheus_labels(labels)} {histogram.total:.6g}")
+            lines.append(f"{prefix}_{name}_count{_prometheus_labels(labels)} {histogram.count}")
+    gauges_by_name: Dict[str, list] = {}
+    for series_key, value in RUN_METRICS.gauges.items(): gauges_by_name.setdefault(series_key[0], []).append((series_key[1], value))
+    for name, series in sorted(gauges_by_name.items()):
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        lines.extend(f"{prefix}_{name}{_prometheus_labels(labels)} {value:.6g}" for labels, value in series)
+    for stat_name, value in sorted(RUN_STATS.items()):
+        lines.append(f"# TYPE {prefix}_{stat_name}_total counter")
+        lines.append(f"{prefix}_{stat_name}_total {value:.6g}")
+    return "\n".join(lines) + "\n"
+
+class MetricsServer:
+    """Minimal HTTP server on the run's event loop that answers every GET with render_prometheus()."""
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while (await reader.readline()).strip(): pass # Request line and headers; the path is ignored
+            body = render_prometheus().encode("utf-8")
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> bool:
+        try:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        except OSError as e:
+            print(f"WARNING: Could not start the metrics endpoint on {self.host}:{self.port}: {e}. Continuing without it.")
+            return False
+        print(f"Serving live metrics in Prometheus format on http://{self.host}:{self.port}/metrics")
+        return True
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+_METRICS_SERVER: Optional[MetricsServer] = None
+
+async def start_metrics_server(host: str, port: int):
+    """Starts the live metrics endpoint unless it is disabled (port 0) or already running."""
+    global _METRICS_SERVER
+    if port <= 0 or _METRICS_SERVER is not None: return
+    metrics_server = MetricsServer(host, port)
+    if await metrics_server.start(): _METRICS_SERVER = metrics_server
+
+async def stop_metrics_server():
+    global _METRICS_SERVER
+    if _METRICS_SERVER is not None:
+        await _METRICS_SERVER.stop()
+        _METRICS_SERVER = None
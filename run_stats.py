@@ -0,0 +1,22 @@
+# run_stats.py
+import contextvars
+from collections import Counter
+from typing import Optional
+
+# Counters for the combination whose item is currently being processed. Item workers set this
+# before running an item's pipeline so that low-level code (e.g. call_llm_api) can attribute
+# events such as cache hits to the right combination without threading a stats object through.
+current_combo_stats: contextvars.ContextVar[Optional[Counter]] = contextvars.ContextVar("current_combo_stats", default=None)
+
+# Counters for the whole run, across every combination.
+RUN_STATS: Counter = Counter()
+
+def record_stat(stat_name: str, amount: int = 1):
+    """Adds `amount` to `stat_name` for the current combination (if any) and for the whole run."""
+    RUN_STATS[stat_name] += amount
+    combo_stats = current_combo_stats.get()
+    if combo_stats is not None:
+        combo_stats[stat_name] += amount
+
+def ratio_or_none(numerator: int, denominator: int) -> Optional[float]:
+    return round(numerator / denominator, 4) if denominator > 0 else None
@@ -0,0 +1,129 @@
+# shard_queue.py
+import json
+import os
+import sqlite3
+import time
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+SHARD_PENDING, SHARD_CLAIMED, SHARD_DONE = "pending", "claimed", "done"
+
+class ShardQueue:
+    """
+    SQLite-backed work queue of evaluation shards (one combination x a contiguous item id range), shared
+    by worker processes on any host that can open the database file. Claims take a write lock
+    (BEGIN IMMEDIATE), so each shard goes to exactly one worker. A claim is a lease that the worker
+    renews while it runs; a shard whose lease ran out (crashed or stuck worker) can be claimed again
+    and continues from its partial result file.
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        base_dir = os.path.dirname(db_path)
+        if base_dir: os.makedirs(base_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self._conn.execute("PRAGMA busy_timeout=60000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS shards ("
+            " shard_id INTEGER PRIMARY KEY, dataset_short_name TEXT NOT NULL, worker_model_id TEXT NOT NULL,"
+            " prompt_version TEXT NOT NULL, start_id INTEGER NOT NULL, stop_id INTEGER NOT NULL,"
+            " result_path TEXT NOT NULL, status TEXT NOT NULL, claimed_by TEXT, lease_expires_at REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0, stats TEXT, finished_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_shards_status ON shards (status)")
+
+    def reset(self, shards: List[Dict[str, Any]]):
+        """Replaces the whole plan with `shards` (dicts with the combination, id range and result_path)."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute("DELETE FROM shards")
+            self._conn.executemany(
+                "INSERT INTO shards (dataset_short_name, worker_model_id, prompt_version, start_id, stop_id, result_path, status)"
+                " VALUES (:dataset_short_name, :worker_model_id, :prompt_version, :start_id, :stop_id, :result_path, '" + SHARD_PENDING + "')",
+                shards
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def claim(self, worker_name: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """Claims the next pending (or lease-expired) shard, or returns None when nothing is left to claim."""
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT shard_id FROM shards WHERE status = ? OR (status = ? AND lease_expires_at < ?) ORDER BY shard_id LIMIT 1",
+                (SHARD_PENDING, SHARD_CLAIMED, now)
+            ).fetchone()
+            if row is None:
+                self._conn.execute("COMMIT")
+                return None
+            self._conn.execute(
+                "UPDATE shards SET status = ?, claimed_by = ?, lease_expires_at = ?, attempts = attempts + 1 WHERE shard_id = ?",
+                (SHARD_CLAIMED, worker_name, now + lease_seconds, row[0])
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return self.get(row[0])
+
+    def renew_lease(self, shard_id: int, worker_name: str, lease_seconds: float) -> bool:
+        """Extends a claim; False if the shard is no longer held by this worker."""
+        cursor = self._conn.execute(
+            "UPDATE shards SET lease_expires_at = ? WHERE shard_id = ? AND status = ? AND claimed_by = ?",
+            (time.time() + lease_seconds, shard_id, SHARD_CLAIMED, worker_name)
+        )
+        return cursor.rowcount == 1
+
+    def mark_done(self, shard_id: int, worker_name: str, stats: Counter):
+        self._conn.execute(
+            "UPDATE shards SET status = ?, stats = ?, finished_at = ?, lease_expires_at = NULL WHERE shard_id = ? AND claimed_by = ?",
+            (SHARD_DONE, json.dumps(dict(stats)), time.time(), shard_id, worker_name)
+        )
+
+    def release(self, shard_id: int, worker_name: str):
+        """Gives a claimed shard back to the queue, e.g. after the worker hit an error."""
+        self._conn.execute(
+            "UPDATE shards SET status = ?, claimed_by = NULL, lease_expires_at = NULL WHERE shard_id = ? AND status = ? AND claimed_by = ?",
+            (SHARD_PENDING, shard_id, SHARD_CLAIMED, worker_name)
+        )
+
+    def get(self, shard_id: int) -> Dict[str, Any]:
+        self._conn.row_factory = sqlite3.Row
+        try:
+            return dict(self._conn.execute("SELECT * FROM shards WHERE shard_id = ?", (shard_id,)).fetchone())
+        finally:
+            self._conn.row_factory = None
+
+    def all_shards(self) -> List[Dict[str, Any]]:
+        self._conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in self._conn.execute("SELECT * FROM shards ORDER BY shard_id")]
+        finally:
+            self._conn.row_factory = None
+
+    def status_counts(self) -> Dict[str, int]:
+        return dict(self._conn.execute("SELECT status, COUNT(*) FROM shards GROUP BY status").fetchall())
+
+    def close(self):
+        self._conn.close()
+
+def plan_shards(combinations: List[Dict[str, Any]], shard_size: int, result_path_template: str) -> List[Dict[str, Any]]:
+    """
+    Splits each combination (dataset_short_name, worker_model_id, prompt_version, total_items) into id
+    ranges [start_id, stop_id) of at most `shard_size` items.
+    """
+    shards = []
+    shard_size = max(1, shard_size)
+    for combination in combinations:
+        safe_model_id_filename = combination["worker_model_id"].replace("/", "__").replace(":", "_")
+        for start_id in range(1, combination["total_items"] + 1, shard_size):
+            stop_id = min(start_id + shard_size, combination["total_items"] + 1)
+            shards.append({
+                "dataset_short_name": combination["dataset_short_name"], "worker_model_id": combination["worker_model_id"],
+                "prompt_version": combination["prompt_version"], "start_id": start_id, "stop_id": stop_id,
+                "result_path": result_path_template.format(dataset_short_name=combination["dataset_short_name"], model_id=safe_model_id_filename,
+                                                           prompt_version=combination["prompt_version"], start_id=start_id, stop_id=stop_id - 1)
+            })
+    return shards
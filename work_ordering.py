@@ -0,0 +1,129 @@
+# work_ordering.py
+"""
+Longest-first submission order. With a fixed number of worker coroutines a combination ends when its
+last, slowest items do, so starting the expensive items first and filling the gaps with short ones
+shortens the tail. With WORK_ORDERING "longest_first" every combination reads WORK_ORDER_WINDOW
+records at a time, sorts them by predicted worker latency and submits the slowest first; the shared
+worker queue is a priority queue, so items of different combinations are interleaved the same way.
+
+The prediction comes from the worker latencies of earlier runs, kept per model, prompt version,
+dataset and scenario_code in WORK_ORDER_HISTORY_PATH:
+  1. the scenario's average, once it has WORK_ORDER_MIN_SAMPLES items,
+  2. else the model + prompt version's average scaled by the item's prompt length,
+  3. else the prompt length alone, weighted up for prompt versions that ask for reasoning.
+Several processes on one host (e.g. --distributed workers) can share the history file: each one saves
+only the samples it recorded since its last save, merged into the file's current averages under a
+lock, so no worker's samples are lost to another's save.
+"""
+import contextlib
+import json
+import os
+from typing import Dict, Any, List, Optional, Tuple
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+from config import APP_CONFIG
+from dataset_loader import DatasetRecord
+
+# Relative output length of the prompt versions, only used until there is latency history.
+_DEFAULT_PROMPT_VERSION_WEIGHTS = {"DIRECT": 1.0, "EXPERT": 2.0, "COT": 4.0}
+# Past samples a running average weighs at most, so the history follows a provider that gets faster or slower.
+_MAX_AVERAGE_WEIGHT = 200
+
+def prompt_chars(record: DatasetRecord) -> int:
+    return len(record.instruction or "") + len(record.question or "")
+
+@contextlib.contextmanager
+def _exclusive_file_lock(lock_path: str):
+    """Holds an exclusive lock on `lock_path` (created if missing) between processes on this host."""
+    with open(lock_path, "a+b") as f_lock:
+        if fcntl is not None:
+            fcntl.flock(f_lock.fileno(), fcntl.LOCK_EX)
+        else:
+            f_lock.seek(0)
+            msvcrt.locking(f_lock.fileno(), msvcrt.LK_LOCK, 1) # Retries for ~10s, then raises OSError
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f_lock.fileno(), fcntl.LOCK_UN)
+            else:
+                f_lock.seek(0)
+                msvcrt.locking(f_lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _merge_average(average: List[float], samples: int, mean_seconds: float, mean_chars: float) -> List[float]:
+    """`average` after `samples` more samples with these means, as if record() had been called for each of them."""
+    old_samples, old_mean_seconds, old_mean_chars = average
+    weight = min(1.0, samples / min(old_samples + samples, _MAX_AVERAGE_WEIGHT))
+    return [old_samples + samples, old_mean_seconds + (mean_seconds - old_mean_seconds) * weight, old_mean_chars + (mean_chars - old_mean_chars) * weight]
+
+class LatencyHistory:
+    """Running averages of worker latency and prompt length per (model, prompt, dataset, scenario) and per (model, prompt)."""
+    def __init__(self, history_path: str):
+        self.history_path = history_path
+        self.averages: Dict[str, List[float]] = self._read() # key -> [samples, mean seconds, mean prompt chars]
+        self.unsaved: Dict[str, List[float]] = {} # key -> [samples, mean seconds, mean prompt chars] recorded since the last save
+
+    def _read(self) -> Dict[str, List[float]]:
+        if not os.path.exists(self.history_path): return {}
+        try:
+            with open(self.history_path, "r", encoding="utf-8") as f_history:
+                return json.load(f_history)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"WARNING: Could not read the latency history '{self.history_path}' ({e}); ordering by prompt length until new history is collected.")
+            return {}
+
+    @staticmethod
+    def _keys(worker_model_id: str, prompt_version: str, dataset_short_name: str, scenario_code: Any) -> Tuple[str, str]:
+        return f"{worker_model_id}|{prompt_version}|{dataset_short_name}|{scenario_code}", f"{worker_model_id}|{prompt_version}"
+
+    def record(self, worker_model_id: str, prompt_version: str, dataset_short_name: str, scenario_code: Any, chars: int, seconds: float):
+        for key in self._keys(worker_model_id, prompt_version, dataset_short_name, scenario_code):
+            samples, mean_seconds, mean_chars = self.averages.get(key, (0, 0.0, 0.0))
+            weight = 1.0 / min(samples + 1, _MAX_AVERAGE_WEIGHT)
+            self.averages[key] = [samples + 1, mean_seconds + (seconds - mean_seconds) * weight, mean_chars + (chars - mean_chars) * weight]
+            unsaved_samples, unsaved_seconds, unsaved_chars = self.unsaved.get(key, (0, 0.0, 0.0))
+            self.unsaved[key] = [unsaved_samples + 1, unsaved_seconds + (seconds - unsaved_seconds) / (unsaved_samples + 1),
+                                 unsaved_chars + (chars - unsaved_chars) / (unsaved_samples + 1)]
+
+    def predicted_seconds(self, worker_model_id: str, prompt_version: str, dataset_short_name: str, record: DatasetRecord) -> float:
+        scenario_key, model_prompt_key = self._keys(worker_model_id, prompt_version, dataset_short_name, record.scenario_code)
+        chars = prompt_chars(record)
+        samples, mean_seconds, _ = self.averages.get(scenario_key, (0, 0.0, 0.0))
+        if samples >= APP_CONFIG.WORK_ORDER_MIN_SAMPLES: return mean_seconds
+        samples, mean_seconds, mean_chars = self.averages.get(model_prompt_key, (0, 0.0, 0.0))
+        if samples >= APP_CONFIG.WORK_ORDER_MIN_SAMPLES: return mean_seconds * chars / max(1.0, mean_chars)
+        return chars / 1000 * _DEFAULT_PROMPT_VERSION_WEIGHTS.get(prompt_version, 1.0)
+
+    def longest_first(self, records: List[DatasetRecord], worker_model_id: str, prompt_version: str,
+                      dataset_short_name: str) -> List[Tuple[float, DatasetRecord]]:
+        """(predicted seconds, record) pairs, slowest first; incomplete records (no API call) cost nothing."""
+        costed = [(self.predicted_seconds(worker_model_id, prompt_version, dataset_short_name, record) if record.is_complete else 0.0, record)
+                  for record in records]
+        costed.sort(key=lambda pair: pair[0], reverse=True)
+        return costed
+
+    def save(self):
+        """Merges the samples recorded since the last save into the history file, which other processes may have saved to meanwhile."""
+        if not self.unsaved: return
+        if os.path.dirname(self.history_path): os.makedirs(os.path.dirname(self.history_path), exist_ok=True)
+        with _exclusive_file_lock(self.history_path + ".lock"):
+            averages = self._read()
+            for key, (samples, mean_seconds, mean_chars) in self.unsaved.items():
+                averages[key] = _merge_average(averages.get(key, [0, 0.0, 0.0]), samples, mean_seconds, mean_chars)
+            with open(self.history_path + ".tmp", "w", encoding="utf-8") as f_history:
+                json.dump(averages, f_history, ensure_ascii=False)
+            os.replace(self.history_path + ".tmp", self.history_path)
+        self.averages = averages
+        self.unsaved = {}
+
+_LATENCY_HISTORY: Optional[LatencyHistory] = None
+
+def get_latency_history() -> Optional[LatencyHistory]:
+    """The run's latency history, loaded on first use. None when WORK_ORDERING is "file"."""
+    global _LATENCY_HISTORY
+    if APP_CONFIG.WORK_ORDERING != "longest_first": return None
+    if _LATENCY_HISTORY is None: _LATENCY_HISTORY = LatencyHistory(APP_CONFIG.WORK_ORDER_HISTORY_PATH)
+    return _LATENCY_HISTORY